@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 from pathlib import Path
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -20,13 +22,26 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/3.2/howto/deployment/checklist/
 
-# SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-=fe^o!7exxof4td5izqcyl-fyx9dr4#+p-#w=$u)+^yl&_g*+@'
-
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = []
+# SECURITY WARNING: keep the secret key used in production secret!
+# DJANGO_SECRET_KEY is required once DEBUG is off
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', '')
+if not SECRET_KEY:
+    if not DEBUG:
+        raise ImproperlyConfigured(
+            'DJANGO_SECRET_KEY must be set when DEBUG is off.'
+        )
+    SECRET_KEY = (
+        'django-insecure-=fe^o!7exxof4td5izqcyl-fyx9dr4#+p-#w=$u)+^yl&_g*+@'
+    )
+
+# Comma separated, required once DEBUG is off
+ALLOWED_HOSTS = [
+    host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',')
+    if host
+]
 
 
 # Application definition
@@ -38,6 +53,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     "core",
     "rest_framework",
     "rest_framework.authtoken",
@@ -46,6 +62,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +74,10 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'app.urls'
 
+# Serve recepie list, retrieve and create with async views, for ASGI
+# servers (gunicorn.conf.py turns this on with SERVER_INTERFACE=asgi)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -79,16 +100,61 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Connections are kept for DB_CONN_MAX_AGE seconds (0 closes them after
+# every request, as the development server needs) and, with health checks
+# on, pinged at the start of each request so a dropped one is replaced.
+# With DB_POOL_SIZE above 0 each process instead shares a pool of at most
+# that many connections between its threads, handed back after every
+# request. Set DB_PGBOUNCER when connecting through pgbouncer in
+# transaction pooling mode, which cannot keep server-side cursors open
+# (exports then read all their rows at once).
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': (
+            'core.backends.postgresql_pool' if DB_POOL_SIZE
+            else 'django.db.backends.postgresql'
+        ),
         'HOST': os.environ.get('DB_HOST'),
+        'PORT': os.environ.get('DB_PORT', ''),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
-        'PASSWORD': os.environ.get('DB_PASS')
+        'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': (
+            0 if DB_POOL_SIZE
+            else int(os.environ.get('DB_CONN_MAX_AGE', 0))
+        ),
+        # Not a Django 3.2 setting: core.signals.check_connections and the
+        # pooled backend implement it, the way Django 4.1 does
+        'CONN_HEALTH_CHECKS': os.environ.get(
+            'DB_CONN_HEALTH_CHECKS', '1'
+        ) == '1',
+        'POOL_SIZE': DB_POOL_SIZE,
+        'POOL_TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.environ.get('DB_PGBOUNCER', '0') == '1'
+        ),
     }
 }
 
+# The replica connects to DB_REPLICA_HOST, DB_REPLICA_PORT and
+# DB_REPLICA_NAME, each defaulting to the primary's, with the primary's
+# other settings. Safe requests read from it only when one of these is
+# set; tests use the primary's test database for it.
+DB_REPLICA_HOST = os.environ.get('DB_REPLICA_HOST')
+DB_REPLICA_NAME = os.environ.get('DB_REPLICA_NAME')
+
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'HOST': DB_REPLICA_HOST or DATABASES['default']['HOST'],
+    'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+    'NAME': DB_REPLICA_NAME or DATABASES['default']['NAME'],
+    'TEST': {'MIRROR': 'default'},
+}
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -130,11 +196,119 @@ STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 
 MEDIA_ROOT = "/vol/web/media"
+
 STATIC_ROOT = "/vol/web/static"
 
+# Uploaded recepie images are re-encoded and resized by a pool of
+# RECEPIE_IMAGE_WORKERS processes, or inline when RECEPIE_IMAGE_PROCESSING
+# is "sync". Uploads larger than RECEPIE_IMAGE_MAX_SIZE bytes are rejected.
+# Sizes are the longest edge of each thumbnail in pixels.
+RECEPIE_IMAGE_PROCESSING = os.environ.get(
+    "RECEPIE_IMAGE_PROCESSING",
+    "process",
+)
+RECEPIE_IMAGE_WORKERS = int(os.environ.get("RECEPIE_IMAGE_WORKERS", 2))
+RECEPIE_IMAGE_MAX_SIZE = int(
+    os.environ.get("RECEPIE_IMAGE_MAX_SIZE", 20 * 1024 * 1024)
+)
+RECEPIE_IMAGE_SIZES = {
+    "small": 150,
+    "medium": 400,
+    "large": 1024,
+}
+
+# Recepie images under MEDIA_URL are served by recepie.media.serve_image.
+# Set RECEPIE_MEDIA_SENDFILE to "x-accel-redirect" (nginx, with an internal
+# location at RECEPIE_MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT) or to
+# "x-sendfile" (Apache mod_xsendfile, lighttpd) to let the front server
+# send the bytes. Immutable images are cached for RECEPIE_MEDIA_MAX_AGE.
+RECEPIE_MEDIA_SENDFILE = os.environ.get("RECEPIE_MEDIA_SENDFILE", "")
+RECEPIE_MEDIA_ACCEL_PREFIX = os.environ.get(
+    "RECEPIE_MEDIA_ACCEL_PREFIX",
+    "/protected-media/",
+)
+RECEPIE_MEDIA_MAX_AGE = int(os.environ.get("RECEPIE_MEDIA_MAX_AGE", 31536000))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "core.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "core.parsers.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+}
+
+# JSON backend of the API renderer and parser: "auto" uses orjson when it
+# is installed, "orjson" requires it and "json" uses the standard library
+JSON_BACKEND = os.environ.get("JSON_BACKEND", "auto")
+# Stream paginated lists with at least this many results, 0 disables
+JSON_STREAM_MIN_ITEMS = int(os.environ.get("JSON_STREAM_MIN_ITEMS", 500))
+
+# Token authentication cache: a per-process LRU of MAXSIZE entries that
+# expire after TTL seconds, optionally backed by the CACHES alias named in
+# CACHE_ALIAS so lookups are shared between workers and invalidated in
+# all of them. Without CACHE_ALIAS, and with DEBUG off, entries expire
+# after LOCAL_TTL seconds instead, as deleted tokens and deactivated
+# users keep authenticating on other workers until then.
+TOKEN_AUTH_CACHE = {
+    "MAXSIZE": int(os.environ.get("TOKEN_AUTH_CACHE_MAXSIZE", 10000)),
+    "TTL": int(os.environ.get("TOKEN_AUTH_CACHE_TTL", 60)),
+    "LOCAL_TTL": int(os.environ.get("TOKEN_AUTH_CACHE_LOCAL_TTL", 5)),
+    "CACHE_ALIAS": os.environ.get("TOKEN_AUTH_CACHE_ALIAS") or None,
+}
+
+# Replica reads: the alias safe requests read from (None keeps them on
+# the primary), and how many seconds a user's reads stay on the primary
+# after they write, pinned in the CACHES alias CACHE_ALIAS.
+REPLICA_ROUTING = {
+    "ALIAS": "replica" if DB_REPLICA_HOST or DB_REPLICA_NAME else None,
+    "PIN_SECONDS": int(os.environ.get("REPLICA_PIN_SECONDS", 5)),
+    "CACHE_ALIAS": os.environ.get("REPLICA_PIN_CACHE_ALIAS", "default"),
+}
+
+# Request instrumentation: the fraction of requests to record (0 turns it
+# off), how often one statement may run in a request before it is logged
+# as an N+1, and the bearer token scrapes of /metrics must send. Without a
+# token /metrics is only served with DEBUG on.
+INSTRUMENTATION = {
+    "SAMPLE_RATE": float(os.environ.get("INSTRUMENTATION_SAMPLE_RATE", 0)),
+    "DUPLICATE_QUERY_THRESHOLD": int(
+        os.environ.get("INSTRUMENTATION_DUPLICATE_QUERY_THRESHOLD", 5)
+    ),
+    "METRICS_TOKEN": os.environ.get("INSTRUMENTATION_METRICS_TOKEN", ""),
+}
+
+# Seconds to cache per-user tag and ingredient recepie counts and recepie
+# facets, 0 disables
+RECEPIE_ATTR_COUNTS_CACHE_TIMEOUT = int(
+    os.environ.get("RECEPIE_ATTR_COUNTS_CACHE_TIMEOUT", 0)
+)
+RECEPIE_FACETS_CACHE_TIMEOUT = int(
+    os.environ.get("RECEPIE_FACETS_CACHE_TIMEOUT", 0)
+)
+
+# Seconds to cache rendered recepie, tag and ingredient read responses per
+# user and collection version in the RECEPIE_RESPONSE_CACHE_ALIAS cache,
+# 0 disables
+RECEPIE_RESPONSE_CACHE_TIMEOUT = int(
+    os.environ.get("RECEPIE_RESPONSE_CACHE_TIMEOUT", 0)
+)
+RECEPIE_RESPONSE_CACHE_ALIAS = os.environ.get(
+    "RECEPIE_RESPONSE_CACHE_ALIAS",
+    "default",
+)
+
+# Recepies read from the database cursor and rendered at a time by exports
+RECEPIE_EXPORT_CHUNK_SIZE = int(
+    os.environ.get("RECEPIE_EXPORT_CHUNK_SIZE", 2000)
+)
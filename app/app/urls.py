@@ -16,11 +16,19 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from django.urls.conf import include
-from django.conf.urls.static import static
 from django.conf import settings
 
+from core.instrumentation import metrics_view
+from recepie.media import serve_image
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/user/', include("user.urls")),
     path("api/recepie/", include("recepie.urls")),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path("metrics", metrics_view, name="metrics"),
+    path(
+        f"{settings.MEDIA_URL.lstrip('/')}<path:path>",
+        serve_image,
+        name="media",
+    ),
+]
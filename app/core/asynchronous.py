@@ -0,0 +1,37 @@
+"""Running blocking database work from async views
+
+Under ASGI, Django runs sync views and middleware in one thread shared by
+all requests (`thread_sensitive=True`), so only one of them runs at a
+time. `database_sync_to_async()` runs work in the event loop's default
+executor instead, where calls from concurrent requests run side by side.
+At most that executor's number of threads run at once, min(32, CPUs + 4)
+by default, and each keeps its own database connection, or takes one
+from the pool with DB_POOL_SIZE.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from . import signals
+
+
+def database_sync_to_async(func):
+    """Return an awaitable running func in a worker thread
+
+    Connections past CONN_MAX_AGE or in error are closed before and after
+    each call, as Django does around every request, so worker threads
+    keep no stale connections and pooled ones go back to their pool. Kept
+    connections are health checked before each call like they are when a
+    request starts, which only covers Django's own thread under ASGI.
+    """
+    @wraps(func)
+    def run(*args, **kwargs):
+        close_old_connections()
+        signals.check_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
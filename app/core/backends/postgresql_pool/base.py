@@ -0,0 +1,146 @@
+"""PostgreSQL backend drawing connections from a pool in the process
+
+Django opens a connection the first time a thread uses the database and,
+with CONN_MAX_AGE at 0, closes it at the end of each request. This
+backend takes connections from a pool shared by the threads of a process
+instead, and closing one puts it back, rolled back to an idle state. At
+most POOL_SIZE connections are open per alias and process. A thread
+waits up to POOL_TIMEOUT seconds for one to be free, then gets an
+OperationalError.
+
+With CONN_HEALTH_CHECKS, idle connections are pinged before they are
+handed out again, and ones the server has dropped are replaced.
+"""
+import os
+import threading
+from collections import deque
+
+from django.db.backends.postgresql import base, creation
+from django.db.utils import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+Database = base.Database
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """A bounded set of open connections shared by a process's threads"""
+
+    def __init__(self, size, timeout, health_checks):
+        self.size = size
+        self.timeout = timeout
+        self.health_checks = health_checks
+        self.idle = deque()
+        self.slots = threading.BoundedSemaphore(size)
+        self.opened = 0
+
+    def get(self, connect):
+        """Return an idle connection, or one from connect() if none is"""
+        if not self.slots.acquire(timeout=self.timeout):
+            raise OperationalError(
+                f"No pooled connection was free within {self.timeout}s."
+            )
+        try:
+            while True:
+                try:
+                    connection = self.idle.pop()
+                except IndexError:
+                    self.opened += 1
+                    return connect()
+                if self.is_usable(connection):
+                    return connection
+                connection.close()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def put(self, connection, discard=False):
+        """Return a connection to the pool, or close it when discarded"""
+        try:
+            if discard or connection.closed:
+                connection.close()
+            else:
+                self.idle.append(connection)
+        finally:
+            self.slots.release()
+
+    def is_usable(self, connection) -> bool:
+        if connection.closed:
+            return False
+        if not self.health_checks:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        except Database.Error:
+            return False
+        return True
+
+    def close(self):
+        """Close the idle connections"""
+        while self.idle:
+            self.idle.pop().close()
+
+
+def get_pool(settings_dict) -> ConnectionPool:
+    """Return the pool of a database, created on first use
+
+    Pools belong to the process that created them. A forked child gets
+    pools of its own and never touches, or closes, its parent's sockets.
+    """
+    key = (os.getpid(), settings_dict["HOST"], settings_dict["PORT"],
+           settings_dict["NAME"], settings_dict["USER"])
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                size=settings_dict.get("POOL_SIZE", 10),
+                timeout=settings_dict.get("POOL_TIMEOUT", 10),
+                health_checks=settings_dict.get("CONN_HEALTH_CHECKS", False),
+            )
+    return pool
+
+
+def close_pools(name):
+    """Close the idle connections this process keeps to a database"""
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items()
+                 if key[0] == os.getpid() and key[3] == name]
+    for pool in pools:
+        pool.close()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections would keep the database from being dropped
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, conn_params):
+        return get_pool(self.settings_dict).get(
+            lambda: super(DatabaseWrapper, self).get_new_connection(
+                conn_params
+            )
+        )
+
+    def _close(self):
+        if self.connection is None:
+            return
+        connection = self.connection
+        # Django holds on to a connection closed inside atomic() until the
+        # block exits, so that one is closed for good
+        discard = self.in_atomic_block or bool(connection.closed)
+        if not discard and (
+            connection.get_transaction_status() != TRANSACTION_STATUS_IDLE
+        ):
+            try:
+                connection.rollback()
+            except Database.Error:
+                discard = True
+        get_pool(self.settings_dict).put(connection, discard=discard)
@@ -0,0 +1,10 @@
+"""Helpers shared by the benchmark commands and the tests built on them"""
+import os
+
+MB = 1024 * 1024
+
+
+def current_rss() -> int:
+    """Return the resident set size of this process in bytes"""
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
@@ -0,0 +1,392 @@
+"""Per-request query, SQL, serializer and render timing
+
+`InstrumentationMiddleware` records a sample of requests, chosen with
+probability INSTRUMENTATION["SAMPLE_RATE"]. For each one it counts the
+queries on every database connection and times them, and times
+serialization in `timed("serialize")` blocks and the rendering of the
+response. Sampled responses get a `Server-Timing` header, and the
+measurements feed histograms per view and action. These are served in
+the Prometheus text format by `metrics_view`, along with the counters of
+the token authentication cache. Both are kept per process, so every
+worker is scraped on its own.
+
+Serializer time includes any queries serializers trigger. A statement
+run at least DUPLICATE_QUERY_THRESHOLD times in one request is logged as
+a likely N+1 and counted per view.
+
+Queries are recorded by an execute wrapper every connection gets when
+it opens, so those run in other threads for an async request, which see
+its context, are counted as well.
+
+Requests that are not sampled only pay for a random number, and
+`timed()` blocks and queries outside a sampled request for one context
+variable lookup.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_safe
+
+from user.authentication import token_cache
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("sql", "serialize", "render")
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+_recorder = ContextVar("instrumentation_recorder", default=None)
+_not_recording = nullcontext()
+
+
+def get_settings() -> dict:
+    """Return the instrumentation settings merged over their defaults"""
+    options = {
+        "SAMPLE_RATE": 0.0,
+        "DUPLICATE_QUERY_THRESHOLD": 5,
+        "METRICS_TOKEN": "",
+    }
+    options.update(getattr(settings, "INSTRUMENTATION", {}))
+    return options
+
+
+def timed(phase):
+    """Return a context manager adding its duration to a phase
+
+    Nested blocks of the same phase are only counted once.
+    """
+    recorder = _recorder.get()
+    if recorder is None:
+        return _not_recording
+    return recorder.time(phase)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper passing queries to the request's recorder, if any"""
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection):
+    """Make a database connection report its queries to the recorder"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class InstrumentedSerializerMixin:
+    """Time a serializer's representation and validation as serialize"""
+
+    def to_representation(self, instance):
+        with timed("serialize"):
+            return super().to_representation(instance)
+
+    def run_validation(self, *args, **kwargs):
+        with timed("serialize"):
+            return super().run_validation(*args, **kwargs)
+
+
+class Recorder:
+    """Measurements of one request, and a database execute wrapper"""
+
+    def __init__(self):
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.statements = Counter()
+        self.active = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations["sql"] += time.perf_counter() - start
+            self.statements[sql] += 1
+
+    def add(self, phase, seconds):
+        self.durations[phase] += seconds
+
+    @property
+    def queries(self) -> int:
+        return sum(self.statements.values())
+
+    @contextmanager
+    def time(self, phase):
+        if phase in self.active:
+            yield
+            return
+        self.active.add(phase)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+            self.active.discard(phase)
+
+    def get_duplicates(self, threshold) -> list:
+        """Return the (statement, count) pairs run threshold times or more"""
+        return [(sql, count) for sql, count in self.statements.most_common()
+                if count >= threshold]
+
+
+class Histogram:
+    """A Prometheus histogram with a series per set of label values"""
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts, total = self.series.get(labels, (None, 0))
+        if counts is None:
+            counts = [0] * (len(self.buckets) + 1)
+        counts[bisect_left(self.buckets, value)] += 1
+        self.series[labels] = (counts, total + value)
+
+    def expose(self, label_names):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in sorted(self.series.items()):
+            label_text = format_labels(label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield (f'{self.name}_bucket{{{label_text},le="{bound}"}} '
+                       f"{cumulative}")
+            yield f"{self.name}_sum{{{label_text}}} {total}"
+            yield f"{self.name}_count{{{label_text}}} {cumulative}"
+
+
+class Metrics:
+    """Histograms and counters of the sampled requests of this process"""
+    label_names = ("view", "action")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {
+                "duration": Histogram(
+                    "api_request_duration_seconds",
+                    "Time to respond to a sampled request.",
+                    DURATION_BUCKETS,
+                ),
+                "queries": Histogram(
+                    "api_request_queries",
+                    "Database queries run by a sampled request.",
+                    QUERY_BUCKETS,
+                ),
+            }
+            for phase in PHASES:
+                self.histograms[phase] = Histogram(
+                    f"api_request_{phase}_duration_seconds",
+                    f"Time a sampled request spent in {phase}.",
+                    DURATION_BUCKETS,
+                )
+            self.duplicates = Counter()
+
+    def observe(self, labels, duration, recorder, duplicates):
+        with self._lock:
+            self.histograms["duration"].observe(labels, duration)
+            self.histograms["queries"].observe(labels, recorder.queries)
+            for phase, value in recorder.durations.items():
+                self.histograms[phase].observe(labels, value)
+            if duplicates:
+                self.duplicates[labels] += 1
+
+    def expose(self) -> str:
+        """Return the metrics in the Prometheus text format"""
+        with self._lock:
+            lines = []
+            for histogram in self.histograms.values():
+                lines.extend(histogram.expose(self.label_names))
+            name = "api_request_duplicate_queries_total"
+            lines.append(f"# HELP {name} Sampled requests that repeated "
+                         "a query.")
+            lines.append(f"# TYPE {name} counter")
+            for labels, count in sorted(self.duplicates.items()):
+                lines.append(
+                    f"{name}{{{format_labels(self.label_names, labels)}}} "
+                    f"{count}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+def expose_token_cache() -> str:
+    """Return the token authentication cache counters in the text format"""
+    stats = token_cache.stats()
+    lines = []
+    for name, kind, documentation, value in (
+        ("api_token_cache_hits_total", "counter",
+         "Token lookups answered by the cache.", stats["hits"]),
+        ("api_token_cache_misses_total", "counter",
+         "Token lookups that went to the database.", stats["misses"]),
+        ("api_token_cache_entries", "gauge",
+         "Tokens cached in this process.", stats["size"]),
+    ):
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def format_labels(names, values) -> str:
+    return ",".join(
+        f'{name}="{escape_label(value)}"' for name, value in zip(names, values)
+    )
+
+
+def escape_label(value) -> str:
+    return (str(value).replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n"))
+
+
+metrics = Metrics()
+
+
+def get_view_labels(view_func, method) -> tuple:
+    """Return the view and action a resolved view function is labelled by
+
+    Viewset actions are named after their method, like `upload_image`,
+    and other views by the request method.
+    """
+    view_class = getattr(view_func, "cls", None)
+    if view_class is None:
+        return view_func.__name__, method.lower()
+    actions = getattr(view_func, "actions", None) or {}
+    return view_class.__name__, actions.get(method.lower(), method.lower())
+
+
+class InstrumentationMiddleware:
+    """Record a sample of requests and add `Server-Timing` headers"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Tells Django to call us in async mode, as MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        recorder = self.start_recording(request)
+        if recorder is None:
+            return self.get_response(request)
+        token = _recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish_recording(
+            request, response, recorder, time.perf_counter() - start
+        )
+
+    async def __acall__(self, request):
+        recorder = self.start_recording(request)
+        if recorder is None:
+            return await self.get_response(request)
+        token = _recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish_recording(
+            request, response, recorder, time.perf_counter() - start
+        )
+
+    def start_recording(self, request):
+        """Return a recorder if the request is sampled, else None"""
+        rate = get_settings()["SAMPLE_RATE"]
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return None
+        request._instrumentation_labels = None
+        return Recorder()
+
+    def finish_recording(self, request, response, recorder, duration):
+        """Add the measurements to the metrics and the response"""
+        options = get_settings()
+        labels = request._instrumentation_labels
+        if labels is None:
+            return response
+        duplicates = recorder.get_duplicates(
+            options["DUPLICATE_QUERY_THRESHOLD"]
+        )
+        for sql, count in duplicates:
+            logger.warning(
+                "%s.%s ran the same query %d times: %s",
+                *labels, count, sql,
+            )
+        metrics.observe(labels, duration, recorder, duplicates)
+        response["Server-Timing"] = self.get_server_timing(
+            recorder, duration
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, "_instrumentation_labels"):
+            request._instrumentation_labels = get_view_labels(
+                view_func, request.method
+            )
+
+    def process_template_response(self, request, response):
+        """Time rendering, which happens right after this returns"""
+        recorder = _recorder.get()
+        if recorder is not None:
+            start = time.perf_counter()
+            response.add_post_render_callback(lambda response: recorder.add(
+                "render", time.perf_counter() - start
+            ))
+        return response
+
+    def get_server_timing(self, recorder, duration) -> str:
+        entries = [
+            f'sql;dur={recorder.durations["sql"] * 1000:.2f};'
+            f'desc="{recorder.queries} queries"',
+        ]
+        entries.extend(
+            f"{phase};dur={recorder.durations[phase] * 1000:.2f}"
+            for phase in PHASES[1:]
+        )
+        entries.append(f"total;dur={duration * 1000:.2f}")
+        return ", ".join(entries)
+
+
+@require_safe
+def metrics_view(request):
+    """Serve the metrics of this process in the Prometheus text format
+
+    With INSTRUMENTATION["METRICS_TOKEN"] set, scrapes must send it as a
+    bearer token. Without one, metrics are only served with DEBUG on.
+    """
+    expected = get_settings()["METRICS_TOKEN"]
+    if expected:
+        token = request.META.get("HTTP_AUTHORIZATION", "")
+        if not constant_time_compare(token, f"Bearer {expected}"):
+            return HttpResponse(status=401)
+    elif not settings.DEBUG:
+        return HttpResponse(status=404)
+    return HttpResponse(
+        metrics.expose() + expose_token_cache(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -0,0 +1,424 @@
+import io
+import json
+import math
+import multiprocessing
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import synthetic
+
+PASSWORD = "bench-password"
+SCENARIOS = (
+    "recepies-list",
+    "recepies-retrieve",
+    "recepies-create",
+    "tags-list",
+    "ingredients-list",
+    "token",
+    "upload-image",
+)
+# Metrics that fail the comparison with a baseline when they grow by more
+# than the tolerance. Query counts fail on any increase.
+COMPARED_METRICS = ("p50_ms", "p95_ms", "alloc_kb")
+
+
+def percentile(values, percent) -> float:
+    """Return the nearest-rank percentile of some values"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries it sees"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class ScenarioRunner:
+    """Send the requests of each scenario through the test client
+
+    Requests are made as one user, authenticated with their token the way
+    API clients are, and streamed responses are read to the end.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.recepie_ids = list(user.recepie_set.order_by("id").values_list(
+            "id", flat=True
+        )[:1000])
+        self.tag_ids = list(user.tag_set.order_by("id").values_list(
+            "id", flat=True
+        )[:3])
+        self.ingredient_ids = list(user.ingredient_set.order_by(
+            "id"
+        ).values_list("id", flat=True)[:6])
+        # Images are stored by content, so give every user their own to
+        # keep workers from waiting on each other's ImageBlob row
+        buffer = io.BytesIO()
+        colour = tuple(user.pk.to_bytes(3, "big"))
+        Image.new("RGB", (64, 64), colour).save(buffer, format="PNG")
+        self.image = buffer.getvalue()
+
+    def recepie_id(self, number):
+        return self.recepie_ids[number % len(self.recepie_ids)]
+
+    def send(self, scenario, number):
+        """Send the number-th request of a scenario"""
+        if scenario == "recepies-list":
+            return self.client.get(reverse("recepie:recepie-list"))
+        if scenario == "recepies-retrieve":
+            return self.client.get(reverse(
+                "recepie:recepie-detail", args=[self.recepie_id(number)]
+            ))
+        if scenario == "recepies-create":
+            return self.client.post(reverse("recepie:recepie-list"), {
+                "title": f"Bench recepie {number}",
+                "prep_time": 20,
+                "price": "7.50",
+                "tags": self.tag_ids,
+                "ingredients": self.ingredient_ids,
+            }, format="json")
+        if scenario == "tags-list":
+            return self.client.get(reverse("recepie:tag-list"))
+        if scenario == "ingredients-list":
+            return self.client.get(reverse("recepie:ingredient-list"))
+        if scenario == "token":
+            return self.client.post(reverse("user:token"), {
+                "email": self.user.email,
+                "password": PASSWORD,
+            })
+        if scenario == "upload-image":
+            image = io.BytesIO(self.image)
+            image.name = "bench.png"
+            return self.client.post(
+                reverse("recepie:recepie-upload-image",
+                        args=[self.recepie_id(number)]),
+                {"image": image},
+                format="multipart",
+            )
+        raise CommandError(f"Unknown scenario {scenario}.")
+
+    def request(self, scenario, number):
+        response = self.send(scenario, number)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        if response.status_code >= 300:
+            raise CommandError(
+                f"{scenario} answered {response.status_code}: "
+                f"{response.content[:200]!r}"
+            )
+
+    def run(self, scenarios, requests, warmup, allocations, barrier=None):
+        """Return the raw measurements of each scenario"""
+        results = {}
+        counter = QueryCounter()
+        for scenario in scenarios:
+            for number in range(warmup):
+                self.request(scenario, number)
+            if barrier is not None:
+                barrier.wait()
+
+            latencies, queries = [], []
+            started = time.monotonic()
+            for number in range(requests):
+                counter.count = 0
+                with connection.execute_wrapper(counter):
+                    start = time.perf_counter()
+                    self.request(scenario, number)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                queries.append(counter.count)
+            finished = time.monotonic()
+
+            allocated = []
+            if allocations:
+                tracemalloc.start()
+                for number in range(allocations):
+                    current, _ = tracemalloc.get_traced_memory()
+                    tracemalloc.reset_peak()
+                    self.request(scenario, number)
+                    allocated.append(tracemalloc.get_traced_memory()[1]
+                                     - current)
+                tracemalloc.stop()
+
+            results[scenario] = {
+                "latencies": latencies,
+                "queries": queries,
+                "allocations": allocated,
+                "started": started,
+                "finished": finished,
+            }
+        return results
+
+
+_barrier = None
+
+
+def _init_worker(barrier):
+    global _barrier
+    _barrier = barrier
+
+
+def run_worker(task):
+    """Run the scenarios as one user in a forked worker process
+
+    Writes are rolled back, and every worker has a user of their own, so
+    workers never wait on each other's row locks.
+    """
+    user_id, options = task
+    try:
+        with transaction.atomic():
+            runner = ScenarioRunner(get_user_model().objects.get(pk=user_id))
+            results = runner.run(barrier=_barrier, **options)
+            transaction.set_rollback(True)
+        return results
+    except BaseException:
+        # Release the workers waiting for this one at the barrier
+        _barrier.abort()
+        raise
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    """Django Command to benchmark the API on a synthetic dataset
+
+    Seeds users with tags, ingredients and recepies, then sends each
+    scenario's requests through the test client. That happens either in
+    this process, or in `--workers` forked processes at once, each as its
+    own user. Latency percentiles, queries per request, peak allocations
+    per request and throughput are reported and can be written to
+    `--output` as JSON. Given a `--baseline` from an earlier run, the
+    command fails when a scenario regressed by more than `--tolerance`.
+
+    In-process runs roll the dataset back. Worker processes cannot see
+    uncommitted rows, so with `--workers` the dataset is committed and the
+    seeded users are deleted afterwards. Uploaded images go to a temporary
+    MEDIA_ROOT.
+    """
+    help = "Benchmark the API endpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1)
+        parser.add_argument("--recepies", type=int, default=1000,
+                            help="Recepies per user")
+        parser.add_argument("--tags", type=int, default=50)
+        parser.add_argument("--ingredients", type=int, default=200)
+        parser.add_argument("--skew", type=float, default=1.0,
+                            help="Popularity skew of tags and ingredients")
+        parser.add_argument("--requests", type=int, default=50,
+                            help="Timed requests per scenario and worker")
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument("--allocations", type=int, default=5,
+                            help="Requests per scenario traced for memory")
+        parser.add_argument("--workers", type=int, default=0,
+                            help="Worker processes, 0 to run in-process")
+        parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+        parser.add_argument("--output", help="Write the results as JSON")
+        parser.add_argument("--baseline",
+                            help="Fail on regressions against these results")
+        parser.add_argument("--tolerance", type=float, default=0.25)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options["scenarios"].split(",")]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(
+                f"Unknown scenarios: {', '.join(sorted(unknown))}."
+            )
+        if options["recepies"] < 1:
+            raise CommandError("Scenarios need at least one recepie.")
+        workers = options["workers"]
+        if workers and "fork" not in multiprocessing.get_all_start_methods():
+            raise CommandError("Worker processes need fork().")
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as file:
+                baseline = json.load(file)
+
+        dataset = {
+            "users": max(options["users"], workers),
+            "recepies": options["recepies"],
+            "tags": options["tags"],
+            "ingredients": options["ingredients"],
+            "skew": options["skew"],
+        }
+        run_options = {
+            "scenarios": scenarios,
+            "requests": options["requests"],
+            "warmup": options["warmup"],
+            "allocations": options["allocations"],
+        }
+        # Like the test runner, serve "testserver" without DEBUG's query log
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root,
+            DEBUG=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        ):
+            if workers:
+                measurements = self.run_workers(
+                    dataset, options["seed"], run_options, workers
+                )
+            else:
+                measurements = self.run_in_process(
+                    dataset, options["seed"], run_options
+                )
+
+        results = {
+            "mode": "workers" if workers else "in-process",
+            "workers": workers,
+            "dataset": dataset,
+            "scenarios": {
+                scenario: self.summarize(
+                    [measurement[scenario] for measurement in measurements]
+                )
+                for scenario in scenarios
+            },
+        }
+        for scenario, summary in results["scenarios"].items():
+            self.report(scenario, summary)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(results, file, indent=2)
+                file.write("\n")
+        if baseline is not None:
+            regressions = self.compare(results, baseline,
+                                       options["tolerance"])
+            if regressions:
+                raise CommandError(
+                    "Regressions against the baseline:\n"
+                    + "\n".join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS(
+                "No regressions against the baseline"
+            ))
+
+    def seed(self, dataset, random_seed):
+        """Seed the dataset and give its users a password and a token"""
+        self.stdout.write("Seeding synthetic dataset...")
+        users = synthetic.seed(
+            users=dataset["users"],
+            tags=dataset["tags"],
+            ingredients=dataset["ingredients"],
+            recepies=dataset["recepies"],
+            random_seed=random_seed,
+            skew=dataset["skew"],
+        )
+        get_user_model().objects.filter(
+            pk__in=[user.pk for user in users]
+        ).update(password=make_password(PASSWORD))
+        for user in users:
+            Token.objects.get_or_create(user=user)
+        synthetic.analyze()
+        return users
+
+    def run_in_process(self, dataset, random_seed, run_options):
+        with transaction.atomic():
+            users = self.seed(dataset, random_seed)
+            user = get_user_model().objects.get(pk=users[0].pk)
+            measurement = ScenarioRunner(user).run(**run_options)
+            transaction.set_rollback(True)
+        return [measurement]
+
+    def run_workers(self, dataset, random_seed, run_options, workers):
+        users = self.seed(dataset, random_seed)
+        try:
+            # Forked workers must open connections of their own
+            connections.close_all()
+            context = multiprocessing.get_context("fork")
+            barrier = context.Barrier(workers)
+            with context.Pool(workers, initializer=_init_worker,
+                              initargs=(barrier,)) as pool:
+                return pool.map(run_worker, [
+                    (user.pk, run_options) for user in users[:workers]
+                ])
+        finally:
+            get_user_model().objects.filter(
+                pk__in=[user.pk for user in users]
+            ).delete()
+
+    def summarize(self, measurements) -> dict:
+        """Combine the measurements of a scenario from every worker"""
+        latencies = [value for measurement in measurements
+                     for value in measurement["latencies"]]
+        queries = [value for measurement in measurements
+                   for value in measurement["queries"]]
+        allocations = [value for measurement in measurements
+                       for value in measurement["allocations"]]
+        elapsed = (max(m["finished"] for m in measurements)
+                   - min(m["started"] for m in measurements))
+        return {
+            "requests": len(latencies),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(statistics.mean(latencies), 3),
+            "queries": max(queries),
+            "mean_queries": round(statistics.mean(queries), 2),
+            "alloc_kb": (round(statistics.median(allocations) / 1024, 1)
+                         if allocations else None),
+            "rps": round(len(latencies) / max(elapsed, 1e-9), 1),
+        }
+
+    def report(self, scenario, summary):
+        alloc = summary["alloc_kb"]
+        self.stdout.write(
+            f"{scenario:<18} p50={summary['p50_ms']:8.2f} ms "
+            f"p95={summary['p95_ms']:8.2f} ms "
+            f"p99={summary['p99_ms']:8.2f} ms "
+            f"queries={summary['queries']:<3} "
+            f"alloc={'-' if alloc is None else f'{alloc:.1f}':>8} KB "
+            f"rps={summary['rps']:8.1f}"
+        )
+
+    def compare(self, results, baseline, tolerance) -> list:
+        """Return the regressions of the results against a baseline"""
+        for key in ("mode", "workers", "dataset"):
+            if baseline.get(key) != results[key]:
+                raise CommandError(
+                    f"The baseline was recorded with {key} "
+                    f"{baseline.get(key)!r}, not {results[key]!r}."
+                )
+        regressions = []
+        for scenario, summary in results["scenarios"].items():
+            previous = baseline["scenarios"].get(scenario)
+            if previous is None:
+                continue
+            if summary["queries"] > previous["queries"]:
+                regressions.append(
+                    f"{scenario} queries: {previous['queries']} -> "
+                    f"{summary['queries']}"
+                )
+            for metric in COMPARED_METRICS:
+                if summary[metric] is None or not previous.get(metric):
+                    continue
+                if summary[metric] > previous[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"{scenario} {metric}: {previous[metric]} -> "
+                        f"{summary[metric]}"
+                    )
+        return regressions
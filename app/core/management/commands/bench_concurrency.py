@@ -0,0 +1,283 @@
+import asyncio
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from core import synthetic
+
+from .bench_api import percentile
+
+# Environment of the gunicorn server of each mode, see gunicorn.conf.py
+MODES = {
+    "sync": {"SERVER_INTERFACE": "wsgi", "ASYNC_VIEWS": "0"},
+    "asgi-sync": {"SERVER_INTERFACE": "asgi", "ASYNC_VIEWS": "0"},
+    "asgi": {"SERVER_INTERFACE": "asgi", "ASYNC_VIEWS": "1"},
+}
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_process_tree(pid) -> list:
+    """Return a process and its descendants' pids, read from /proc"""
+    children = {}
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        parent = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(parent, []).append(int(entry.name))
+    pids, pending = [], [pid]
+    while pending:
+        pid = pending.pop()
+        pids.append(pid)
+        pending.extend(children.get(pid, ()))
+    return pids
+
+
+def get_usage(pid) -> tuple:
+    """Return the resident MiB and threads of a process tree"""
+    rss = threads = 0
+    for child in get_process_tree(pid):
+        try:
+            status = Path(f"/proc/{child}/status").read_text()
+        except OSError:
+            continue
+        for line in status.splitlines():
+            if line.startswith("VmRSS:"):
+                rss += int(line.split()[1])
+            elif line.startswith("Threads:"):
+                threads += int(line.split()[1])
+    return rss / 1024, threads
+
+
+class UsageSampler(threading.Thread):
+    """Record the peak memory and threads of a process tree"""
+
+    def __init__(self, pid, interval=0.1):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = self.peak_threads = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            rss, threads = get_usage(self.pid)
+            self.peak_rss = max(self.peak_rss, rss)
+            self.peak_threads = max(self.peak_threads, threads)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Command(BaseCommand):
+    """Django Command to compare sync and async serving under many clients
+
+    Starts a gunicorn server for each mode: sync WSGI workers with
+    threads, ASGI workers running the sync views, and ASGI workers with
+    the async recepie views. `--clients` clients then send authenticated
+    recepie list requests, each over a new connection and sending its
+    header lines spread over `--delay` seconds, as slow clients on poor
+    networks do. Clients start at random within the first `--ramp`
+    seconds. Reported are throughput, latency, failed requests and the
+    peak memory and threads of the server's processes, read from /proc,
+    so this runs on Linux only.
+
+    The dataset is committed for the servers to read, and its user is
+    deleted afterwards.
+    """
+    help = "Benchmark sync and async workers under concurrent slow clients"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=1000)
+        parser.add_argument("--rounds", type=int, default=1,
+                            help="Requests each client sends in turn")
+        parser.add_argument("--delay", type=float, default=0.5,
+                            help="Seconds a client takes to send a request")
+        parser.add_argument("--ramp", type=float, default=1.0,
+                            help="Seconds over which the clients start")
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--threads", type=int, default=8,
+                            help="Threads of each sync worker")
+        parser.add_argument("--timeout", type=float, default=60)
+        parser.add_argument("--modes", default=",".join(MODES))
+        parser.add_argument("--recepies", type=int, default=50)
+
+    def handle(self, *args, **options):
+        if not sys.platform.startswith("linux"):
+            raise CommandError("Process usage is read from /proc.")
+        modes = [mode.strip() for mode in options["modes"].split(",")]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}.")
+
+        user = synthetic.seed(users=1, recepies=options["recepies"])[0]
+        token = Token.objects.create(user=user)
+        try:
+            for mode in modes:
+                self.report(mode, options["clients"], *self.run_mode(
+                    mode, token.key, options,
+                ))
+        finally:
+            get_user_model().objects.filter(pk=user.pk).delete()
+
+    def get_environ(self, mode, port, options) -> dict:
+        database = connection.settings_dict
+        return {
+            **os.environ,
+            **MODES[mode],
+            "DB_HOST": database["HOST"] or "",
+            "DB_PORT": str(database["PORT"] or ""),
+            "DB_NAME": database["NAME"],
+            "DB_USER": database["USER"] or "",
+            "DB_PASS": database["PASSWORD"] or "",
+            "DJANGO_DEBUG": "0",
+            "DJANGO_SECRET_KEY": settings.SECRET_KEY,
+            "DJANGO_ALLOWED_HOSTS": "127.0.0.1",
+            "GUNICORN_BIND": f"127.0.0.1:{port}",
+            "WEB_CONCURRENCY": str(options["workers"]),
+            "GUNICORN_THREADS": str(options["threads"]),
+            "GUNICORN_TIMEOUT": str(int(options["timeout"])),
+            "GUNICORN_MAX_REQUESTS": "0",
+        }
+
+    def run_mode(self, mode, token, options):
+        """Serve one mode and run the clients against it"""
+        port = get_free_port()
+        with tempfile.TemporaryFile() as log:
+            server = subprocess.Popen(
+                [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+                 "--access-logfile", "/dev/null"],
+                cwd=settings.BASE_DIR,
+                env=self.get_environ(mode, port, options),
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+            try:
+                request = self.get_request(token)
+                if not asyncio.run(self.wait_until_serving(
+                    server, port, request, options["timeout"],
+                )):
+                    log.seek(0)
+                    raise CommandError(
+                        f"The {mode} server did not start:\n"
+                        + log.read().decode(errors="replace")[-2000:]
+                    )
+                sampler = UsageSampler(server.pid)
+                sampler.start()
+                try:
+                    start = time.perf_counter()
+                    results = asyncio.run(self.run_clients(
+                        port, request, options,
+                    ))
+                    elapsed = time.perf_counter() - start
+                finally:
+                    sampler.stop()
+            finally:
+                server.send_signal(signal.SIGTERM)
+                try:
+                    server.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+                    server.wait()
+        return results, elapsed, sampler.peak_rss, sampler.peak_threads
+
+    def get_request(self, token) -> bytes:
+        return (
+            f"GET {reverse('recepie:recepie-list')} HTTP/1.1\r\n"
+            "Host: 127.0.0.1\r\n"
+            f"Authorization: Token {token}\r\n"
+            "Accept: application/json\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode()
+
+    async def send(self, port, request, delay) -> int:
+        """Send a request line by line, returning the response status"""
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            lines = request.splitlines(keepends=True)
+            for index, line in enumerate(lines):
+                if index and delay:
+                    await asyncio.sleep(delay / (len(lines) - 1))
+                writer.write(line)
+                await writer.drain()
+            status_line = await reader.readline()
+            await reader.read()
+        finally:
+            writer.close()
+        return int(status_line.split()[1]) if status_line else 0
+
+    async def wait_until_serving(self, server, port, request, timeout):
+        """Return whether every worker answered a request in time"""
+        deadline = time.monotonic() + timeout
+        answered = 0
+        while time.monotonic() < deadline and server.poll() is None:
+            try:
+                status = await self.send(port, request, 0)
+            except OSError:
+                await asyncio.sleep(0.2)
+                continue
+            answered += status == 200
+            # Requests are spread over the workers, which load lazily
+            if answered >= 10:
+                return True
+        return False
+
+    async def run_clients(self, port, request, options) -> list:
+        """Return the (status, milliseconds) of every request sent"""
+        async def client():
+            await asyncio.sleep(random.uniform(0, options["ramp"]))
+            results = []
+            for _ in range(options["rounds"]):
+                start = time.perf_counter()
+                try:
+                    status = await asyncio.wait_for(
+                        self.send(port, request, options["delay"]),
+                        options["timeout"],
+                    )
+                except (OSError, asyncio.TimeoutError, ValueError):
+                    status = 0
+                results.append((status, (time.perf_counter() - start) * 1000))
+            return results
+
+        clients = await asyncio.gather(
+            *(client() for _ in range(options["clients"]))
+        )
+        return [result for results in clients for result in results]
+
+    def report(self, mode, clients, results, elapsed, rss, threads):
+        latencies = [ms for status, ms in results if status == 200]
+        failed = len(results) - len(latencies)
+        if not latencies:
+            raise CommandError(f"No request to the {mode} server succeeded.")
+        self.stdout.write(
+            f"{mode:<10} clients={clients:<5} "
+            f"rps={len(latencies) / elapsed:8.1f} "
+            f"p50={statistics.median(latencies):8.1f} ms "
+            f"p95={percentile(latencies, 95):8.1f} ms "
+            f"failed={failed:<4} rss={rss:7.1f} MiB threads={threads}"
+        )
@@ -0,0 +1,90 @@
+import io
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from rest_framework import parsers, renderers
+
+from core import synthetic
+from core.parsers import JSONParser
+from core.renderers import JSONRenderer, orjson
+
+
+class Command(BaseCommand):
+    """Django Command to compare DRF's JSON renderer with the API's
+
+    Encodes and decodes a page of recepie details shaped like the API
+    returns them, and the same page with raw `Decimal` prices, with DRF's
+    renderer and parser and with the API's on each available backend. No
+    database access is needed.
+    """
+    help = "Benchmark JSON rendering and parsing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        page = self.get_page(rng, options["items"], str)
+        decimal_page = self.get_page(rng, options["items"], None)
+
+        backends = ["json"] + (["orjson"] if orjson is not None else [])
+        for label, data in (("strings", page), ("decimals", decimal_page)):
+            expected = renderers.JSONRenderer().render(data)
+            self.report(f"{label} drf", expected, options["repeat"],
+                        renderers.JSONRenderer(), parsers.JSONParser(), data)
+            for backend in backends:
+                with override_settings(JSON_BACKEND=backend):
+                    body = JSONRenderer().render(data)
+                    if body != expected:
+                        self.stderr.write(f"{label} {backend}: output "
+                                          "differs from DRF")
+                    self.report(f"{label} {backend}", body,
+                                options["repeat"], JSONRenderer(),
+                                JSONParser(), data)
+
+    def get_page(self, rng, items, price_format):
+        """Return a paginated page of recepie details"""
+        results = []
+        for i in range(items):
+            price = Decimal(rng.randint(100, 99999)) / 100
+            results.append({
+                "id": i + 1,
+                "title": synthetic._name(rng, words=3),
+                "ingredients": [
+                    {"id": rng.randint(1, 1000),
+                     "name": synthetic._name(rng, words=1)}
+                    for _ in range(6)
+                ],
+                "tags": [
+                    {"id": rng.randint(1, 200), "name": synthetic._name(rng)}
+                    for _ in range(3)
+                ],
+                "prep_time": rng.randint(5, 180),
+                "price": price_format(price) if price_format else price,
+                "link": "",
+            })
+        return {"next": None, "previous": None, "results": results}
+
+    def report(self, label, body, repeat, renderer, parser, data):
+        encode = self.time(lambda: renderer.render(data), repeat)
+        decode = self.time(lambda: parser.parse(io.BytesIO(body)), repeat)
+        self.stdout.write(
+            f"{label:<18} bytes={len(body):<9} "
+            f"encode={encode:8.2f} ms decode={decode:8.2f} ms"
+        )
+
+    def time(self, run, repeat):
+        """Return the median milliseconds of a run"""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,147 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from core import synthetic
+from core.backends.postgresql_pool.base import close_pools
+
+from .bench_api import percentile
+
+POOL_ENGINE = "core.backends.postgresql_pool"
+MODES = {
+    "per-request": {
+        "ENGINE": "django.db.backends.postgresql",
+        "CONN_MAX_AGE": 0,
+    },
+    "persistent": {
+        "ENGINE": "django.db.backends.postgresql",
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+    },
+    "pool": {
+        "ENGINE": POOL_ENGINE,
+        "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": True,
+    },
+}
+
+
+class Command(BaseCommand):
+    """Django Command to compare ways of handling database connections
+
+    Sends authenticated recepie list requests through Django's WSGI
+    handler from `--threads` threads, the way a threaded worker of a
+    pre-fork server does, so connections are opened and closed around
+    each request as in production. Each mode runs with its own connection
+    settings: a new connection per request, persistent connections with
+    health checks, and the in-process pool. Reported are requests per
+    second, latency and the number of PostgreSQL sessions opened.
+
+    The dataset is committed, as every thread has its own connection, and
+    its user is deleted afterwards.
+    """
+    help = "Benchmark database connection handling"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--pool-size", type=int, default=None,
+                            help="Pool size, by default the threads")
+        parser.add_argument("--modes", default=",".join(MODES))
+        parser.add_argument("--recepies", type=int, default=100)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Connection modes need PostgreSQL.")
+        modes = [mode.strip() for mode in options["modes"].split(",")]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}.")
+
+        user = synthetic.seed(users=1, recepies=options["recepies"])[0]
+        token = Token.objects.create(user=user)
+        database = connections.databases[connection.alias]
+        original = dict(database)
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            ):
+                for mode in modes:
+                    database.update(MODES[mode])
+                    database["POOL_SIZE"] = (options["pool_size"]
+                                             or options["threads"])
+                    try:
+                        self.report(mode, options["threads"], *self.run(
+                            token.key, options["requests"],
+                            options["threads"],
+                        ))
+                    finally:
+                        database.clear()
+                        database.update(original)
+                        close_pools(database["NAME"])
+        finally:
+            get_user_model().objects.filter(pk=user.pk).delete()
+
+    def run(self, token, requests, threads):
+        """Send the requests, returning latencies, time and sessions"""
+        handler = WSGIHandler()
+        environ = RequestFactory()._base_environ(
+            PATH_INFO=reverse("recepie:recepie-list"),
+            REQUEST_METHOD="GET",
+            HTTP_AUTHORIZATION=f"Token {token}",
+        )
+        sessions = set()
+        lock = threading.Lock()
+
+        def record_session(sender, connection, **kwargs):
+            with lock:
+                sessions.add(connection.connection.get_backend_pid())
+
+        def request(_):
+            start = time.perf_counter()
+            response = handler(dict(environ), lambda status, headers: None)
+            try:
+                for _ in response:
+                    pass
+            finally:
+                response.close()
+            if response.status_code != 200:
+                raise CommandError(f"Request answered {response.status_code}.")
+            return (time.perf_counter() - start) * 1000
+
+        connection_created.connect(record_session)
+        try:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                start = time.perf_counter()
+                latencies = list(executor.map(request, range(requests)))
+                elapsed = time.perf_counter() - start
+                # Threads keep their connections, close them where they live
+                barrier = threading.Barrier(threads)
+                list(executor.map(
+                    lambda _: (barrier.wait(), connections.close_all()),
+                    range(threads),
+                ))
+        finally:
+            connection_created.disconnect(record_session)
+        return latencies, elapsed, len(sessions)
+
+    def report(self, mode, threads, latencies, elapsed, sessions):
+        self.stdout.write(
+            f"{mode:<12} threads={threads:<3} requests={len(latencies):<6} "
+            f"rps={len(latencies) / elapsed:8.1f} "
+            f"p50={statistics.median(latencies):7.2f} ms "
+            f"p95={percentile(latencies, 95):7.2f} ms "
+            f"sessions={sessions}"
+        )
@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core import synthetic
+from core.models import Ingredient, Recepie, Tag
+
+# Indexes added for the per-user list and reverse M2M lookups, dropped
+# inside the benchmark transaction to show the plans without them.
+INDEXES = (
+    "core_tag_user_name_id_idx",
+    "core_ingr_user_name_id_idx",
+    "core_recepie_user_id_idx",
+    "core_recepie_tags_tag_recepie_idx",
+    "core_recepie_ingr_ingr_recepie_idx",
+)
+
+
+class Command(BaseCommand):
+    """Django Command to compare query plans with and without the indexes
+
+    Seeds a synthetic dataset, explains the hot per-user queries with the
+    indexes in place and again after dropping them, then rolls everything
+    back so the database is left untouched.
+    """
+    help = "Explain the per-user queries before and after adding indexes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--tags", type=int, default=100)
+        parser.add_argument("--ingredients", type=int, default=500)
+        parser.add_argument("--recepies", type=int, default=20000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write("Seeding synthetic dataset...")
+            users = synthetic.seed(
+                users=options["users"],
+                tags=options["tags"],
+                ingredients=options["ingredients"],
+                recepies=options["recepies"],
+                random_seed=options["seed"],
+            )
+            synthetic.analyze()
+            queries = self.get_queries(users[0])
+
+            after = self.explain(queries)
+            with connection.cursor() as cursor:
+                for name in INDEXES:
+                    cursor.execute(f'DROP INDEX "{name}"')
+            synthetic.analyze()
+            before = self.explain(queries)
+
+            for label in queries:
+                self.stdout.write(self.style.MIGRATE_HEADING(label))
+                self.stdout.write("Before:")
+                self.stdout.write(before[label])
+                self.stdout.write("After:")
+                self.stdout.write(after[label])
+                self.stdout.write("")
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Rolled back benchmark data"))
+
+    def get_queries(self, user):
+        tag = Tag.objects.filter(user=user).first()
+        ingredient = Ingredient.objects.filter(user=user).first()
+        return {
+            "Tags by name": Tag.objects.filter(
+                user=user
+            ).order_by("-name", "-id")[:100],
+            "Ingredients by name": Ingredient.objects.filter(
+                user=user
+            ).order_by("-name", "-id")[:100],
+            "Recepies by id": Recepie.objects.filter(
+                user=user
+            ).order_by("id")[:100],
+            "Recepies with tag": Recepie.tags.through.objects.filter(
+                tag=tag
+            ).values_list("recepie_id"),
+            "Recepies with ingredient":
+                Recepie.ingredients.through.objects.filter(
+                    ingredient=ingredient
+                ).values_list("recepie_id"),
+        }
+
+    def explain(self, queries):
+        options = {}
+        if connection.vendor == "postgresql":
+            options = {"analyze": True, "buffers": True}
+        return {
+            label: queryset.explain(**options)
+            for label, queryset in queries.items()
+        }
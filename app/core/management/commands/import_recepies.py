@@ -0,0 +1,308 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from core.models import (
+    ImportCheckpoint,
+    Ingredient,
+    Recepie,
+    Tag,
+    normalize_name,
+)
+from core.renderers import orjson
+from recepie.conditional import collection_changed
+from recepie.export import SEPARATOR
+
+FIELDS = ("title", "prep_time", "price", "link")
+RELATED_FIELDS = {"ingredients": Ingredient, "tags": Tag}
+
+loads = orjson.loads if orjson is not None else json.loads
+
+
+class NameMap:
+    """Map the names of a user's tags or ingredients to their ids
+
+    Loaded once and kept in memory, keyed by the names as the database
+    lower cases them, so only names never seen before cost a query, and
+    those are created for a whole batch at once.
+    """
+
+    def __init__(self, model, user):
+        self.model = model
+        self.user = user
+        self.created = 0
+        self.keys = {}
+        self.ids = {}
+        for key, pk in model.objects.filter(user=user).annotate(
+            lower_name=Lower("name")
+        ).order_by("id").values_list("lower_name", "id").iterator():
+            self.ids.setdefault(key, pk)
+
+    def add(self, names):
+        """Create the names the user does not have yet
+
+        A name spelt differently later on resolves to the first spelling.
+        """
+        names = [
+            name for name in dict.fromkeys(names) if name not in self.keys
+        ]
+        self.keys.update(self.model.objects.lower_names(names))
+        missing = {}
+        for name in names:
+            if self.keys[name] not in self.ids:
+                missing.setdefault(self.keys[name], name)
+        if not missing:
+            return
+        objects, created = self.model.objects.get_or_create_by_names(
+            self.user, missing.values()
+        )
+        self.created += created
+        self.ids.update(zip(missing, (obj.pk for obj in objects)))
+
+    def __getitem__(self, name):
+        return self.ids[self.keys[name]]
+
+
+class Command(BaseCommand):
+    """Django Command to import recepies for a user from NDJSON or CSV
+
+    Reads the formats the recepie export writes: records with a title,
+    prep time, price, link and the names of their ingredients and tags,
+    given as strings or as objects with a name. Input is streamed and
+    written a batch at a time, with recepies and M2M rows inserted by
+    `COPY` on PostgreSQL and `bulk_create` elsewhere. Given a
+    `--checkpoint` name, the number of records imported is stored in an
+    `ImportCheckpoint` row in the same transaction as each batch, and a
+    run given the same name skips the records already imported.
+    """
+    help = "Import recepies from NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help='Input file, or "-" for stdin')
+        parser.add_argument("--user", required=True,
+                            help="Email of the user to import for")
+        parser.add_argument("--format", choices=("ndjson", "csv"),
+                            help="Input format, by default from the path")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--method", choices=("auto", "copy", "bulk"),
+                            default="auto",
+                            help="Insert with COPY or bulk_create")
+        parser.add_argument("--checkpoint",
+                            help="Name recording the imported records")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options["user"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist.")
+        path = options["path"]
+        input_format = options["format"] or (
+            "csv" if path.lower().endswith(".csv") else "ndjson"
+        )
+        method = options["method"]
+        if method == "auto":
+            method = "copy" if connection.vendor == "postgresql" else "bulk"
+        elif method == "copy" and connection.vendor != "postgresql":
+            raise CommandError("COPY needs PostgreSQL.")
+
+        source = "-" if path == "-" else os.path.abspath(path)
+        done = self.read_checkpoint(options["checkpoint"], source)
+        names = {
+            field: NameMap(model, user)
+            for field, model in RELATED_FIELDS.items()
+        }
+
+        start = time.perf_counter()
+        imported = 0
+        with self.open_input(path) as file:
+            records = enumerate(self.read(file, input_format), 1)
+            if done:
+                self.stdout.write(f"Skipping {done} imported records")
+                for _ in islice(records, done):
+                    pass
+            while True:
+                batch = list(islice(records, options["batch_size"]))
+                if not batch:
+                    break
+                rows = [self.clean(number, record)
+                        for number, record in batch]
+                with transaction.atomic():
+                    self.insert(user, rows, names, method)
+                    collection_changed(user.pk)
+                    self.write_checkpoint(options["checkpoint"], source,
+                                          done + len(batch))
+                done += len(batch)
+                imported += len(batch)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{done} records, {imported / elapsed:.0f} recepies/s"
+                )
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} recepies, created "
+            f"{names['tags'].created} tags and "
+            f"{names['ingredients'].created} ingredients in "
+            f"{elapsed:.1f}s ({imported / max(elapsed, 1e-9):.0f} "
+            "recepies/s)"
+        ))
+
+    def open_input(self, path):
+        if path == "-":
+            return open(sys.stdin.fileno(), encoding="utf-8", newline="",
+                        closefd=False)
+        try:
+            return open(path, encoding="utf-8", newline="")
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc.strerror}.")
+
+    def read(self, file, input_format):
+        """Yield the records of the input as dicts"""
+        if input_format == "csv":
+            yield from csv.DictReader(file)
+            return
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                yield loads(line)
+            except ValueError as exc:
+                raise CommandError(f"Line {number}: invalid JSON: {exc}")
+
+    def clean(self, number, record) -> dict:
+        """Validate a record and return its column values and names"""
+        if not isinstance(record, dict):
+            raise CommandError(f"Record {number}: expected an object.")
+        row = {}
+        for name in FIELDS:
+            field = Recepie._meta.get_field(name)
+            value = record.get(name)
+            if value is None and field.blank:
+                value = ""
+            try:
+                row[name] = field.clean(value, None)
+            except ValidationError as exc:
+                raise CommandError(
+                    f"Record {number}: {name}: {' '.join(exc.messages)}"
+                )
+        for field in RELATED_FIELDS:
+            row[field] = self.get_names(number, field, record.get(field))
+        return row
+
+    def get_names(self, number, field, value) -> list:
+        """Return the distinct names of a record's tags or ingredients"""
+        if not value:
+            return []
+        if isinstance(value, str):
+            value = value.split(SEPARATOR)
+        if not isinstance(value, list):
+            raise CommandError(f"Record {number}: {field}: expected a list.")
+        names = {}
+        for item in value:
+            if isinstance(item, dict):
+                item = item.get("name")
+            if not isinstance(item, str):
+                raise CommandError(
+                    f"Record {number}: {field}: expected names."
+                )
+            name = normalize_name(item)
+            if name:
+                names.setdefault(name.lower(), name)
+        return list(names.values())
+
+    def insert(self, user, rows, names, method):
+        """Insert a batch of recepies and link their tags and ingredients"""
+        for field, name_map in names.items():
+            name_map.add(name for row in rows for name in row[field])
+
+        if method == "copy":
+            ids = self.copy_recepies(user, rows)
+        else:
+            ids = [recepie.pk for recepie in Recepie.objects.bulk_create([
+                Recepie(user=user, **{name: row[name] for name in FIELDS})
+                for row in rows
+            ])]
+
+        for field, name_map in names.items():
+            through = getattr(Recepie, field).through
+            column = through._meta.get_field(field[:-1]).attname
+            links = list(dict.fromkeys(
+                (recepie_id, name_map[name])
+                for recepie_id, row in zip(ids, rows)
+                for name in row[field]
+            ))
+            if method == "copy":
+                self.copy(through._meta.db_table, ("recepie_id", column),
+                          links)
+            else:
+                through.objects.bulk_create([
+                    through(recepie_id=recepie_id, **{column: pk})
+                    for recepie_id, pk in links
+                ])
+        Recepie.objects.filter(pk__in=ids).update_search_vector()
+
+    def copy_recepies(self, user, rows) -> list:
+        """COPY recepies in with ids drawn from the table's sequence"""
+        table = Recepie._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+                "FROM generate_series(1, %s)",
+                [table, len(rows)],
+            )
+            ids = [pk for pk, in cursor.fetchall()]
+        self.copy(
+            table,
+            ("id", "user_id", "image_status") + FIELDS,
+            [(pk, user.pk, "") + tuple(row[name] for name in FIELDS)
+             for pk, row in zip(ids, rows)],
+        )
+        return ids
+
+    def copy(self, table, columns, rows):
+        """COPY rows into a table, quoting every value so none is NULL"""
+        buffer = io.StringIO()
+        csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+        buffer.seek(0)
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY "{table}" ({column_list}) FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+
+    def read_checkpoint(self, name, source) -> int:
+        """Return the number of records a previous run imported"""
+        if not name:
+            return 0
+        checkpoint = ImportCheckpoint.objects.filter(name=name).first()
+        if checkpoint is None:
+            return 0
+        if checkpoint.source != source:
+            raise CommandError(
+                f"Checkpoint {name} is for {checkpoint.source}."
+            )
+        return checkpoint.records
+
+    def write_checkpoint(self, name, source, records):
+        if not name:
+            return
+        ImportCheckpoint.objects.update_or_create(
+            name=name,
+            defaults={
+                "source": source,
+                "records": records,
+                "updated_at": timezone.now(),
+            },
+        )
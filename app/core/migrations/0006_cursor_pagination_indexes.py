@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-17 23:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recepie_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-name', '-id'], name='core_ingr_user_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recepie',
+            index=models.Index(fields=['user', 'id'], name='core_recepie_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-name', '-id'], name='core_tag_user_name_id_idx'),
+        ),
+    ]
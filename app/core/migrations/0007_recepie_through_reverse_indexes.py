@@ -0,0 +1,28 @@
+from django.db import migrations
+
+# Django indexes the through tables on (recepie_id, <other>_id) via their
+# unique constraint, which serves "attributes of a recepie". These composite
+# indexes serve the reverse lookups, "recepies using a tag or ingredient",
+# straight from the index without touching the heap.
+THROUGH_INDEXES = (
+    ("core_recepie_tags_tag_recepie_idx", "core_recepie_tags",
+     ("tag_id", "recepie_id")),
+    ("core_recepie_ingr_ingr_recepie_idx", "core_recepie_ingredients",
+     ("ingredient_id", "recepie_id")),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=f'CREATE INDEX "{name}" ON "{table}" '
+                f'({", ".join(columns)})',
+            reverse_sql=f'DROP INDEX "{name}"',
+        )
+        for name, table, columns in THROUGH_INDEXES
+    ]
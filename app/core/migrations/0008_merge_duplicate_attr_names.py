@@ -0,0 +1,72 @@
+from django.db import migrations
+
+
+def normalize_name(name):
+    return ' '.join(name.split())
+
+
+def lower_names(connection, names):
+    """Return each name mapped to its lower case form in the database"""
+    if not names:
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT name, lower(name) FROM unnest(%s::text[]) AS name',
+            [list(names)],
+        )
+        return dict(cursor.fetchall())
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Fold tags and ingredients sharing a user and name into the oldest
+
+    Names are normalized and compared case-insensitively, like
+    `get_or_create_by_names()` does, with cases folded by the database
+    as the unique lower(name) index of migration 0009 does.
+    """
+    Recepie = apps.get_model('core', 'Recepie')
+    for model_name, field in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = getattr(Recepie, field).through
+        column = through._meta.get_field(model_name.lower()).attname
+        rows = list(
+            model.objects.order_by('id').values_list('id', 'user', 'name')
+        )
+        keys = lower_names(
+            schema_editor.connection,
+            {normalize_name(name) for _, _, name in rows},
+        )
+        groups = {}
+        for pk, user, name in rows:
+            key = (user, keys[normalize_name(name)])
+            groups.setdefault(key, []).append((pk, name))
+        for (user, _), objects in groups.items():
+            (keep, name), others = objects[0], [pk for pk, _ in objects[1:]]
+            if name != normalize_name(name):
+                model.objects.filter(id=keep).update(
+                    name=normalize_name(name)
+                )
+            if not others:
+                continue
+            linked = set(through.objects.filter(
+                **{column: keep}
+            ).values_list('recepie_id', flat=True))
+            moved = set(through.objects.filter(
+                **{f'{column}__in': others}
+            ).values_list('recepie_id', flat=True)) - linked
+            through.objects.bulk_create([
+                through(recepie_id=recepie_id, **{column: keep})
+                for recepie_id in moved
+            ])
+            model.objects.filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recepie_through_reverse_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-17 23:38
+
+from django.db import migrations
+
+# Django 3.2 cannot declare unique indexes on expressions, so the indexes
+# names are compared through are created here and not declared on the
+# models.
+UNIQUE_LOWER_NAME_INDEX = (
+    'CREATE UNIQUE INDEX {name} ON {table} (user_id, lower(name))'
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_merge_duplicate_attr_names'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            UNIQUE_LOWER_NAME_INDEX.format(
+                name='core_ingr_user_lower_name_idx',
+                table='core_ingredient',
+            ),
+            'DROP INDEX core_ingr_user_lower_name_idx',
+        ),
+        migrations.RunSQL(
+            UNIQUE_LOWER_NAME_INDEX.format(
+                name='core_tag_user_lower_name_idx',
+                table='core_tag',
+            ),
+            'DROP INDEX core_tag_user_lower_name_idx',
+        ),
+    ]
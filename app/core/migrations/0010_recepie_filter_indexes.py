@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-17 23:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_unique_attr_names'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recepie',
+            index=models.Index(fields=['user', 'price'], name='core_recepie_user_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recepie',
+            index=models.Index(fields=['user', 'prep_time'], name='core_recepie_user_prep_idx'),
+        ),
+    ]
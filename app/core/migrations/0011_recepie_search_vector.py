@@ -0,0 +1,69 @@
+# Generated by Django 3.2.25 on 2026-10-17 23:44
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, transaction
+
+BACKFILL_SQL = """
+UPDATE core_recepie r SET search_vector =
+    setweight(to_tsvector('english', r.title), 'A')
+    || setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(i.name, ' ') FROM core_ingredient i
+        JOIN core_recepie_ingredients ri ON ri.ingredient_id = i.id
+        WHERE ri.recepie_id = r.id
+    ), '')), 'B')
+    || setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(t.name, ' ') FROM core_tag t
+        JOIN core_recepie_tags rt ON rt.tag_id = t.id
+        WHERE rt.recepie_id = r.id
+    ), '')), 'C')
+"""
+
+
+def create_trigram_index(apps, schema_editor):
+    """Index titles for trigram matching where pg_trgm can be installed
+
+    Trigram matching only widens search results, so databases that do not
+    ship the extension fall back to prefix matching on the search vector.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        if cursor.fetchone() is None:
+            return
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except Exception:
+            return
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS core_recepie_title_trgm_idx "
+            "ON core_recepie USING gin (title gin_trgm_ops)"
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP INDEX IF EXISTS core_recepie_title_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_recepie_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recepie',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recepie',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='core_recepie_search_idx'),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 23:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recepie_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recepie',
+            name='image_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=16),
+        ),
+    ]
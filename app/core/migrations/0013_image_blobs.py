@@ -0,0 +1,47 @@
+# Generated by Django 3.2.25 on 2026-10-17 23:58
+
+import core.models
+import core.storage
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def count_image_references(apps, schema_editor):
+    """Create a blob for every image recepies already reference"""
+    Recepie = apps.get_model('core', 'Recepie')
+    ImageBlob = apps.get_model('core', 'ImageBlob')
+    references = Recepie.objects.exclude(image__isnull=True).exclude(
+        image='',
+    ).values('image').annotate(total=models.Count('id'))
+    ImageBlob.objects.bulk_create(
+        ImageBlob(name=row['image'], ref_count=row['total'])
+        for row in references.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_recepie_image_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recepie',
+            name='image',
+            field=models.ImageField(null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.recepie_image_file_path),
+        ),
+        migrations.RunPython(
+            count_image_references,
+            migrations.RunPython.noop,
+        ),
+    ]
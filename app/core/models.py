@@ -1,13 +1,24 @@
 import uuid
 from pathlib import Path
 
-from django.db import models
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connections, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Lower
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin
 )
 from django.conf import settings
+from django.utils import timezone
+
+from .storage import ContentAddressedStorage
+
+# Text search configuration used to build and query recepie search vectors
+SEARCH_CONFIG = "english"
 
 
 def recepie_image_file_path(instance, filename):
@@ -17,6 +28,11 @@ def recepie_image_file_path(instance, filename):
     return str(Path("uploads") / Path("recepie") / new_filename)
 
 
+def normalize_name(name) -> str:
+    """Collapse runs of whitespace and strip the ends of a name"""
+    return " ".join(name.split())
+
+
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, *args, **kwargs):
         if not email:
@@ -44,12 +60,74 @@ class User(AbstractBaseUser, PermissionsMixin):
     # USERNAME_FIELD = email
 
 
+class RecepieAttrManager(models.Manager):
+    def get_or_create_by_names(self, user, names):
+        """Return one object per distinct name, creating missing ones
+
+        Names are normalized and compared case-insensitively, so " salt"
+        and "Salt" resolve to the same object. Cases are folded by the
+        database, like the unique lower(name) index does, since Python
+        folds some letters differently. Returns the objects in the order
+        their names first appear and the number that were created.
+        """
+        names = [name for name in map(normalize_name, names) if name]
+        keys = self.lower_names(names)
+        wanted = {}
+        for name in names:
+            wanted.setdefault(keys[name], name)
+
+        existing = self._by_lower_name(user, wanted)
+        missing = [
+            self.model(user=user, name=name)
+            for key, name in wanted.items() if key not in existing
+        ]
+        if missing:
+            self.bulk_create(missing, ignore_conflicts=True)
+            existing.update(self._by_lower_name(
+                user,
+                [keys[obj.name] for obj in missing],
+            ))
+        return [existing[key] for key in wanted], len(missing)
+
+    def lower_names(self, names) -> dict:
+        """Return each name mapped to its lower case form in the database"""
+        if not names:
+            return {}
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                "SELECT name, lower(name) FROM unnest(%s::text[]) AS name",
+                [list(set(names))],
+            )
+            return dict(cursor.fetchall())
+
+    def _by_lower_name(self, user, keys) -> dict:
+        queryset = self.filter(user=user).annotate(
+            lower_name=Lower("name")
+        ).filter(lower_name__in=list(keys)).order_by("id")
+        objects = {}
+        for obj in queryset:
+            objects.setdefault(obj.lower_name, obj)
+        return objects
+
+
 class Tag(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    objects = RecepieAttrManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "-name", "-id"],
+                name="core_tag_user_name_id_idx",
+            ),
+        ]
+        # Names are unique per user case-insensitively, through the
+        # unique (user_id, lower(name)) index core_tag_user_lower_name_idx
+        # that migration 0009 creates.
 
     def __str__(self) -> str:
         return self.name
@@ -61,11 +139,56 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    objects = RecepieAttrManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "-name", "-id"],
+                name="core_ingr_user_name_id_idx",
+            ),
+        ]
+        # Names are unique per user case-insensitively, through the
+        # unique (user_id, lower(name)) index core_ingr_user_lower_name_idx
+        # that migration 0009 creates.
 
     def __str__(self) -> str:
         return self.name
 
 
+class RecepieQuerySet(models.QuerySet):
+    def update_search_vector(self):
+        """Recompute the search vector from the title, ingredients and tags
+
+        Titles weigh most, then ingredient names, then tag names. Runs as a
+        single UPDATE however many recepies are in the queryset.
+        """
+        def names(model):
+            return Coalesce(
+                Subquery(
+                    model.objects.filter(
+                        recepie=OuterRef("pk")
+                    ).values("recepie").annotate(
+                        names=StringAgg("name", " ")
+                    ).values("names")
+                ),
+                Value(""),
+            )
+
+        return self.update(search_vector=(
+            SearchVector("title", weight="A", config=SEARCH_CONFIG)
+            + SearchVector(names(Ingredient), weight="B",
+                           config=SEARCH_CONFIG)
+            + SearchVector(names(Tag), weight="C", config=SEARCH_CONFIG)
+        ))
+
+
+class RecepieManager(models.Manager.from_queryset(RecepieQuerySet)):
+    def get_queryset(self):
+        """Never load search vectors, which are only read in SQL"""
+        return super().get_queryset().defer("search_vector")
+
+
 class Recepie(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -77,7 +200,122 @@ class Recepie(models.Model):
     link = models.CharField(max_length=1023, blank=True)
     ingredients = models.ManyToManyField(Ingredient)
     tags = models.ManyToManyField(Tag)
-    image = models.ImageField(null=True, upload_to=recepie_image_file_path)
+    image = models.ImageField(
+        null=True,
+        upload_to=recepie_image_file_path,
+        storage=ContentAddressedStorage(),
+    )
+    image_status = models.CharField(
+        max_length=16,
+        blank=True,
+        choices=[
+            ("pending", "Pending"),
+            ("ready", "Ready"),
+            ("failed", "Failed"),
+        ],
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
+    objects = RecepieManager()
+
+    class Meta:
+        indexes = [
+            GinIndex(
+                fields=["search_vector"],
+                name="core_recepie_search_idx",
+            ),
+            models.Index(
+                fields=["user", "id"],
+                name="core_recepie_user_id_idx",
+            ),
+            models.Index(
+                fields=["user", "price"],
+                name="core_recepie_user_price_idx",
+            ),
+            models.Index(
+                fields=["user", "prep_time"],
+                name="core_recepie_user_prep_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stored image name to count references on save"""
+        instance = super().from_db(db, field_names, values)
+        if "image" in instance.__dict__:
+            instance._stored_image = instance.__dict__["image"] or None
+        return instance
+
+
+class ImageBlobManager(models.Manager):
+    def retain(self, name):
+        """Count one more reference to a stored image"""
+        self.bulk_create([self.model(name=name)], ignore_conflicts=True)
+        self.filter(name=name).update(
+            ref_count=models.F("ref_count") + 1,
+            updated_at=timezone.now(),
+        )
+
+    def release(self, name):
+        """Count one reference less to a stored image"""
+        self.filter(name=name, ref_count__gt=0).update(
+            ref_count=models.F("ref_count") - 1,
+            updated_at=timezone.now(),
+        )
+
+
+class ImageBlob(models.Model):
+    """A stored image file shared by every recepie referencing it"""
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+    objects = ImageBlobManager()
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class CollectionVersionManager(models.Manager):
+    def bump(self, user_id):
+        """Mark the recepie collections of a user as changed"""
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, version, updated_at) "
+                f"VALUES (%s, 1, %s) ON CONFLICT (user_id) DO UPDATE "
+                f"SET version = {table}.version + 1, "
+                f"updated_at = EXCLUDED.updated_at",
+                [user_id, timezone.now()],
+            )
+
+    def get_stamp(self, user_id):
+        """Return the version and last change time of a user's collections"""
+        return self.filter(user_id=user_id).values_list(
+            "version", "updated_at"
+        ).first() or (0, None)
+
+
+class CollectionVersion(models.Model):
+    """Counts the changes to a user's recepies, tags and ingredients"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+    objects = CollectionVersionManager()
+
+
+class ImportCheckpoint(models.Model):
+    """Counts the records of an input that recepie imports committed"""
+    name = models.CharField(max_length=255, unique=True)
+    source = models.CharField(max_length=1023)
+    records = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self) -> str:
+        return self.name
@@ -0,0 +1,35 @@
+"""JSON parsing for the API with the backend the renderer uses
+
+UTF-8 bodies are decoded with orjson when `core.renderers` uses it.
+Bodies orjson rejects are parsed again by DRF's parser, so clients get
+the same error message either way. The one difference is that orjson
+reads integers beyond 64 bits as floats, which every integer field of
+the API rejects all the same.
+"""
+import io
+
+from django.conf import settings
+
+from rest_framework import parsers
+
+from .renderers import get_backend, orjson
+
+UTF8 = ("utf-8", "utf8")
+
+
+class JSONParser(parsers.JSONParser):
+    """Parse JSON request bodies with the configured backend"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if (get_backend() != "orjson" or not self.strict
+                or encoding.lower() not in UTF8):
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type,
+                                 parser_context)
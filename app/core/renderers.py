@@ -0,0 +1,202 @@
+"""JSON rendering for the API with an optional fast backend
+
+With JSON_BACKEND set to "auto" (the default) or "orjson", responses are
+encoded with orjson when it is installed, falling back to the standard
+library otherwise. Either way the output matches DRF's `JSONRenderer`
+byte for byte: compact, UTF-8, with U+2028 and U+2029 escaped and
+everything the standard library cannot encode handed to DRF's encoder.
+`Decimal` is checked before anything else rather than at the end of that
+encoder's chain, and rendered as a number like DRF does; serializers
+still turn prices into strings before they get here.
+
+Paginated lists of at least JSON_STREAM_MIN_ITEMS results are streamed
+in batches of encoded items by `stream_response()`, so a large page is
+never held in memory as one string.
+"""
+from collections.abc import Iterator
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import StreamingHttpResponse
+
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKENDS = ("auto", "orjson", "json")
+# Items encoded at a time when streaming a list
+STREAM_BATCH_SIZE = 100
+
+if orjson is not None:
+    ORJSON_OPTIONS = (
+        orjson.OPT_NON_STR_KEYS
+        | orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+    )
+
+
+class DecimalJSONEncoder(JSONEncoder):
+    """DRF's encoder with `Decimal` checked first"""
+
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return float(obj)
+        return super().default(obj)
+
+
+ENCODER = DecimalJSONEncoder(
+    ensure_ascii=False,
+    allow_nan=False,
+    separators=(",", ":"),
+)
+
+
+def get_backend() -> str:
+    """Return the JSON backend in use, "orjson" or "json" """
+    backend = getattr(settings, "JSON_BACKEND", "auto")
+    if backend not in BACKENDS:
+        raise ImproperlyConfigured(
+            f"JSON_BACKEND must be one of {', '.join(BACKENDS)}."
+        )
+    if backend == "json":
+        return "json"
+    if orjson is None:
+        if backend == "orjson":
+            raise ImproperlyConfigured(
+                "JSON_BACKEND is \"orjson\" but orjson is not installed."
+            )
+        return "json"
+    return "orjson"
+
+
+def get_stream_min_items() -> int:
+    return getattr(settings, "JSON_STREAM_MIN_ITEMS", 0)
+
+
+def dumps(data) -> bytes:
+    """Encode data as compact UTF-8 JSON like DRF's `JSONRenderer`"""
+    if get_backend() == "orjson":
+        try:
+            ret = orjson.dumps(
+                data,
+                default=ENCODER.default,
+                option=ORJSON_OPTIONS,
+            )
+        except orjson.JSONEncodeError:
+            # Integers beyond 64 bits and types neither encoder knows
+            # get the standard library's result or error
+            ret = ENCODER.encode(data).encode()
+    else:
+        ret = ENCODER.encode(data).encode()
+    if b"\xe2\x80" in ret:
+        # Valid JSON but not valid JavaScript, as DRF escapes them
+        ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028")
+        ret = ret.replace(b"\xe2\x80\xa9", b"\\u2029")
+    return ret
+
+
+def iter_items(items):
+    """Yield the encoded items of a list in comma separated batches"""
+    items = iter(items)
+    separator = b""
+    while True:
+        batch = list(islice(items, STREAM_BATCH_SIZE))
+        if not batch:
+            return
+        yield separator + dumps(batch)[1:-1]
+        separator = b","
+
+
+def iter_json(data):
+    """Yield the JSON encoding of data in chunks
+
+    Top level lists and iterators, and those that are values of a top
+    level dict, are encoded a batch of items at a time.
+    """
+    if isinstance(data, (list, tuple, Iterator)):
+        yield b"["
+        yield from iter_items(data)
+        yield b"]"
+    elif isinstance(data, dict):
+        yield b"{"
+        separator = b""
+        for key, value in data.items():
+            if isinstance(value, (list, tuple, Iterator)):
+                yield separator + dumps({key: []})[1:-2]
+                yield from iter_items(value)
+                yield b"]"
+            else:
+                yield separator + dumps({key: value})[1:-1]
+            separator = b","
+        yield b"}"
+    else:
+        yield dumps(data)
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """Render JSON with the configured backend
+
+    Indented output, and `UNICODE_JSON`, `COMPACT_JSON` or `STRICT_JSON`
+    changed from their defaults, are left to DRF's renderer.
+    """
+
+    def is_fast(self, accepted_media_type, renderer_context) -> bool:
+        """Return whether the output can come from `dumps()`"""
+        return (
+            self.strict
+            and self.compact
+            and not self.ensure_ascii
+            and not self.get_indent(accepted_media_type or "",
+                                    renderer_context or {})
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if not self.is_fast(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        return dumps(data)
+
+    def render_chunks(self, data, accepted_media_type=None,
+                      renderer_context=None):
+        """Yield the rendered data in chunks, see `iter_json()`"""
+        if not self.is_fast(accepted_media_type, renderer_context):
+            yield self.render(data, accepted_media_type, renderer_context)
+            return
+        yield from iter_json(data)
+
+
+def stream_response(request, response, items):
+    """Return a streaming copy of a Response with `items` results
+
+    The response is returned as it is when it has too few items or was
+    negotiated to a renderer that cannot stream.
+    """
+    min_items = get_stream_min_items()
+    renderer = getattr(request, "accepted_renderer", None)
+    if (not min_items or items < min_items
+            or not isinstance(renderer, JSONRenderer)):
+        return response
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type += f"; charset={renderer.charset}"
+    streaming = StreamingHttpResponse(
+        renderer.render_chunks(
+            response.data,
+            request.accepted_media_type,
+            {"request": request, "response": response},
+        ),
+        status=response.status_code,
+        content_type=content_type,
+    )
+    for header, value in response.items():
+        if header.lower() != "content-type":
+            streaming[header] = value
+    return streaming
@@ -0,0 +1,108 @@
+"""Reading from a replica database with read-your-writes pinning
+
+`ReplicaReadMixin` makes views run the queries of their safe requests on
+the REPLICA_ROUTING["ALIAS"] database, through `ReplicaRouter`. Writes
+always go to the primary, as do reads inside a transaction on it.
+
+A replica lags behind the primary, so a user reading right after their
+own write could miss it. Writes call `pin_primary()`, and the user's
+reads then stay on the primary for PIN_SECONDS. Pins are kept in the
+CACHES alias CACHE_ALIAS, which must be shared between workers for a
+pin to hold on all of them.
+
+Streamed responses produce their body after the view has returned, and
+read from the primary.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from rest_framework.permissions import SAFE_METHODS
+
+_read_alias = ContextVar("replica_read_alias", default=None)
+
+
+def get_settings() -> dict:
+    """Return the replica routing settings merged over their defaults"""
+    options = {
+        "ALIAS": None,
+        "PIN_SECONDS": 5,
+        "CACHE_ALIAS": "default",
+    }
+    options.update(getattr(settings, "REPLICA_ROUTING", {}))
+    return options
+
+
+def get_pin_key(user_id) -> str:
+    return f"replica-pin:{user_id}"
+
+
+def pin_primary(user_id):
+    """Keep a user's reads on the primary for the next PIN_SECONDS"""
+    options = get_settings()
+    if options["ALIAS"] and options["PIN_SECONDS"] > 0:
+        caches[options["CACHE_ALIAS"]].set(
+            get_pin_key(user_id), True, options["PIN_SECONDS"]
+        )
+
+
+def is_pinned(user_id) -> bool:
+    """Return whether a user wrote within the last PIN_SECONDS"""
+    options = get_settings()
+    return bool(caches[options["CACHE_ALIAS"]].get(get_pin_key(user_id)))
+
+
+@contextmanager
+def reading_from(alias):
+    """Route the reads made in the block to a database"""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """Send reads to the database chosen by `reading_from()`"""
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Objects read from the replica are saved to the primary as well
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaReadMixin:
+    """Read from the replica in safe requests, unless the user just wrote
+
+    The database is chosen once the request is authenticated, and reset
+    when the response is finalized.
+    """
+    _replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        alias = get_settings()["ALIAS"]
+        if (alias and request.method in SAFE_METHODS
+                and not is_pinned(request.user.pk)):
+            self._replica_token = _read_alias.set(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._replica_token is not None:
+            _read_alias.reset(self._replica_token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
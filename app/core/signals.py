@@ -0,0 +1,149 @@
+from django.core.signals import request_started
+from django.db import connections, router, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from .instrumentation import install_query_recorder
+from .models import ImageBlob, Ingredient, Recepie, Tag
+
+
+def reindex_on_commit(ids):
+    """Reindex recepies once the current transaction commits
+
+    The ids the receivers below pass in one transaction are collected on
+    its connection, and the first callback to run reindexes them all, so
+    each recepie is reindexed once however many changes it saw. Ids left
+    over by a rolled back transaction are reindexed with the next one.
+    """
+    connection = transaction.get_connection(router.db_for_write(Recepie))
+    pending = connection.__dict__.setdefault("pending_search_reindex", set())
+    pending.update(ids)
+
+    def reindex():
+        ids = set(pending)
+        pending.clear()
+        if ids:
+            Recepie.objects.filter(pk__in=ids).update_search_vector()
+
+    transaction.on_commit(reindex, using=connection.alias)
+
+
+@receiver(post_save, sender=Recepie)
+def update_recepie_search_vector(sender, instance, update_fields, **kwargs):
+    """Reindex a recepie when its title may have changed"""
+    if update_fields is None or "title" in update_fields:
+        reindex_on_commit([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recepie.tags.through)
+@receiver(m2m_changed, sender=Recepie.ingredients.through)
+def update_linked_search_vectors(sender, instance, action, reverse, pk_set,
+                                 **kwargs):
+    """Reindex recepies whose ingredients or tags were added or removed"""
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            reindex_on_commit([instance.pk])
+        return
+
+    if action == "pre_clear":
+        instance._search_recepie_ids = list(
+            instance.recepie_set.values_list("pk", flat=True)
+        )
+    elif action == "post_clear":
+        reindex_on_commit(getattr(instance, "_search_recepie_ids", []))
+    elif action in ("post_add", "post_remove"):
+        reindex_on_commit(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def update_renamed_search_vectors(sender, instance, created, **kwargs):
+    """Reindex the recepies using a tag or ingredient that was renamed"""
+    if not created:
+        reindex_on_commit(
+            instance.recepie_set.values_list("pk", flat=True)
+        )
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_linked_recepies(sender, instance, **kwargs):
+    instance._search_recepie_ids = list(
+        instance.recepie_set.values_list("pk", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def update_unlinked_search_vectors(sender, instance, **kwargs):
+    """Reindex the recepies that used a deleted tag or ingredient"""
+    reindex_on_commit(getattr(instance, "_search_recepie_ids", []))
+
+
+@receiver(pre_save, sender=Recepie)
+def remember_previous_image(sender, instance, update_fields, **kwargs):
+    """Note the image a recepie referenced before it is saved"""
+    if update_fields is not None and "image" not in update_fields:
+        return
+    if instance._state.adding:
+        previous = None
+    elif hasattr(instance, "_stored_image"):
+        previous = instance._stored_image
+    else:
+        previous = Recepie.objects.filter(pk=instance.pk).values_list(
+            "image", flat=True
+        ).first() or None
+    instance._previous_image = previous
+
+
+@receiver(post_save, sender=Recepie)
+def count_image_references(sender, instance, **kwargs):
+    """Move a reference from the previous image to the current one"""
+    if not hasattr(instance, "_previous_image"):
+        return
+    previous = instance.__dict__.pop("_previous_image")
+    current = instance.image.name or None
+    if current != previous:
+        if current:
+            ImageBlob.objects.retain(current)
+        if previous:
+            ImageBlob.objects.release(previous)
+    instance._stored_image = current
+
+
+@receiver(post_delete, sender=Recepie)
+def release_deleted_image(sender, instance, **kwargs):
+    """Drop the reference a deleted recepie held on its image"""
+    image = instance.__dict__.get("image", getattr(
+        instance, "_stored_image", None
+    ))
+    name = getattr(image, "name", image)
+    if name:
+        ImageBlob.objects.release(name)
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    """Drop kept connections the server closed before a request uses them
+
+    Runs after Django has closed the connections past CONN_MAX_AGE, for
+    databases with CONN_HEALTH_CHECKS.
+    """
+    for connection in connections.all():
+        if (connection.connection is not None
+                and connection.settings_dict.get("CONN_HEALTH_CHECKS")
+                and not connection.is_usable()):
+            connection.close()
+
+
+@receiver(connection_created)
+def record_queries(sender, connection, **kwargs):
+    """Let request instrumentation see the queries of a new connection"""
+    install_query_recorder(connection)
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """File storage naming every file after the SHA-256 of its content
+
+    Saving content that is already stored returns the existing name
+    instead of writing a copy, so identical uploads share one file.
+    Files are only removed by the `gc_images` command once nothing
+    references them any more.
+    """
+
+    def hashed_name(self, name, digest) -> str:
+        """Return the name content with a given digest is stored under"""
+        path = Path(name)
+        return str(
+            path.parent / digest[:2] / f"{digest}{path.suffix.lower()}"
+        )
+
+    def get_available_name(self, name, max_length=None):
+        """Keep names as they are, `_save` never overwrites other content"""
+        return name
+
+    def _save(self, name, content):
+        directory = os.path.dirname(self.path(name))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            return self.store(tmp_path, name, digest.hexdigest())
+        finally:
+            Path(tmp_path).unlink(missing_ok=True)
+
+    def store(self, path, name, digest) -> str:
+        """Move a finished file into place, returning its hashed name
+
+        The file is dropped when the same content is already stored.
+        """
+        name = self.hashed_name(name, digest)
+        move_into_place(path, self.path(name),
+                        self.file_permissions_mode or 0o644)
+        return name
+
+
+def rehashed_name(name, digest) -> str:
+    """Return the name content with a digest gets next to a stored file"""
+    path = Path(name)
+    return str(path.parent.parent / digest[:2] / f"{digest}{path.suffix}")
+
+
+def move_into_place(path, full_path, mode=0o644):
+    """Move a finished file to its hashed path
+
+    The file is dropped when the same content is already stored there.
+    Only takes paths, so image worker processes can use it as well.
+    """
+    if os.path.exists(full_path):
+        os.remove(path)
+        # A fresh mtime keeps `gc_images` off the file until the new
+        # reference to it is counted
+        os.utime(full_path)
+        return
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    os.chmod(path, mode)
+    os.replace(path, full_path)
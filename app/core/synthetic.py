@@ -0,0 +1,164 @@
+"""Generate synthetic users, tags, ingredients and recepies in bulk
+
+Used by the benchmark commands to seed datasets large enough for the
+query planner and the API to behave the way they do in production.
+"""
+import random
+import uuid
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from .models import Ingredient, Recepie, Tag
+
+WORDS = (
+    "spicy", "sweet", "smoky", "crispy", "creamy", "tangy", "roasted",
+    "grilled", "baked", "fried", "steamed", "stuffed", "quick", "slow",
+    "paneer", "chicken", "lentil", "tomato", "potato", "mushroom", "rice",
+    "noodle", "curry", "soup", "salad", "cake", "bread", "pie", "stew",
+)
+
+
+def _name(rng, words=2) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).title()
+
+
+def _batched(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _sample(rng, ids, cum_weights, k):
+    """Pick k distinct ids, favouring those with the heavier weights"""
+    k = min(k, len(ids))
+    picked = {}
+    while len(picked) < k:
+        for pk in rng.choices(ids, cum_weights=cum_weights, k=k):
+            picked.setdefault(pk, None)
+    return list(picked)[:k]
+
+
+def _create(model, rows, batch_size):
+    """Bulk insert rows and return their primary keys"""
+    ids = []
+    for batch in _batched(rows, batch_size):
+        if connection.features.can_return_rows_from_bulk_insert:
+            ids.extend(
+                obj.pk for obj in model.objects.bulk_create(batch)
+            )
+        else:
+            for obj in batch:
+                obj.save(force_insert=True)
+                ids.append(obj.pk)
+    return ids
+
+
+def seed(users=1, tags=20, ingredients=50, recepies=100,
+         tags_per_recepie=3, ingredients_per_recepie=6,
+         batch_size=5000, random_seed=None, skew=0):
+    """Seed a synthetic dataset and return the created users
+
+    Every user gets their own `tags`, `ingredients` and `recepies`, and each
+    recepie is linked to a random sample of its owner's tags and
+    ingredients. With a `skew` above 0 the fan-out looks more like real
+    collections: each recepie has between one and twice the given number
+    of tags and ingredients, and the n-th tag or ingredient is picked with
+    a weight of 1 / n ** skew, so a few are on most recepies.
+    """
+    rng = random.Random(random_seed)
+    run = uuid.uuid4().hex[:8]
+    user_model = get_user_model()
+    user_objs = [
+        user_model(email=f"synthetic-{run}-{i}@example.com", name=f"User {i}")
+        for i in range(users)
+    ]
+    for user in user_objs:
+        user.set_unusable_password()
+    user_ids = _create(user_model, user_objs, batch_size)
+
+    recepie_tags = Recepie.tags.through
+    recepie_ingredients = Recepie.ingredients.through
+
+    def pick(ids, weights, k):
+        if not skew:
+            return rng.sample(ids, min(k, len(ids)))
+        return _sample(rng, ids, weights, rng.randint(1, max(2 * k - 1, 1)))
+
+    for user_id in user_ids:
+        tag_ids = _create(Tag, (
+            Tag(user_id=user_id, name=f"{_name(rng)} {i}")
+            for i in range(tags)
+        ), batch_size)
+        ingredient_ids = _create(Ingredient, (
+            Ingredient(user_id=user_id, name=f"{_name(rng, words=1)} {i}")
+            for i in range(ingredients)
+        ), batch_size)
+        tag_weights = list(accumulate(
+            1 / rank ** skew for rank in range(1, len(tag_ids) + 1)
+        ))
+        ingredient_weights = list(accumulate(
+            1 / rank ** skew for rank in range(1, len(ingredient_ids) + 1)
+        ))
+
+        recepie_rows = (
+            Recepie(
+                user_id=user_id,
+                title=_name(rng, words=3),
+                prep_time=rng.randint(5, 180),
+                price=Decimal(rng.randint(100, 99999)) / 100,
+            )
+            for _ in range(recepies)
+        )
+        for batch in _batched(recepie_rows, batch_size):
+            recepie_ids = _create(Recepie, batch, batch_size)
+            through_tags = []
+            through_ingredients = []
+            for recepie_id in recepie_ids:
+                through_tags.extend(
+                    recepie_tags(recepie_id=recepie_id, tag_id=tag_id)
+                    for tag_id in pick(tag_ids, tag_weights,
+                                       tags_per_recepie)
+                )
+                through_ingredients.extend(
+                    recepie_ingredients(
+                        recepie_id=recepie_id,
+                        ingredient_id=ingredient_id,
+                    )
+                    for ingredient_id in pick(ingredient_ids,
+                                              ingredient_weights,
+                                              ingredients_per_recepie)
+                )
+            recepie_tags.objects.bulk_create(through_tags, batch_size)
+            recepie_ingredients.objects.bulk_create(
+                through_ingredients,
+                batch_size,
+            )
+            Recepie.objects.filter(
+                pk__in=recepie_ids
+            ).update_search_vector()
+
+    return list(user_model.objects.filter(pk__in=user_ids).order_by("pk"))
+
+
+def analyze():
+    """Refresh planner statistics for the recepie tables after seeding"""
+    if connection.vendor != "postgresql":
+        return
+    tables = (
+        Tag._meta.db_table,
+        Ingredient._meta.db_table,
+        Recepie._meta.db_table,
+        Recepie.tags.through._meta.db_table,
+        Recepie.ingredients.through._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute(f'ANALYZE "{table}"')
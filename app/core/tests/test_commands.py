@@ -1,8 +1,19 @@
+import json
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
 from unittest.mock import patch
 
-from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import ImportCheckpoint, Recepie, Tag
 
 
 class CommandTests(TestCase):
@@ -19,3 +30,280 @@ class CommandTests(TestCase):
             gi.side_effect = [OperationalError] * 5 + [True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+    def test_explain_indexes_rolls_back(self):
+        """Test explaining indexes reports both plans and leaves no data"""
+        out = StringIO()
+        call_command(
+            "explain_indexes",
+            users=2,
+            tags=5,
+            ingredients=5,
+            recepies=20,
+            stdout=out,
+        )
+        output = out.getvalue()
+        self.assertIn("Before:", output)
+        self.assertIn("After:", output)
+        self.assertFalse(Recepie.objects.exists())
+
+    def test_bench_json(self):
+        """Test the JSON benchmark reports every renderer and payload"""
+        out = StringIO()
+        err = StringIO()
+        call_command("bench_json", items=5, repeat=1, stdout=out, stderr=err)
+        output = out.getvalue()
+        for label in ("strings drf", "strings json", "decimals orjson"):
+            self.assertIn(label, output)
+        self.assertEqual(err.getvalue(), "")
+
+
+class BenchApiTests(TransactionTestCase):
+    """Test the API and serving benchmarks"""
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output = str(Path(directory.name) / "results.json")
+
+    def bench(self, **options):
+        out = StringIO()
+        call_command(
+            "bench_api",
+            recepies=5,
+            tags=3,
+            ingredients=3,
+            requests=2,
+            warmup=0,
+            allocations=1,
+            stdout=out,
+            **options,
+        )
+        return out.getvalue()
+
+    def test_bench_api(self):
+        """Test every scenario is reported and compared to a baseline"""
+        output = self.bench(output=self.output)
+
+        for label in ("recepies-list", "token", "upload-image"):
+            self.assertIn(f"{label} ", output)
+        results = json.loads(Path(self.output).read_text())
+        self.assertEqual(results["mode"], "in-process")
+        self.assertEqual(results["scenarios"]["recepies-list"]["requests"], 2)
+        self.assertFalse(Recepie.objects.exists())
+
+        results["scenarios"]["recepies-list"]["queries"] -= 1
+        results["scenarios"]["tags-list"]["p95_ms"] /= 2
+        Path(self.output).write_text(json.dumps(results))
+        with self.assertRaises(CommandError) as error:
+            self.bench(baseline=self.output, tolerance=1000)
+        self.assertIn("recepies-list queries", str(error.exception))
+        self.assertNotIn("tags-list", str(error.exception))
+
+    def test_bench_api_workers(self):
+        """Test worker processes run as their own users and clean up"""
+        output = self.bench(
+            workers=2,
+            scenarios="recepies-list,upload-image",
+            output=self.output,
+        )
+
+        self.assertIn("upload-image ", output)
+        results = json.loads(Path(self.output).read_text())
+        self.assertEqual(results["dataset"]["users"], 2)
+        self.assertEqual(results["scenarios"]["upload-image"]["requests"], 4)
+        self.assertFalse(get_user_model().objects.exists())
+
+    def test_bench_serving(self):
+        """Test connection modes report the sessions they opened"""
+        out = StringIO()
+        call_command("bench_serving", requests=6, threads=2, recepies=3,
+                     stdout=out)
+
+        sessions = dict(
+            (line.split()[0], int(line.rsplit("sessions=", 1)[1]))
+            for line in out.getvalue().splitlines()
+        )
+        self.assertEqual(sessions["per-request"], 6)
+        # At most one connection per thread is kept
+        self.assertLessEqual(sessions["persistent"], 2)
+        self.assertLessEqual(sessions["pool"], 2)
+        self.assertFalse(get_user_model().objects.exists())
+
+    def test_bench_concurrency(self):
+        """Test each mode serves every client from its own server"""
+        out = StringIO()
+        call_command("bench_concurrency", clients=3, delay=0, ramp=0,
+                     workers=1, threads=2, recepies=2,
+                     modes="sync,asgi", stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines],
+                         ["sync", "asgi"])
+        for line in lines:
+            self.assertIn("failed=0 ", line)
+        self.assertFalse(get_user_model().objects.exists())
+
+
+class ImportRecepiesTests(TestCase):
+    """Test importing recepies from NDJSON and CSV"""
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            "import@test.com",
+            "testpass@123",
+        )
+        self.tag = Tag.objects.create(user=self.user, name="Vegan")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write(self, name, content) -> str:
+        path = self.directory / name
+        path.write_text(content, encoding="utf-8")
+        return str(path)
+
+    def import_recepies(self, path, **options):
+        out = StringIO()
+        call_command("import_recepies", path, user=self.user.email,
+                     stdout=out, **options)
+        return out.getvalue()
+
+    def test_import_ndjson(self):
+        """Test records are imported with their names resolved or created"""
+        records = [
+            {"title": "Kheer", "prep_time": 40, "price": "5.50",
+             "ingredients": [{"id": 9, "name": "Rice"}, {"name": "milk"}],
+             "tags": [{"name": "vegan"}, {"name": "Dessert"}]},
+            {"title": "Dal", "prep_time": 30, "price": 2,
+             "ingredients": ["  Toor  dal ", "rice"], "tags": []},
+        ]
+        path = self.write("recepies.ndjson", "\n".join(
+            json.dumps(record) for record in records
+        ) + "\n\n")
+        for method in ("copy", "bulk"):
+            with self.subTest(method=method):
+                Recepie.objects.all().delete()
+
+                output = self.import_recepies(path, method=method)
+
+                self.assertIn("Imported 2 recepies", output)
+                kheer = Recepie.objects.get(title="Kheer")
+                self.assertEqual(kheer.price, Decimal("5.50"))
+                self.assertEqual(kheer.link, "")
+                self.assertEqual(
+                    sorted(kheer.tags.values_list("name", flat=True)),
+                    ["Dessert", "Vegan"],
+                )
+                dal = Recepie.objects.get(title="Dal")
+                self.assertEqual(
+                    sorted(dal.ingredients.values_list("name", flat=True)),
+                    ["Rice", "Toor dal"],
+                )
+                self.assertEqual(
+                    Tag.objects.filter(user=self.user, name="Vegan").count(),
+                    1,
+                )
+                self.assertFalse(Recepie.objects.filter(
+                    search_vector__isnull=True
+                ).exists())
+
+    def test_import_csv_export(self):
+        """Test a CSV export imports back into the same recepies"""
+        recepie = Recepie.objects.create(user=self.user, title="Kheer, hot",
+                                         prep_time=40, price=5,
+                                         link="https://example.com/kheer")
+        recepie.tags.add(self.tag)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        res = client.get(reverse("recepie:recepie-export"), {"format": "csv"})
+        path = self.write("export.csv",
+                          b"".join(res.streaming_content).decode())
+        self.user = get_user_model().objects.create_user(
+            "importcopy@test.com",
+            "testpass@123",
+        )
+
+        self.import_recepies(path)
+
+        copy = Recepie.objects.get(user=self.user)
+        self.assertEqual(
+            (copy.title, copy.prep_time, copy.price, copy.link),
+            (recepie.title, recepie.prep_time, recepie.price, recepie.link),
+        )
+        self.assertEqual(list(copy.tags.values_list("name", flat=True)),
+                         ["Vegan"])
+
+    def test_import_resumes_from_checkpoint(self):
+        """Test a run with a checkpoint skips the records imported before"""
+        path = self.write("recepies.ndjson", "".join(
+            json.dumps({"title": title, "prep_time": 5, "price": 1}) + "\n"
+            for title in ("First", "Second", "Third")
+        ))
+        ImportCheckpoint.objects.create(name="nightly", source=path,
+                                        records=1)
+
+        output = self.import_recepies(path, checkpoint="nightly",
+                                      batch_size=1)
+
+        self.assertIn("Skipping 1 imported records", output)
+        self.assertEqual(
+            list(Recepie.objects.order_by("id").values_list("title",
+                                                            flat=True)),
+            ["Second", "Third"],
+        )
+        self.assertEqual(
+            ImportCheckpoint.objects.get(name="nightly").records,
+            3,
+        )
+        self.import_recepies(path, checkpoint="nightly")
+        self.assertEqual(Recepie.objects.count(), 2)
+
+    def test_import_checkpoint_rolled_back_with_batch(self):
+        """Test a batch that fails leaves the checkpoint before it"""
+        path = self.write("recepies.ndjson", "".join(
+            json.dumps({"title": title, "prep_time": 5, "price": 1}) + "\n"
+            for title in ("First", "Second")
+        ))
+
+        with patch(
+            "core.management.commands.import_recepies.collection_changed",
+            side_effect=[None, RuntimeError],
+        ), self.assertRaises(RuntimeError):
+            self.import_recepies(path, checkpoint="nightly", batch_size=1)
+
+        self.assertEqual(
+            ImportCheckpoint.objects.get(name="nightly").records,
+            1,
+        )
+        self.assertEqual(
+            list(Recepie.objects.values_list("title", flat=True)),
+            ["First"],
+        )
+
+    def test_import_names_folded_by_database(self):
+        """Test names are matched the way the database lower cases them"""
+        Tag.objects.create(user=self.user, name="İstanbul")
+        path = self.write("recepies.ndjson", json.dumps({
+            "title": "Kebab", "prep_time": 5, "price": 1,
+            "tags": ["istanbul", "ΣΑΣ", "σασ"],
+        }) + "\n")
+
+        self.import_recepies(path)
+
+        recepie = Recepie.objects.get(title="Kebab")
+        self.assertEqual(
+            sorted(recepie.tags.values_list("name", flat=True)),
+            ["İstanbul", "ΣΑΣ"],
+        )
+
+    def test_import_invalid_record(self):
+        """Test invalid records stop the import with their number"""
+        path = self.write("recepies.ndjson", "\n".join((
+            json.dumps({"title": "Kheer", "prep_time": 5, "price": 1}),
+            json.dumps({"title": "Dal", "prep_time": 5, "price": "cheap"}),
+        )))
+
+        with self.assertRaisesRegex(CommandError, "Record 2: price"):
+            self.import_recepies(path)
+        self.assertFalse(Recepie.objects.exists())
@@ -0,0 +1,136 @@
+import tempfile
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.instrumentation import InstrumentationMiddleware, metrics
+from core.models import Recepie
+
+METRICS_URL = reverse("metrics")
+RECEPIES_URL = reverse("recepie:recepie-list")
+
+
+def sampled(**options):
+    return override_settings(INSTRUMENTATION={"SAMPLE_RATE": 1, **options})
+
+
+def get_metrics(client) -> str:
+    """Return the metrics body, served without a token in DEBUG"""
+    with override_settings(DEBUG=True):
+        return client.get(METRICS_URL).content.decode()
+
+
+class InstrumentationTests(TestCase):
+    """Test request instrumentation and the metrics endpoint"""
+
+    def setUp(self) -> None:
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "instrumented@test.com",
+            "testpass@123",
+        )
+        self.client.force_authenticate(self.user)
+        self.recepie = Recepie.objects.create(
+            user=self.user,
+            title="Kheer",
+            prep_time=30,
+            price=5,
+        )
+
+    def test_not_sampled(self):
+        """Test requests are not recorded with sampling off"""
+        res = self.client.get(RECEPIES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn("Server-Timing", res)
+        self.assertNotIn("RecepieViewSet", get_metrics(self.client))
+
+    @sampled()
+    def test_server_timing(self):
+        """Test sampled responses report their queries and phases"""
+        res = self.client.get(RECEPIES_URL)
+
+        timing = dict(
+            entry.split(";", 1) for entry in res["Server-Timing"].split(", ")
+        )
+        self.assertEqual(list(timing),
+                         ["sql", "serialize", "render", "total"])
+        self.assertRegex(timing["sql"], r'^dur=[\d.]+;desc="\d+ queries"$')
+
+        body = get_metrics(self.client)
+        labels = 'view="RecepieViewSet",action="list"'
+        self.assertIn(f"api_request_queries_count{{{labels}}} 1", body)
+        self.assertIn(
+            f'api_request_render_duration_seconds_bucket{{{labels},'
+            f'le="+Inf"}} 1',
+            body,
+        )
+
+    @sampled()
+    def test_upload_image_labelled(self):
+        """Test image uploads are recorded as their own action"""
+        url = reverse("recepie:recepie-upload-image", args=[self.recepie.id])
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root), \
+                tempfile.NamedTemporaryFile(suffix=".jpg") as image:
+            Image.new("RGB", (10, 10)).save(image, format="JPEG")
+            image.seek(0)
+            res = self.client.post(url, {"image": image}, format="multipart")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            'api_request_duration_seconds_count{view="RecepieViewSet",'
+            'action="upload_image"} 1',
+            get_metrics(self.client),
+        )
+
+    @sampled(DUPLICATE_QUERY_THRESHOLD=3)
+    def test_duplicate_queries_flagged(self):
+        """Test a statement repeated in one request is logged and counted"""
+        def view(request):
+            for recepie_id in range(3):
+                Recepie.objects.filter(pk=recepie_id).exists()
+            return HttpResponse()
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = InstrumentationMiddleware(get_response)
+        with self.assertLogs("core.instrumentation", "WARNING") as logs:
+            middleware(RequestFactory().get("/"))
+
+        self.assertIn("view.get ran the same query 3 times", logs.output[0])
+        self.assertIn(
+            'api_request_duplicate_queries_total{view="view",action="get"} 1',
+            metrics.expose(),
+        )
+
+    def test_metrics_hidden_without_token(self):
+        """Test metrics need a token unless DEBUG is on"""
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(INSTRUMENTATION={"METRICS_TOKEN": "secret"})
+    def test_metrics_token(self):
+        """Test scrapes must send the configured bearer token"""
+        self.assertEqual(self.client.get(METRICS_URL).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION="Bearer secret")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn("# TYPE api_request_duration_seconds histogram",
+                      res.content.decode())
+        self.assertIn("# TYPE api_token_cache_hits_total counter",
+                      res.content.decode())
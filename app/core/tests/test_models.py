@@ -1,9 +1,14 @@
+import hashlib
+import tempfile
+from pathlib import Path
 from unittest.mock import patch
 
+from django.core.files.base import ContentFile
+from django.db import IntegrityError
 from django.test import TestCase
 
 from django.contrib.auth import get_user_model
-from .. import models
+from .. import models, storage, synthetic
 
 
 def sample_user(email="testsample@test.com",
@@ -80,3 +85,189 @@ class ModelTests(TestCase):
         file_path = models.recepie_image_file_path(None, "myimage.jpg")
         exp_path = f"uploads/recepie/{uuid}.jpg"
         self.assertEqual(file_path, exp_path)
+
+    def test_synthetic_seed(self):
+        """Test seeding a synthetic dataset links recepies per user"""
+        users = synthetic.seed(
+            users=2,
+            tags=4,
+            ingredients=6,
+            recepies=5,
+            tags_per_recepie=2,
+            ingredients_per_recepie=3,
+            random_seed=1,
+        )
+        self.assertEqual(len(users), 2)
+        for user in users:
+            recepies = models.Recepie.objects.filter(user=user)
+            self.assertEqual(recepies.count(), 5)
+            for recepie in recepies:
+                self.assertEqual(
+                    set(recepie.tags.values_list("user", flat=True)),
+                    {user.pk},
+                )
+                self.assertEqual(recepie.tags.count(), 2)
+                self.assertEqual(recepie.ingredients.count(), 3)
+
+    def test_get_or_create_by_names(self):
+        """Test names are normalized and deduped case-insensitively"""
+        user = sample_user()
+        salt = models.Ingredient.objects.create(user=user, name="Salt")
+
+        objects, created = models.Ingredient.objects.get_or_create_by_names(
+            user,
+            [" salt", "Olive   oil", "OLIVE OIL", ""],
+        )
+
+        self.assertEqual(created, 1)
+        self.assertEqual([obj.name for obj in objects], ["Salt", "Olive oil"])
+        self.assertEqual(objects[0], salt)
+
+    def test_get_or_create_by_non_ascii_names(self):
+        """Test names Python and the database fold differently resolve"""
+        user = sample_user()
+        names = ["ΣΑΣ", "İstanbul"]
+
+        objects, created = models.Tag.objects.get_or_create_by_names(
+            user,
+            names,
+        )
+        again, created_again = models.Tag.objects.get_or_create_by_names(
+            user,
+            names,
+        )
+
+        self.assertEqual(created, 2)
+        self.assertEqual([obj.name for obj in objects], names)
+        self.assertEqual(created_again, 0)
+        self.assertEqual(again, objects)
+
+    def test_tag_name_unique_per_user(self):
+        """Test a user cannot have two tags with the same name in any case"""
+        user = sample_user()
+        models.Tag.objects.create(user=user, name="Vegan")
+        models.Tag.objects.create(
+            user=sample_user(email="other@test.com"),
+            name="Vegan",
+        )
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(user=user, name="vegan")
+
+    def test_recepie_search_vector_updated(self):
+        """Test search vectors follow title, ingredient and tag changes"""
+        user = sample_user()
+        with self.captureOnCommitCallbacks(execute=True):
+            recepie = models.Recepie.objects.create(
+                user=user,
+                title="Tomato Soup",
+                price=5.0,
+                prep_time=5,
+            )
+            tag = models.Tag.objects.create(user=user, name="Vegan")
+            ingredient = models.Ingredient.objects.create(
+                user=user,
+                name="Basil",
+            )
+
+        def matches(word):
+            return models.Recepie.objects.filter(
+                pk=recepie.pk,
+                search_vector=word,
+            ).exists()
+
+        self.assertTrue(matches("tomato"))
+        with self.captureOnCommitCallbacks(execute=True):
+            recepie.tags.add(tag)
+            ingredient.recepie_set.add(recepie)
+        self.assertTrue(matches("vegan"))
+        self.assertTrue(matches("basil"))
+
+        tag.name = "Spicy"
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+        self.assertFalse(matches("vegan"))
+        self.assertTrue(matches("spicy"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.delete()
+        self.assertFalse(matches("basil"))
+
+        recepie.title = "Lentil Soup"
+        with self.captureOnCommitCallbacks(execute=True):
+            recepie.save()
+        self.assertFalse(matches("tomato"))
+        self.assertTrue(matches("lentil"))
+
+    def test_recepie_reindexed_once(self):
+        """Test a recepie is reindexed once however often it changed"""
+        user = sample_user()
+        tag = models.Tag.objects.create(user=user, name="Vegan")
+        with self.captureOnCommitCallbacks() as callbacks:
+            recepie = models.Recepie.objects.create(
+                user=user,
+                title="Tomato Soup",
+                price=5.0,
+                prep_time=5,
+            )
+            recepie.tags.add(tag)
+            recepie.title = "Lentil Soup"
+            recepie.save()
+
+        with self.assertNumQueries(1):
+            for callback in callbacks:
+                callback()
+        self.assertTrue(models.Recepie.objects.filter(
+            search_vector="vegan",
+        ).exists())
+
+    def test_image_blob_reference_counts(self):
+        """Test recepies count references to the images they use"""
+        user = sample_user()
+        first = models.Recepie.objects.create(
+            user=user, title="Dal", prep_time=5, price=5.00,
+            image="uploads/recepie/aa/a.jpg",
+        )
+        second = models.Recepie.objects.create(
+            user=user, title="Rice", prep_time=5, price=5.00,
+            image="uploads/recepie/aa/a.jpg",
+        )
+
+        def ref_counts():
+            return dict(
+                models.ImageBlob.objects.values_list("name", "ref_count")
+            )
+
+        self.assertEqual(ref_counts(), {"uploads/recepie/aa/a.jpg": 2})
+
+        second = models.Recepie.objects.get(pk=second.pk)
+        second.image = "uploads/recepie/bb/b.jpg"
+        second.save()
+        second.title = "Fried rice"
+        second.save()
+        self.assertEqual(ref_counts(), {
+            "uploads/recepie/aa/a.jpg": 1,
+            "uploads/recepie/bb/b.jpg": 1,
+        })
+
+        first.delete()
+        models.Recepie.objects.filter(pk=second.pk).delete()
+        self.assertEqual(ref_counts(), {
+            "uploads/recepie/aa/a.jpg": 0,
+            "uploads/recepie/bb/b.jpg": 0,
+        })
+
+    def test_content_addressed_storage(self):
+        """Test identical content is stored once under its hash"""
+        with tempfile.TemporaryDirectory() as location:
+            store = storage.ContentAddressedStorage(location=location)
+            first = store.save("uploads/a.JPG", ContentFile(b"dal"))
+            second = store.save("uploads/b.jpg", ContentFile(b"dal"))
+            other = store.save("uploads/c.jpg", ContentFile(b"rice"))
+
+            digest = hashlib.sha256(b"dal").hexdigest()
+            self.assertEqual(first, f"uploads/{digest[:2]}/{digest}.jpg")
+            self.assertEqual(second, first)
+            self.assertNotEqual(other, first)
+            files = [path for path in Path(location).rglob("*")
+                     if path.is_file()]
+            self.assertEqual(len(files), 2)
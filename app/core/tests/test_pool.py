@@ -0,0 +1,122 @@
+from unittest.mock import patch
+
+from django.db import connection
+from django.db.utils import OperationalError
+from django.test import TestCase
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from core.backends.postgresql_pool import base
+
+
+class FakeConnection:
+    closed = 0
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(TestCase):
+    """Test checking connections out of a pool"""
+
+    def setUp(self) -> None:
+        self.pool = base.ConnectionPool(size=2, timeout=0.05,
+                                        health_checks=False)
+
+    def test_checkout_timeout(self):
+        """Test a checkout fails after POOL_TIMEOUT when none is free"""
+        held = [self.pool.get(FakeConnection) for _ in range(2)]
+
+        with self.assertRaisesRegex(OperationalError, "within 0.05s"):
+            self.pool.get(FakeConnection)
+
+        self.pool.put(held.pop())
+        self.assertIsInstance(self.pool.get(FakeConnection), FakeConnection)
+
+    def test_size_bound(self):
+        """Test the pool never opens more than its size"""
+        for _ in range(3):
+            held = [self.pool.get(FakeConnection) for _ in range(2)]
+            with self.assertRaises(OperationalError):
+                self.pool.get(FakeConnection)
+            for conn in held:
+                self.pool.put(conn)
+
+        self.assertEqual(self.pool.opened, 2)
+        self.assertEqual(len(self.pool.idle), 2)
+
+
+class PooledDatabaseWrapperTests(TestCase):
+    """Test the pooled backend's connections to the test database"""
+
+    def setUp(self) -> None:
+        self.pool = base.ConnectionPool(size=2, timeout=0.05,
+                                        health_checks=True)
+
+    def get_wrapper(self):
+        """Return a backend connection to the test database on the pool"""
+        wrapper = base.DatabaseWrapper(
+            {**connection.settings_dict,
+             "ENGINE": "core.backends.postgresql_pool"},
+            alias=connection.alias,
+        )
+        patcher = patch.object(base, "get_pool", return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.pool.close)
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def backend_pid(self, wrapper) -> int:
+        with wrapper.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            return cursor.fetchone()[0]
+
+    def terminate(self, pid):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s)", [pid])
+
+    def test_rollback_on_return(self):
+        """Test a connection left in a transaction is rolled back"""
+        wrapper = self.get_wrapper()
+        wrapper.connect()
+        wrapper.connection.autocommit = False
+        with wrapper.connection.cursor() as cursor:
+            cursor.execute("CREATE TEMPORARY TABLE pooled (id int)")
+
+        conn = wrapper.connection
+        wrapper.close()
+
+        self.assertEqual(list(self.pool.idle), [conn])
+        self.assertEqual(conn.get_transaction_status(),
+                         TRANSACTION_STATUS_IDLE)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pooled')")
+            self.assertIsNone(cursor.fetchone()[0])
+
+    def test_discard_failed_connection(self):
+        """Test a connection whose rollback fails is closed, not reused"""
+        wrapper = self.get_wrapper()
+        wrapper.connect()
+        wrapper.connection.autocommit = False
+        self.terminate(self.backend_pid(wrapper))
+
+        conn = wrapper.connection
+        wrapper.close()
+
+        self.assertTrue(conn.closed)
+        self.assertEqual(len(self.pool.idle), 0)
+        self.assertEqual(self.pool.opened, 1)
+        wrapper.connect()
+        self.assertEqual(self.pool.opened, 2)
+
+    def test_health_check_replaces_dropped(self):
+        """Test an idle connection the server dropped is replaced"""
+        wrapper = self.get_wrapper()
+        pid = self.backend_pid(wrapper)
+        conn = wrapper.connection
+        wrapper.close()
+        self.terminate(pid)
+
+        self.assertNotEqual(self.backend_pid(wrapper), pid)
+        self.assertTrue(conn.closed)
+        self.assertEqual(self.pool.opened, 2)
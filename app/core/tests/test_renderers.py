@@ -0,0 +1,94 @@
+import datetime
+import io
+import uuid
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+from django.utils.translation import gettext_lazy
+
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+
+from core import renderers as core_renderers
+from core.parsers import JSONParser
+from core.renderers import JSONRenderer
+
+BACKENDS = ("orjson", "json")
+
+PAYLOADS = (
+    {"id": 1, "title": "Kheer", "price": "5.00", "tags": [1, 2]},
+    OrderedDict(next=None, previous="http://testserver/?cursor=a",
+                results=[{"name": "Crème brûlée\u2028\U0001f370"}]),
+    {"price": Decimal("12.50"), "ratio": 0.1, "nested": [[1.5, None]]},
+    {1: "int key", "when": datetime.datetime(2021, 5, 1, 12, 30,
+                                             tzinfo=datetime.timezone.utc)},
+    {"day": datetime.date(2021, 5, 1), "id": uuid.UUID(int=1),
+     "label": gettext_lazy("Tag"), "big": 2 ** 70},
+    [],
+)
+
+
+class JSONRendererTests(SimpleTestCase):
+    """Test the API JSON renderer and parser"""
+
+    def test_render_matches_drf(self):
+        """Test both backends render exactly what DRF's renderer does"""
+        expected = renderers.JSONRenderer()
+        for backend in BACKENDS:
+            with override_settings(JSON_BACKEND=backend):
+                for data in PAYLOADS:
+                    with self.subTest(backend=backend, data=data):
+                        self.assertEqual(
+                            JSONRenderer().render(data, "application/json"),
+                            expected.render(data, "application/json"),
+                        )
+
+    def test_indented_render_matches_drf(self):
+        """Test indented output is left to DRF's renderer"""
+        media_type = "application/json; indent=2"
+
+        self.assertEqual(
+            JSONRenderer().render(PAYLOADS[0], media_type),
+            renderers.JSONRenderer().render(PAYLOADS[0], media_type),
+        )
+
+    def test_render_chunks(self):
+        """Test chunked output joins up to the rendered output"""
+        data = {"next": None, "results": [{"id": i} for i in range(250)]}
+        renderer = JSONRenderer()
+
+        chunks = list(renderer.render_chunks(data))
+
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(b"".join(chunks), renderer.render(data))
+        self.assertEqual(
+            b"".join(renderer.render_chunks({"results": iter([1, 2])})),
+            b'{"results":[1,2]}',
+        )
+
+    def test_unknown_backend(self):
+        """Test a misspelt backend is reported"""
+        with override_settings(JSON_BACKEND="ujson"):
+            with self.assertRaises(ImproperlyConfigured):
+                core_renderers.dumps({})
+
+    def test_parse_matches_drf(self):
+        """Test both backends parse like DRF, errors included"""
+        expected = parsers.JSONParser()
+        for backend in BACKENDS:
+            with override_settings(JSON_BACKEND=backend):
+                for body in (b'{"title": "Kheer", "price": 5.5}',
+                             '{"name": "Crème"}'.encode()):
+                    self.assertEqual(
+                        JSONParser().parse(io.BytesIO(body)),
+                        expected.parse(io.BytesIO(body)),
+                    )
+                for body in (b'{"title": ', b'{"price": NaN}'):
+                    with self.assertRaises(ParseError) as error:
+                        JSONParser().parse(io.BytesIO(body))
+                    with self.assertRaises(ParseError) as drf_error:
+                        expected.parse(io.BytesIO(body))
+                    self.assertEqual(str(error.exception),
+                                     str(drf_error.exception))
@@ -0,0 +1,111 @@
+from contextlib import ExitStack
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recepie, Tag
+from core.replicas import ReplicaRouter, reading_from
+
+RECEPIES_URL = reverse("recepie:recepie-list")
+TAGS_URL = reverse("recepie:tag-list")
+
+
+def routed(**options):
+    return override_settings(REPLICA_ROUTING={"ALIAS": "replica", **options})
+
+
+@routed()
+class ReplicaRoutingTests(TransactionTestCase):
+    """Test safe requests read from the replica unless the user wrote"""
+    databases = {"default", "replica"}
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "replica@test.com",
+            "testpass@123",
+        )
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, request):
+        """Return the response and the number of queries per alias"""
+        counts = dict.fromkeys(connections, 0)
+
+        def counter(alias):
+            def wrapper(execute, sql, params, many, context):
+                counts[alias] += 1
+                return execute(sql, params, many, context)
+            return wrapper
+
+        with ExitStack() as stack:
+            for alias in counts:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(counter(alias))
+                )
+            response = request()
+        return response, counts
+
+    def test_reads_from_replica(self):
+        """Test list and retrieve run their queries on the replica"""
+        recepie = Recepie.objects.create(
+            user=self.user, title="Poha", prep_time=10, price=2,
+        )
+        detail_url = reverse("recepie:recepie-detail", args=[recepie.id])
+        # The pin left by creating it has expired
+        cache.clear()
+
+        for url in (RECEPIES_URL, detail_url, TAGS_URL):
+            res, counts = self.count_queries(lambda: self.client.get(url))
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(counts["default"], 0)
+            self.assertGreater(counts["replica"], 0)
+
+    def test_pinned_after_write(self):
+        """Test a user's reads stay on the primary after their write"""
+        other = APIClient()
+        other.force_authenticate(get_user_model().objects.create_user(
+            "other@test.com",
+            "testpass@123",
+        ))
+
+        res, counts = self.count_queries(
+            lambda: self.client.post(TAGS_URL, {"name": "Snack"})
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(counts["replica"], 0)
+
+        res, counts = self.count_queries(lambda: self.client.get(TAGS_URL))
+        self.assertEqual(res.data["results"][0]["name"], "Snack")
+        self.assertEqual(counts["replica"], 0)
+
+        res, counts = self.count_queries(lambda: other.get(TAGS_URL))
+        self.assertEqual(counts["default"], 0)
+
+    @routed(PIN_SECONDS=0)
+    def test_pinning_disabled(self):
+        """Test reads go to the replica right after a write without pins"""
+        self.client.post(TAGS_URL, {"name": "Snack"})
+
+        res, counts = self.count_queries(lambda: self.client.get(TAGS_URL))
+
+        self.assertEqual(counts["default"], 0)
+
+    def test_router(self):
+        """Test writes and reads in a transaction use the primary"""
+        router = ReplicaRouter()
+
+        self.assertEqual(router.db_for_read(Tag), "default")
+        with reading_from("replica"):
+            self.assertEqual(router.db_for_read(Tag), "replica")
+            self.assertEqual(router.db_for_write(Tag), "default")
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Tag), "default")
+        self.assertFalse(router.allow_migrate("replica", "core"))
@@ -0,0 +1,44 @@
+"""Gunicorn configuration for serving the API in production
+
+Run from the app directory with `gunicorn -c gunicorn.conf.py`. Settings
+come from the environment:
+
+- SERVER_INTERFACE: `wsgi` (the default) or `asgi`, which serves
+  `app.asgi` with uvicorn workers and turns ASYNC_VIEWS on unless it is
+  set, so the async recepie views are used unless ASYNC_VIEWS is 0
+- GUNICORN_BIND: address to listen on, `0.0.0.0:8000` by default
+- WEB_CONCURRENCY: worker processes, twice the CPUs plus one by default
+- GUNICORN_THREADS: threads per WSGI worker, above 1 uses gthread workers
+- GUNICORN_TIMEOUT, GUNICORN_KEEPALIVE: seconds
+- GUNICORN_MAX_REQUESTS: requests before a worker is replaced, 0 never
+
+Each worker process keeps its own database connections, at most one per
+thread, or DB_POOL_SIZE with the pool, so Postgres needs
+max_connections above WEB_CONCURRENCY times that.
+"""
+import multiprocessing
+import os
+
+interface = os.environ.get("SERVER_INTERFACE", "wsgi")
+if interface not in ("wsgi", "asgi"):
+    raise ValueError(f"Unknown SERVER_INTERFACE {interface!r}.")
+
+wsgi_app = f"app.{interface}:application"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get(
+    "WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1
+))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+if interface == "asgi":
+    worker_class = "uvicorn.workers.UvicornWorker"
+    os.environ.setdefault("ASYNC_VIEWS", "1")
+elif threads > 1:
+    worker_class = "gthread"
+else:
+    worker_class = "sync"
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
@@ -0,0 +1,140 @@
+"""Cache per-user aggregates over recepies
+
+Tag and ingredient recepie counts and recepie facets are computed with a
+couple of aggregated queries each. Both caches are off unless their
+timeout setting is set. Entries are keyed by the user's collection
+version, read before anything is computed, so a write committing moves
+readers on to new entries and older ones simply expire.
+"""
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import CharField, Count, Q, Value
+
+from core.models import Ingredient, Recepie, Tag
+
+RELATED_FIELDS = {
+    Tag: "tags",
+    Ingredient: "ingredients",
+}
+
+# Lower bounds of the facet buckets, the last bucket is open ended
+PRICE_BUCKETS = tuple(
+    Decimal(bound) for bound in ("0.00", "5.00", "10.00", "20.00", "50.00")
+)
+PREP_TIME_BUCKETS = (0, 15, 30, 60, 120)
+
+
+def counts_cache_key(model, user_id, version) -> str:
+    return f"recepie-attr-counts:{model._meta.model_name}:{user_id}:{version}"
+
+
+def count_recepies(model, user) -> dict:
+    """Return how many recepies use each of the user's objects"""
+    through = getattr(Recepie, RELATED_FIELDS[model]).through
+    column = through._meta.get_field(model._meta.model_name).attname
+    rows = through.objects.filter(
+        recepie__user=user
+    ).values(column).annotate(total=Count("*")).values_list(column, "total")
+    return dict(rows)
+
+
+def get_counts_timeout():
+    return getattr(settings, "RECEPIE_ATTR_COUNTS_CACHE_TIMEOUT", 0)
+
+
+def get_facets_timeout():
+    return getattr(settings, "RECEPIE_FACETS_CACHE_TIMEOUT", 0)
+
+
+def get_recepie_counts(model, user, version):
+    """Return the cached counts for a user, or None if caching is off"""
+    timeout = get_counts_timeout()
+    if not timeout:
+        return None
+    key = counts_cache_key(model, user.pk, version)
+    counts = cache.get(key)
+    if counts is None:
+        counts = count_recepies(model, user)
+        cache.set(key, counts, timeout)
+    return counts
+
+
+def get_buckets(bounds):
+    return list(zip(bounds, bounds[1:] + (None,)))
+
+
+def format_bound(bound):
+    """Render decimal bounds as strings, the way prices are serialized"""
+    return str(bound) if isinstance(bound, Decimal) else bound
+
+
+def bucket_filter(field, low, high) -> Q:
+    condition = Q(**{f"{field}__gte": low})
+    if high is not None:
+        condition &= Q(**{f"{field}__lt": high})
+    return condition
+
+
+def compute_facets(recepies) -> dict:
+    """Return tag, ingredient, price and prep time facets of recepies
+
+    Bucket counts are a single query of FILTER aggregates, and tag and
+    ingredient counts a single UNION of two GROUP BY queries.
+    """
+    buckets = {
+        "price": get_buckets(PRICE_BUCKETS),
+        "prep_time": get_buckets(PREP_TIME_BUCKETS),
+    }
+    aggregates = {"total": Count("pk")}
+    for field, ranges in buckets.items():
+        for i, (low, high) in enumerate(ranges):
+            aggregates[f"{field}_{i}"] = Count(
+                "pk",
+                filter=bucket_filter(field, low, high),
+            )
+    totals = recepies.order_by().aggregate(**aggregates)
+
+    ids = recepies.order_by().values("pk")
+    related = None
+    for model, field in RELATED_FIELDS.items():
+        rows = model.objects.filter(recepie__in=ids).annotate(
+            kind=Value(field, output_field=CharField()),
+            count=Count("recepie"),
+        ).values_list("kind", "id", "name", "count")
+        related = rows if related is None else related.union(rows, all=True)
+
+    facets = {"total": totals["total"]}
+    facets.update({field: [] for field in RELATED_FIELDS.values()})
+    for kind, pk, name, count in related:
+        facets[kind].append({"id": pk, "name": name, "count": count})
+    for field in RELATED_FIELDS.values():
+        facets[field].sort(key=lambda item: (-item["count"], item["name"]))
+    for field, ranges in buckets.items():
+        facets[field] = [
+            {
+                "min": format_bound(low),
+                "max": format_bound(high),
+                "count": totals[f"{field}_{i}"],
+            }
+            for i, (low, high) in enumerate(ranges)
+        ]
+    return facets
+
+
+def get_recepie_facets(user, version, recepies, params):
+    """Return facets of the filtered recepies, cached per user and filter"""
+    timeout = get_facets_timeout()
+    if not timeout:
+        return compute_facets(recepies)
+    digest = hashlib.md5(
+        repr(sorted(params.lists())).encode()
+    ).hexdigest()
+    key = f"recepie-facets:{user.pk}:{version}:{digest}"
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(recepies)
+        cache.set(key, facets, timeout)
+    return facets
@@ -0,0 +1,82 @@
+"""Async recepie list, retrieve and create views for ASGI servers
+
+Django 3.2 has no async ORM, and DRF views are sync. These views
+authenticate the request's token in the event loop, answering requests
+without valid credentials there, and then run `RecepieViewSet` and render
+its response in a worker thread with `database_sync_to_async()`. That
+thread is held for all of the view's queries, serialization and
+rendering, so each request in a view still takes a thread; the views of
+concurrent requests only run in parallel instead of one at a time in
+Django's thread for sync views. bench_concurrency measures no throughput
+gain over sync views from this.
+
+They are routed in place of the viewset's list and detail URLs when
+ASYNC_VIEWS is set, which should only be under ASGI: a WSGI server would
+start an event loop for every request to run them.
+"""
+from django.http import JsonResponse
+
+from rest_framework import exceptions
+
+from core.asynchronous import database_sync_to_async
+from core.instrumentation import timed
+from user.authentication import authenticate_async
+
+from .views import RecepieViewSet
+
+
+def run_view(view, request, *args, **kwargs):
+    """Call a DRF view and render its response"""
+    response = view(request, *args, **kwargs)
+    if hasattr(response, "render"):
+        with timed("render"):
+            response.render()
+    return response
+
+
+def unauthorized(exc) -> JsonResponse:
+    """Answer like DRF does for a failed token authentication"""
+    response = JsonResponse({"detail": exc.detail}, status=exc.status_code)
+    response["WWW-Authenticate"] = "Token"
+    return response
+
+
+def as_async_view(view):
+    """Return an async view running a DRF view in a worker thread
+
+    It is CSRF exempt like the view, and carries its class and actions so
+    the instrumentation labels it the same.
+    """
+    run = database_sync_to_async(run_view)
+
+    async def async_view(request, *args, **kwargs):
+        try:
+            credentials = await authenticate_async(request)
+        except exceptions.AuthenticationFailed as exc:
+            return unauthorized(exc)
+        if credentials is None:
+            return unauthorized(exceptions.NotAuthenticated())
+        return await run(view, request, *args, **kwargs)
+
+    async_view.csrf_exempt = True
+    async_view.cls = view.cls
+    async_view.actions = view.actions
+    async_view.initkwargs = view.initkwargs
+    return async_view
+
+
+recepie_list = as_async_view(RecepieViewSet.as_view(
+    {"get": "list", "post": "create"},
+    basename="recepie",
+    detail=False,
+))
+recepie_detail = as_async_view(RecepieViewSet.as_view(
+    {
+        "get": "retrieve",
+        "put": "update",
+        "patch": "partial_update",
+        "delete": "destroy",
+    },
+    basename="recepie",
+    detail=True,
+))
@@ -0,0 +1,154 @@
+"""Conditional GETs and response caching for the recepie API
+
+Every write to a user's recepies, tags or ingredients bumps their
+`CollectionVersion`. Read responses carry an ETag derived from that
+version and the request, so a client polling an unchanged collection
+gets a 304 after a single primary key lookup, before any queryset is
+built or anything is serialized.
+
+The same (user, version, path, Accept) key addresses rendered responses
+in the RECEPIE_RESPONSE_CACHE_ALIAS cache when
+RECEPIE_RESPONSE_CACHE_TIMEOUT is set, streamed ones once their last
+chunk has been sent. A write moves the user on to a new version, so
+entries for older versions are never read again and simply expire.
+
+Bulk deletes suppress the bump of every object they delete and record
+the change once afterwards. The version of a deleted user is dropped
+after the cascade of their objects.
+"""
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from core.models import CollectionVersion
+from core.replicas import pin_primary
+
+
+def get_response_cache_timeout():
+    return getattr(settings, "RECEPIE_RESPONSE_CACHE_TIMEOUT", 0)
+
+
+def get_response_cache():
+    return caches[getattr(settings, "RECEPIE_RESPONSE_CACHE_ALIAS",
+                          "default")]
+
+
+_suppressed = ContextVar("suppressed_collection_changes",
+                         default=frozenset())
+
+
+def collection_changed(user_id):
+    """Record that a user's recepies, tags or ingredients changed"""
+    if user_id in _suppressed.get():
+        return
+    CollectionVersion.objects.bump(user_id)
+    pin_primary(user_id)
+
+
+@contextmanager
+def collection_changes_suppressed(user_id):
+    """Skip recording the changes made to a user's collections in the block"""
+    token = _suppressed.set(_suppressed.get() | {user_id})
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+class ConditionalResponseMixin:
+    """Answer conditional GETs from the user's collection version
+
+    `list` runs through `conditional_read()`, and other read actions can
+    do the same. Their responses get the ETag and Last-Modified
+    validators added.
+    """
+
+    def get_version_etag(self, request, version) -> str:
+        """Return the ETag of a response for a version of the collections"""
+        representation = "\n".join((
+            request.get_full_path(),
+            request.META.get("HTTP_ACCEPT", ""),
+            str(version),
+        ))
+        digest = hashlib.md5(representation.encode()).hexdigest()
+        return f'"{request.user.pk}-{version}-{digest}"'
+
+    def not_modified(self, request):
+        """Return a 304 when the client's copy is still current"""
+        version, updated_at = CollectionVersion.objects.get_stamp(
+            request.user.pk
+        )
+        self.collection_version = version
+        self.version_etag = self.get_version_etag(request, version)
+        self.version_last_modified = (
+            int(updated_at.timestamp()) if updated_at else None
+        )
+        return get_conditional_response(
+            request,
+            etag=self.version_etag,
+            last_modified=self.version_last_modified,
+        )
+
+    def conditional_read(self, request, handler, *args, **kwargs):
+        """Answer a read with a 304 or a cached response, else run it"""
+        response = self.not_modified(request)
+        if response is not None:
+            return response
+        timeout = get_response_cache_timeout()
+        if not timeout:
+            return handler(request, *args, **kwargs)
+
+        cache = get_response_cache()
+        key = "recepie-response:" + self.version_etag.strip('"')
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        if response.streaming:
+            response.streaming_content = self.cache_chunks(
+                cache, key, timeout,
+                response.streaming_content, response["Content-Type"],
+            )
+        else:
+            response.add_post_render_callback(lambda response: cache.set(
+                key,
+                (response.content, response["Content-Type"]),
+                timeout,
+            ))
+        return response
+
+    def cache_chunks(self, cache, key, timeout, content, content_type):
+        """Pass a streamed body through, caching it once it is complete"""
+        chunks = []
+        for chunk in content:
+            chunks.append(chunk)
+            yield chunk
+        cache.set(key, (b"".join(chunks), content_type), timeout)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_read(request, super().list, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        etag = getattr(self, "version_etag", None)
+        if etag and response.status_code in (200, 304):
+            response["ETag"] = etag
+            if self.version_last_modified is not None:
+                response["Last-Modified"] = http_date(
+                    self.version_last_modified
+                )
+            response["Cache-Control"] = "private, no-cache"
+            patch_vary_headers(response, ("Accept", "Authorization"))
+        return response
@@ -0,0 +1,111 @@
+"""Stream a user's recepies out as NDJSON or CSV
+
+Recepies are read through a server-side cursor with
+`iterator(chunk_size=...)` and rendered a chunk at a time by the detail
+read serializer, with the chunk's ingredients and tags loaded in one
+query per M2M field. Only one chunk of rows and its encoded output are
+held at a time, whatever the size of the collection.
+
+NDJSON lines are the recepie detail representation. CSV rows have the
+same columns, with ingredient and tag names joined by SEPARATOR.
+"""
+import csv
+import io
+from itertools import islice
+
+from django.conf import settings
+
+from rest_framework import renderers
+
+from core.renderers import dumps
+
+from .readers import RecepieDetailReadSerializer
+
+SEPARATOR = "|"
+# Records rendered at a time when the data is not a chunked iterator
+BATCH_SIZE = 100
+
+
+def get_chunk_size() -> int:
+    return getattr(settings, "RECEPIE_EXPORT_CHUNK_SIZE", 2000)
+
+
+def iter_batches(records, size):
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_recepies(queryset, fields, chunk_size=None):
+    """Yield the detail representation of every recepie in id order"""
+    chunk_size = chunk_size or get_chunk_size()
+    rows = queryset.order_by("id").values(*fields).iterator(
+        chunk_size=chunk_size
+    )
+    for batch in iter_batches(rows, chunk_size):
+        yield from RecepieDetailReadSerializer(batch, many=True).data
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """Render records as newline delimited JSON"""
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return b"".join(self.render_chunks(
+            data if isinstance(data, list) else [data]
+        ))
+
+    def render_chunks(self, records):
+        """Yield the lines of a batch of records at a time"""
+        for batch in iter_batches(records, BATCH_SIZE):
+            yield b"".join(dumps(record) + b"\n" for record in batch)
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """Render records as CSV, with a header from the first record's keys
+
+    Nested lists become the names, or else the values, of their items
+    joined by SEPARATOR.
+    """
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return b"".join(self.render_chunks(
+            data if isinstance(data, list) else [data]
+        ))
+
+    def render_chunks(self, records):
+        """Yield the rows of a batch of records at a time"""
+        buffer = io.StringIO()
+        writer = None
+        for batch in iter_batches(records, BATCH_SIZE):
+            for record in batch:
+                if writer is None:
+                    writer = csv.writer(buffer)
+                    writer.writerow(record)
+                writer.writerow([self.format_value(value)
+                                 for value in record.values()])
+            yield buffer.getvalue().encode(self.charset)
+            buffer.seek(0)
+            buffer.truncate()
+
+    def format_value(self, value):
+        if value is None:
+            return ""
+        if isinstance(value, list):
+            return SEPARATOR.join(
+                str(item["name"] if isinstance(item, dict) else item)
+                for item in value
+            )
+        return value
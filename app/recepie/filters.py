@@ -0,0 +1,132 @@
+import re
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+)
+from django.db import connections
+from django.db.models import BigIntegerField, Exists, F, OuterRef, Q, Value
+from django.db.models.functions import Cast
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from core.models import SEARCH_CONFIG, Recepie
+
+
+def parse_ids(value, param):
+    """Parse a comma separated list of ids from a query parameter"""
+    try:
+        return sorted({int(pk) for pk in value.split(",") if pk.strip()})
+    except ValueError:
+        raise ValidationError({param: "Expected comma separated ids."})
+
+
+def parse_number(value, param, cast):
+    """Parse a non-negative number from a query parameter"""
+    try:
+        number = cast(value)
+        if number < 0 or number == Decimal("Infinity"):
+            raise ValueError(value)
+    except (ValueError, InvalidOperation):
+        raise ValidationError({param: "Expected a positive number."})
+    return number
+
+
+def related_exists(field, ids, match):
+    """Return EXISTS conditions matching recepies linked to the ids
+
+    With `match="any"` a single EXISTS with an IN list is enough; with
+    `match="all"` there is one EXISTS per id. Both avoid the row fan-out
+    and DISTINCT a join on the M2M table would need.
+    """
+    through = getattr(Recepie, field).through
+    column = through._meta.get_field(field[:-1]).attname
+    if match == "any":
+        return [Exists(through.objects.filter(
+            recepie=OuterRef("pk"),
+            **{f"{column}__in": ids},
+        ))]
+    return [
+        Exists(through.objects.filter(recepie=OuterRef("pk"), **{column: pk}))
+        for pk in ids
+    ]
+
+
+class RecepieFilterBackend(BaseFilterBackend):
+    """Filter recepies by tags, ingredients, price and preparation time
+
+    `?tags=1,2&ingredients=3` keeps recepies linked to any of the given
+    ids, or to all of them with `&match=all`. `?max_price=` and
+    `?max_prep_time=` bound the price and preparation time.
+    """
+    match_values = ("any", "all")
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        match = params.get("match", "any")
+        if match not in self.match_values:
+            raise ValidationError(
+                {"match": f"Expected one of {', '.join(self.match_values)}."}
+            )
+
+        conditions = []
+        for field in ("tags", "ingredients"):
+            if params.get(field):
+                ids = parse_ids(params[field], field)
+                conditions.extend(related_exists(field, ids, match))
+        if conditions:
+            queryset = queryset.filter(*conditions)
+
+        max_price = params.get("max_price")
+        if max_price:
+            max_price = parse_number(max_price, "max_price", Decimal)
+            queryset = queryset.filter(price__lte=max_price)
+
+        max_prep_time = params.get("max_prep_time")
+        if max_prep_time:
+            max_prep_time = parse_number(max_prep_time, "max_prep_time", int)
+            queryset = queryset.filter(prep_time__lte=max_prep_time)
+        return queryset
+
+
+@lru_cache(maxsize=None)
+def trigram_enabled(using) -> bool:
+    """Return whether the pg_trgm extension is installed on a database"""
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+class RecepieSearchFilter(BaseFilterBackend):
+    """Full-text search over recepie titles, ingredients and tags
+
+    `?search=` matches every word as a prefix against the indexed search
+    vector, widened to similar titles when pg_trgm is installed. Matches
+    are annotated with an integer `rank` the pagination orders by.
+    """
+    search_param = "search"
+    rank_scale = 1000000
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, "")
+        words = re.findall(r"\w+", text)
+        if not words:
+            return queryset
+
+        query = SearchQuery(
+            " & ".join(f"{word}:*" for word in words),
+            search_type="raw",
+            config=SEARCH_CONFIG,
+        )
+        condition = Q(search_vector=query)
+        rank = SearchRank(F("search_vector"), query)
+        if trigram_enabled(queryset.db):
+            condition |= Q(title__trigram_similar=text)
+            rank = rank + TrigramSimilarity("title", text)
+        return queryset.filter(condition).annotate(
+            rank=Cast(rank * Value(self.rank_scale), BigIntegerField())
+        )
@@ -0,0 +1,214 @@
+"""Re-encode uploaded recepie images and generate their variants
+
+Uploads are saved by the request thread as they arrive and processed in a
+pool of worker processes, so decoding and resizing never hold up a
+request. Workers only see filesystem paths and Pillow; the parent process
+records the outcome on the recepie once a job finishes.
+
+Stored files are never rewritten: the re-encoded original is stored under
+the digest of its own content, and the recepie moves over to it.
+
+Jobs only live in the pool, so those of a process that stops are lost and
+their recepies stay pending; the `process_images` command picks them up.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from core.storage import move_into_place, rehashed_name
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+FORMATS = {
+    "jpeg": ("JPEG", ".jpg"),
+    "webp": ("WEBP", ".webp"),
+}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_sizes() -> dict:
+    """Return the longest edge in pixels of each thumbnail size"""
+    return getattr(settings, "RECEPIE_IMAGE_SIZES", {
+        "small": 150,
+        "medium": 400,
+        "large": 1024,
+    })
+
+
+def variant_name(name, size, fmt) -> str:
+    """Return the storage name of one variant of an image"""
+    path = Path(name)
+    suffix = FORMATS[fmt][1]
+    if size == "original":
+        return str(path.with_suffix(suffix))
+    return str(path.with_name(f"{path.stem}_{size}").with_suffix(suffix))
+
+
+def variant_names(name) -> dict:
+    """Return the storage names of every variant of an image"""
+    variants = {
+        size: {fmt: variant_name(name, size, fmt) for fmt in FORMATS}
+        for size in get_sizes()
+    }
+    variants["original"] = {"webp": variant_name(name, "original", "webp")}
+    return variants
+
+
+def _save(image, path, fmt, quality):
+    """Write an image atomically so readers never see a partial file"""
+    tmp_path = f"{path}.tmp"
+    image.save(tmp_path, format=fmt, quality=quality, optimize=True)
+    os.replace(tmp_path, path)
+
+
+def file_digest(path) -> str:
+    """Return the SHA-256 hex digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def process_image(path, sizes, quality=85):
+    """Re-encode an image file and write its resized variants
+
+    The original is decoded in full, rotated upright from its EXIF
+    orientation and saved again without metadata, next to the upload under
+    the digest of the new content, which is returned. Encoding is
+    deterministic, so identical uploads end up with the same file, whose
+    variants are only written once. Runs in worker processes, so it only
+    takes plain values.
+    """
+    with Image.open(path) as source:
+        source.load()
+        fmt = source.format
+        image = ImageOps.exif_transpose(source)
+
+    if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                    suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            image.save(tmp, format=fmt, quality=quality, optimize=True)
+        digest = file_digest(tmp_path)
+        path = rehashed_name(path, digest)
+        move_into_place(tmp_path, path)
+    finally:
+        Path(tmp_path).unlink(missing_ok=True)
+    if is_processed(path):
+        return digest
+
+    rgb = image if image.mode in ("RGB", "RGBA") else image.convert("RGBA")
+    _save(rgb, variant_name(path, "original", "webp"), "WEBP", quality)
+    for size, edge in sizes.items():
+        thumbnail = rgb.copy()
+        thumbnail.thumbnail((edge, edge))
+        _save(thumbnail, variant_name(path, size, "webp"), "WEBP", quality)
+        _save(thumbnail.convert("RGB"), variant_name(path, size, "jpeg"),
+              "JPEG", quality)
+    return digest
+
+
+def get_executor():
+    """Return the shared pool of image worker processes"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, "RECEPIE_IMAGE_WORKERS", 2),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def record_result(recepie_id, name, digest):
+    """Store the processing outcome unless the image was replaced since
+
+    `digest` is the one of the re-encoded image, or None when processing
+    failed. The recepie's reference moves over to the re-encoded image.
+    """
+    from core.models import ImageBlob, Recepie
+    from .conditional import collection_changed
+
+    recepies = Recepie.objects.filter(pk=recepie_id, image=name)
+    if digest is None:
+        recepies.update(image_status=FAILED)
+        return
+    processed = rehashed_name(name, digest)
+    with transaction.atomic():
+        user_id = recepies.values_list("user_id", flat=True).first()
+        if user_id is None:
+            return
+        recepies.update(image=processed, image_status=READY)
+        if processed != name:
+            ImageBlob.objects.retain(processed)
+            ImageBlob.objects.release(name)
+        collection_changed(user_id)
+
+
+def _job_done(recepie_id, name, future):
+    """Record a finished job from the pool's callback thread"""
+    error = future.exception()
+    if error is not None:
+        logger.error("Processing image %s failed", name, exc_info=error)
+    try:
+        record_result(recepie_id, name,
+                      None if error is not None else future.result())
+    finally:
+        connections.close_all()
+
+
+def is_processed(path) -> bool:
+    """Return whether every variant of an image file has been written"""
+    return all(
+        os.path.exists(variant)
+        for variants in variant_names(path).values()
+        for variant in variants.values()
+    )
+
+
+def process_now(recepie_id, name, path):
+    """Process an image in this process and record the outcome"""
+    try:
+        digest = process_image(path, get_sizes())
+    except Exception:
+        logger.exception("Processing image %s failed", name)
+        record_result(recepie_id, name, None)
+    else:
+        record_result(recepie_id, name, digest)
+
+
+def run(recepie_id, name, path):
+    """Process an image now, or hand it to the worker pool"""
+    if getattr(settings, "RECEPIE_IMAGE_PROCESSING", "process") == "sync":
+        process_now(recepie_id, name, path)
+        return
+    future = get_executor().submit(process_image, path, get_sizes())
+    future.add_done_callback(
+        lambda future: _job_done(recepie_id, name, future)
+    )
+
+
+def schedule(recepie):
+    """Process the recepie's image once the current transaction commits"""
+    name = recepie.image.name
+    path = recepie.image.path
+    transaction.on_commit(lambda: run(recepie.pk, name, path))
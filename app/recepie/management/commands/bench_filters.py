@@ -0,0 +1,93 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core import synthetic
+from core.models import Recepie
+from recepie.filters import RecepieFilterBackend
+
+
+class Command(BaseCommand):
+    """Django Command to time the recepie filters on a synthetic dataset
+
+    Each scenario is timed through `RecepieFilterBackend` and, where it
+    filters on tags, against the equivalent JOIN + DISTINCT query. The
+    seeded data is rolled back afterwards.
+    """
+    help = "Benchmark recepie filtering at scale"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recepies", type=int, default=1000000)
+        parser.add_argument("--tags", type=int, default=200)
+        parser.add_argument("--ingredients", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write("Seeding synthetic dataset...")
+            user = synthetic.seed(
+                users=1,
+                tags=options["tags"],
+                ingredients=options["ingredients"],
+                recepies=options["recepies"],
+                random_seed=options["seed"],
+            )[0]
+            synthetic.analyze()
+
+            for label, params, baseline in self.get_scenarios(user):
+                queryset = self.filter(user, params)
+                self.report(label, queryset, options["repeat"])
+                if baseline is not None:
+                    self.report(f"{label} (join)", baseline,
+                                options["repeat"])
+
+            transaction.set_rollback(True)
+
+    def get_scenarios(self, user):
+        tags = list(
+            user.tag_set.order_by("id").values_list("id", flat=True)[:3]
+        )
+        ingredient = user.ingredient_set.order_by("id").first().id
+        recepies = Recepie.objects.filter(user=user)
+        joined_all = recepies
+        for pk in tags[:2]:
+            joined_all = joined_all.filter(tags=pk)
+        tag_list = ",".join(str(pk) for pk in tags)
+        return (
+            ("Any of 3 tags", {"tags": tag_list},
+             recepies.filter(tags__in=tags).distinct()),
+            ("All of 2 tags", {"tags": tag_list.rsplit(",", 1)[0],
+                               "match": "all"},
+             joined_all),
+            ("Ingredient under price", {"ingredients": str(ingredient),
+                                        "max_price": "100"}, None),
+            ("Quick recepies", {"max_prep_time": "15"}, None),
+        )
+
+    def filter(self, user, params):
+        request = Request(APIRequestFactory().get("/", params))
+        return RecepieFilterBackend().filter_queryset(
+            request,
+            Recepie.objects.filter(user=user),
+            None,
+        )
+
+    def report(self, label, queryset, repeat):
+        """Time fetching the first page of ids for a queryset"""
+        page = queryset.order_by("id").values_list("id", flat=True)[:100]
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = len(list(page.all()))
+            timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f"{label:<32} rows={rows:<4} "
+            f"median={statistics.median(timings):8.2f} ms "
+            f"max={max(timings):8.2f} ms"
+        )
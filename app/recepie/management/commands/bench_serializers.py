@@ -0,0 +1,120 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Prefetch
+
+from rest_framework.renderers import JSONRenderer
+
+from core import synthetic
+from core.models import Ingredient, Recepie, Tag
+from recepie import readers
+from recepie.serializers import (
+    RecepieDetailSerializer,
+    RecepieSerializer,
+    TagSerializer,
+)
+from recepie.views import RecepieViewSet
+
+
+class Command(BaseCommand):
+    """Django Command to compare the model and read serializers
+
+    Serializes the first `--rows` recepies of a synthetic dataset, and the
+    user's tags, with the model serializers over prefetched instances and
+    with the read serializers over `values()` rows, queries included. The
+    rendered output of both is checked to be identical. The seeded data is
+    rolled back afterwards.
+    """
+    help = "Benchmark the read serializers against the model serializers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", default="1000,10000,100000",
+                            help="Comma separated numbers of recepies")
+        parser.add_argument("--tags", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["rows"].split(",")]
+        except ValueError:
+            raise CommandError("--rows must be a list of integers")
+
+        with transaction.atomic():
+            self.stdout.write("Seeding synthetic dataset...")
+            user = synthetic.seed(
+                users=1,
+                tags=options["tags"],
+                ingredients=options["tags"],
+                recepies=max(sizes),
+                random_seed=options["seed"],
+            )[0]
+            synthetic.analyze()
+            recepies = Recepie.objects.filter(user=user).order_by("id")
+            rows = recepies.values(*RecepieViewSet.RECEPIE_FIELDS)
+
+            for size in sizes:
+                self.compare(
+                    "list", size, options["repeat"],
+                    lambda: RecepieSerializer(
+                        self.prefetched(recepies, ("id",))[:size], many=True
+                    ).data,
+                    lambda: readers.RecepieReadSerializer(
+                        rows[:size], many=True
+                    ).data,
+                )
+                self.compare(
+                    "detail", size, options["repeat"],
+                    lambda: RecepieDetailSerializer(
+                        self.prefetched(recepies, ("id", "name"))[:size],
+                        many=True,
+                    ).data,
+                    lambda: readers.RecepieDetailReadSerializer(
+                        rows[:size], many=True
+                    ).data,
+                )
+
+            tags = Tag.objects.filter(user=user).order_by(
+                "-name", "-id"
+            ).annotate(recepie_count=Count("recepie"))
+            self.compare(
+                "tags", options["tags"], options["repeat"],
+                lambda: TagSerializer(tags.all(), many=True).data,
+                lambda: readers.TagReadSerializer(
+                    tags.values("id", "name", "recepie_count"), many=True
+                ).data,
+            )
+
+            transaction.set_rollback(True)
+
+    def prefetched(self, queryset, related_fields):
+        return queryset.only(*RecepieViewSet.RECEPIE_FIELDS).prefetch_related(
+            *(Prefetch(field, queryset=model.objects.only(*related_fields)
+                       .order_by("id"))
+              for field, model in (("ingredients", Ingredient), ("tags", Tag)))
+        )
+
+    def compare(self, label, rows, repeat, model, read):
+        """Time both serializers and check they render the same bytes"""
+        renderer = JSONRenderer()
+        if renderer.render(model()) != renderer.render(read()):
+            raise CommandError(f"{label}: read serializer output differs")
+        model_ms = self.time(model, repeat)
+        read_ms = self.time(read, repeat)
+        self.stdout.write(
+            f"{label:<8} rows={rows:<7} "
+            f"model={model_ms:10.1f} ms ({rows / model_ms * 1000:9.0f}/s) "
+            f"read={read_ms:10.1f} ms ({rows / read_ms * 1000:9.0f}/s) "
+            f"speedup={model_ms / read_ms:5.1f}x"
+        )
+
+    def time(self, serialize, repeat):
+        """Return the median milliseconds to serialize"""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            serialize()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,145 @@
+import io
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from django.core.files.storage import default_storage
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+
+from rest_framework.parsers import MultiPartParser
+from rest_framework.request import Request
+from rest_framework.serializers import ImageField
+
+from core.benchmarks import MB, current_rss
+from core.models import recepie_image_file_path
+from recepie.uploads import StreamingImageParser
+
+BOUNDARY = "BenchUploadBoundary"
+
+
+class MultipartBody(io.RawIOBase):
+    """A multipart body with one image, generated as it is read
+
+    The file is a small JPEG padded with filler up to `size` bytes, so
+    holding the request bodies themselves costs no memory.
+    """
+
+    def __init__(self, size):
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64)).save(buffer, format="JPEG")
+        head = (
+            f"--{BOUNDARY}\r\n"
+            'Content-Disposition: form-data; name="image"; '
+            'filename="bench.jpg"\r\n'
+            "Content-Type: image/jpeg\r\n\r\n"
+        ).encode() + buffer.getvalue()
+        self.head = head
+        self.tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+        self.filler = bytes(range(256)) * 256
+        self.padding = size - len(buffer.getvalue())
+        self.length = len(head) + self.padding + len(self.tail)
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        head, tail = len(self.head), self.length - len(self.tail)
+        start = self.position
+        if start < head:
+            data = self.head[start:start + len(buffer)]
+        elif start < tail:
+            data = self.filler[:min(len(buffer), tail - start)]
+        else:
+            data = self.tail[start - tail:start - tail + len(buffer)]
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class Command(BaseCommand):
+    """Django Command to measure memory use of concurrent image uploads
+
+    Each upload is parsed and validated the way `upload_image` does,
+    once with Django's default buffering handlers followed by a save into
+    storage and once streamed straight into storage. Files are written to
+    a temporary MEDIA_ROOT that is removed afterwards. Linux only, as RSS
+    is sampled from /proc.
+    """
+    help = "Benchmark peak memory of concurrent image uploads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--uploads", type=int, default=50)
+        parser.add_argument("--size", type=int, default=10,
+                            help="Size of each upload in MB")
+
+    def handle(self, *args, **options):
+        if not os.path.exists("/proc/self/statm"):
+            raise CommandError("Measuring RSS needs /proc/self/statm.")
+
+        size = options["size"] * MB
+        for label, parser_class, store in (
+            ("buffered", MultiPartParser, True),
+            ("streaming", StreamingImageParser, False),
+        ):
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root):
+                peak, elapsed = self.measure(
+                    lambda: self.upload(parser_class, store, size),
+                    options["uploads"],
+                )
+            self.stdout.write(
+                f"{label:<10} uploads={options['uploads']:<4} "
+                f"size={options['size']} MB "
+                f"peak_rss_delta={peak / MB:8.1f} MB "
+                f"elapsed={elapsed:8.2f} s"
+            )
+
+    def measure(self, upload, uploads):
+        """Run uploads concurrently, returning peak RSS growth and time"""
+        baseline = current_rss()
+        peak = baseline
+        done = threading.Event()
+
+        def sample():
+            nonlocal peak
+            while not done.wait(0.001):
+                peak = max(peak, current_rss())
+
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=uploads) as executor:
+                list(executor.map(lambda _: upload(), range(uploads)))
+        finally:
+            elapsed = time.perf_counter() - start
+            done.set()
+            sampler.join()
+        return max(peak, current_rss()) - baseline, elapsed
+
+    def upload(self, parser_class, store, size):
+        """Parse, validate and store one upload"""
+        body = MultipartBody(size)
+        environ = RequestFactory()._base_environ(
+            REQUEST_METHOD="POST",
+            CONTENT_TYPE=f"multipart/form-data; boundary={BOUNDARY}",
+            CONTENT_LENGTH=str(body.length),
+        )
+        environ["wsgi.input"] = body
+        request = Request(WSGIRequest(environ), parsers=[parser_class()])
+        try:
+            image = ImageField().run_validation(request.FILES["image"])
+            if store:
+                default_storage.save(
+                    recepie_image_file_path(None, image.name),
+                    image,
+                )
+        finally:
+            request._request.close()
@@ -0,0 +1,97 @@
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core.models import ImageBlob, Recepie, recepie_image_file_path
+from recepie import images
+
+
+class Command(BaseCommand):
+    """Django Command to delete recepie images nothing references
+
+    Blobs that lost their last reference more than `--grace` seconds ago
+    are dropped. Every file in the upload directory that does not belong
+    to a remaining referenced blob, or to one of its resized variants, is
+    deleted once it is older than the grace period, which also covers
+    partial uploads and files from requests that failed.
+    """
+    help = "Delete unreferenced recepie images"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--grace", type=int, default=3600,
+                            help="Seconds to keep unreferenced files")
+        parser.add_argument("--recount", action="store_true",
+                            help="Recount references from recepies first")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        storage = Recepie._meta.get_field("image").storage
+        directory = str(Path(recepie_image_file_path(None, "")).parent)
+        cutoff = timezone.now() - timedelta(seconds=options["grace"])
+        dry_run = options["dry_run"]
+
+        if options["recount"]:
+            self.recount()
+        dead = ImageBlob.objects.filter(ref_count=0, updated_at__lt=cutoff)
+        blobs = dead.count()
+        if not dry_run:
+            dead.delete()
+
+        live = set()
+        for name in ImageBlob.objects.filter(ref_count__gt=0).values_list(
+            "name", flat=True
+        ).iterator():
+            live.add(name)
+            for variants in images.variant_names(name).values():
+                live.update(variants.values())
+
+        files = freed = 0
+        for name in self.walk(storage, directory):
+            if name in live or storage.get_modified_time(name) >= cutoff:
+                continue
+            files += 1
+            freed += storage.size(name)
+            if not dry_run:
+                storage.delete(name)
+
+        self.stdout.write(
+            f"{'Would delete' if dry_run else 'Deleted'} {files} files "
+            f"({freed} bytes) and {blobs} unreferenced blobs"
+        )
+
+    def walk(self, storage, directory):
+        """Yield the name of every file below a storage directory"""
+        if not storage.exists(directory):
+            return
+        subdirectories, files = storage.listdir(directory)
+        for name in files:
+            yield f"{directory}/{name}"
+        for subdirectory in subdirectories:
+            yield from self.walk(storage, f"{directory}/{subdirectory}")
+
+    def recount(self):
+        """Reset every blob's reference count from the recepies table"""
+        counts = dict(
+            Recepie.objects.exclude(image__isnull=True).exclude(image="")
+            .values_list("image").annotate(Count("id")).order_by()
+        )
+        with transaction.atomic():
+            changed = []
+            for blob in ImageBlob.objects.select_for_update():
+                ref_count = counts.pop(blob.name, 0)
+                if blob.ref_count != ref_count:
+                    blob.ref_count = ref_count
+                    blob.updated_at = timezone.now()
+                    changed.append(blob)
+            ImageBlob.objects.bulk_update(
+                changed, ["ref_count", "updated_at"], batch_size=1000
+            )
+            ImageBlob.objects.bulk_create(
+                [ImageBlob(name=name, ref_count=total)
+                 for name, total in counts.items()],
+                batch_size=1000,
+            )
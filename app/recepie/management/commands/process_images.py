@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Recepie
+from recepie import images
+
+
+class Command(BaseCommand):
+    """Django Command to process recepie images left pending
+
+    Jobs in the image worker pool are lost when the process running them
+    stops, which leaves their recepies pending. Images uploaded more than
+    `--older-than` minutes ago that are still pending are processed here,
+    in this process. Recepies whose upload is gone are marked failed.
+    """
+    help = "Process recepie images left pending by lost jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=10,
+                            help="Minutes since the upload")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        storage = Recepie._meta.get_field("image").storage
+        cutoff = timezone.now() - timedelta(minutes=options["older_than"])
+        dry_run = options["dry_run"]
+
+        processed = 0
+        pending = Recepie.objects.filter(
+            image_status=images.PENDING
+        ).values_list("pk", "image").order_by("pk")
+        for recepie_id, name in pending.iterator():
+            if storage.exists(name):
+                if storage.get_modified_time(name) >= cutoff:
+                    continue
+                if not dry_run:
+                    images.process_now(recepie_id, name, storage.path(name))
+            elif not dry_run:
+                images.record_result(recepie_id, name, None)
+            processed += 1
+
+        self.stdout.write(
+            f"{'Would process' if dry_run else 'Processed'} "
+            f"{processed} pending images"
+        )
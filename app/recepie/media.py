@@ -0,0 +1,184 @@
+"""Serve recepie images with validators, caching and range support
+
+Responses carry a strong ETag, answer If-None-Match and
+If-Modified-Since with 304 and serve single byte ranges. Stored files are
+named after the SHA-256 of their content and never rewritten, so that
+name is the ETag and they are cached for a year as immutable. Files
+stored before images were content-addressed get an ETag from their
+modification time and size instead. With RECEPIE_MEDIA_SENDFILE set the
+body is left to the front server through X-Sendfile or X-Accel-Redirect,
+so workers only ever stat files.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from core.models import Recepie, recepie_image_file_path
+
+# Content-addressed names, with an optional variant size after the digest
+HASHED_NAME = re.compile(r"^[0-9a-f]{64}(_[a-z0-9]+)?\.[a-z]+$")
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+PARTIAL_SUFFIXES = (".part", ".tmp")
+CHUNK_SIZE = 64 * 1024
+
+
+def get_upload_dir() -> str:
+    """Return the storage directory recepie images are uploaded to"""
+    return str(Path(recepie_image_file_path(None, "")).parent)
+
+
+def get_etag(name, st) -> str:
+    """Return the ETag of a stored image, without reading it
+
+    Variants are named after the digest of the original they were made
+    from, which fixes their content as well.
+    """
+    basename = posixpath.basename(name)
+    if HASHED_NAME.match(basename):
+        return quote_etag(posixpath.splitext(basename)[0])
+    return quote_etag(f"{st.st_mtime_ns:x}-{st.st_size:x}")
+
+
+def is_immutable(name) -> bool:
+    """Return whether an image's bytes will never change again"""
+    return HASHED_NAME.match(posixpath.basename(name)) is not None
+
+
+def parse_range(header, size):
+    """Return the (start, end) of a single byte range, None to ignore it
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE.match(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return None
+        length = int(end)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end:
+        if start >= size:
+            raise ValueError(header)
+        return None
+    return start, end
+
+
+def read_range(path, start, length):
+    """Yield `length` bytes of a file from `start`"""
+    with open(path, "rb") as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def offload(response, name, path):
+    """Leave sending the file to the front server when configured"""
+    mode = getattr(settings, "RECEPIE_MEDIA_SENDFILE", "")
+    if mode == "x-accel-redirect":
+        prefix = getattr(settings, "RECEPIE_MEDIA_ACCEL_PREFIX",
+                         "/protected-media/")
+        response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + name
+    elif mode == "x-sendfile":
+        response["X-Sendfile"] = path
+    else:
+        return False
+    return True
+
+
+@require_safe
+def serve_image(request, path):
+    """Serve a stored recepie image"""
+    storage = Recepie._meta.get_field("image").storage
+    name = posixpath.normpath(path).lstrip("/")
+    if (not name.startswith(get_upload_dir() + "/")
+            or name.endswith(PARTIAL_SUFFIXES)):
+        raise Http404("Image not found.")
+    try:
+        full_path = storage.path(name)
+        st = os.stat(full_path)
+    except (SuspiciousFileOperation, FileNotFoundError, NotADirectoryError):
+        raise Http404("Image not found.")
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404("Image not found.")
+
+    etag = get_etag(name, st)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(st.st_mtime),
+        "Cache-Control": (
+            "public, max-age=%d, immutable"
+            % getattr(settings, "RECEPIE_MEDIA_MAX_AGE", 31536000)
+            if is_immutable(name) else "public, no-cache"
+        ),
+    }
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(st.st_mtime),
+    )
+    if response is not None:
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    response = HttpResponse(content_type=content_type)
+    if offload(response, name, full_path):
+        # The front server answers range requests on its own
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    byte_range = None
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if "HTTP_RANGE" in request.META and if_range in (None, etag):
+        try:
+            byte_range = parse_range(request.META["HTTP_RANGE"], st.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{st.st_size}"
+            return response
+
+    if byte_range is None:
+        response = FileResponse(
+            open(full_path, "rb"),
+            content_type=content_type,
+        )
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_range(full_path, start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    response["Accept-Ranges"] = "bytes"
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,57 @@
+from rest_framework.pagination import CursorPagination
+
+from core.renderers import stream_response
+
+
+class BaseCursorPagination(CursorPagination):
+    """Keyset pagination so every page costs the same as the first
+
+    The total row count is only computed when the client asks for it with
+    `?count=true`, since counting a large collection is a full index scan.
+    Pages of at least JSON_STREAM_MIN_ITEMS results are streamed.
+    """
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    count_query_param = "count"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.count = None
+        if self.get_count_requested(request):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count_requested(self, request) -> bool:
+        value = request.query_params.get(self.count_query_param, "")
+        return value.lower() in ("1", "true", "yes")
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data["count"] = self.count
+        return stream_response(self.request, response, len(data))
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema["properties"]["count"] = {
+            "type": "integer",
+            "example": 123,
+        }
+        return schema
+
+
+class NameCursorPagination(BaseCursorPagination):
+    """Paginate tags and ingredients by name, using the id as a tiebreaker"""
+    ordering = ("-name", "-id")
+
+
+class RecepieCursorPagination(BaseCursorPagination):
+    """Paginate recepies in creation order, or by rank when searching"""
+    ordering = ("id",)
+    ranked_ordering = ("-rank", "-id")
+
+    def get_ordering(self, request, queryset, view):
+        if "rank" in queryset.query.annotations:
+            return self.ranked_ordering
+        return super().get_ordering(request, queryset, view)
@@ -0,0 +1,172 @@
+"""Read-only fast paths for the recepie serializers
+
+DRF serializes a model instance by running every field's
+`get_attribute()` and `to_representation()`, and a `many=True`
+`PrimaryKeyRelatedField` does the same for every related row. On large
+lists that per-field machinery dominates the request's CPU time.
+
+A read serializer takes rows from `values()` instead and builds plain
+dicts from accessors compiled once from the serializer it mirrors: plain
+integer and text columns are copied as they are and every other field
+keeps its own `to_representation()`. Related ids or rows are loaded with
+one query per M2M field, ordered by id like the prefetches the model
+serializers use, so the rendered output is byte-identical. Views use them
+for `list` and `retrieve` only; everything that writes keeps the model
+serializers.
+"""
+from rest_framework import serializers
+
+from core.instrumentation import timed
+from core.models import Recepie
+
+from .serializers import (
+    IngredientSerializer,
+    RecepieDetailSerializer,
+    RecepieSerializer,
+    TagSerializer,
+)
+
+# Fields whose representation of a database value is the value itself
+VERBATIM_FIELDS = (serializers.IntegerField, serializers.CharField)
+
+
+def compile_fields(fields, names=None, prepared=()):
+    """Return (name, converter) pairs for serializer fields
+
+    The converter is None where a value is copied as it is, which is the
+    case for the `prepared` fields whose values are already represented.
+    """
+    accessors = []
+    for name, field in fields.items():
+        if names is not None and name not in names:
+            continue
+        verbatim = name in prepared or type(field) in VERBATIM_FIELDS
+        converter = None if verbatim else field.to_representation
+        accessors.append((name, converter))
+    return tuple(accessors)
+
+
+def represent(row, accessors) -> dict:
+    """Build the representation of a row from compiled accessors
+
+    Keys missing from the row are left out, the way DRF skips read-only
+    fields whose attribute does not exist.
+    """
+    data = {}
+    for name, converter in accessors:
+        if name not in row:
+            continue
+        value = row[name]
+        if converter is not None and value is not None:
+            value = converter(value)
+        data[name] = value
+    return data
+
+
+def get_related(field, recepie_ids, columns=None) -> dict:
+    """Return the related ids, or rows, of each recepie by recepie id
+
+    Without `columns` every recepie maps to a list of related ids,
+    otherwise to a list of dicts with those columns of the related rows.
+    """
+    through = getattr(Recepie, field).through
+    target = through._meta.get_field(field[:-1])
+    lookups = [target.attname]
+    if columns is not None:
+        lookups += [
+            target.attname if column == "id" else f"{target.name}__{column}"
+            for column in columns
+        ]
+    related = {}
+    for row in through.objects.filter(
+        recepie_id__in=recepie_ids
+    ).order_by(target.attname).values_list("recepie_id", *lookups):
+        if columns is None:
+            value = row[1]
+        else:
+            value = dict(zip(columns, row[2:]))
+        related.setdefault(row[0], []).append(value)
+    return related
+
+
+class ReadSerializer:
+    """Serialize `values()` rows exactly like `serializer_class` does
+
+    Takes the arguments `GenericAPIView.get_serializer()` passes and
+    exposes the representation as `data`, so list and retrieve views can
+    use it in place of the model serializer.
+    """
+    serializer_class = None
+    # M2M fields to load, mapped to the columns nested serializers render,
+    # or None for primary keys only
+    related_fields = {}
+
+    _accessors = None
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @classmethod
+    def get_accessors(cls):
+        """Compile the accessors of `serializer_class` on first use"""
+        if cls.__dict__.get("_accessors") is None:
+            fields = cls.serializer_class().fields
+            cls._accessors = compile_fields(
+                fields, prepared=cls.related_fields
+            )
+            cls._related_accessors = {
+                name: compile_fields(fields[name].child.fields, columns)
+                for name, columns in cls.related_fields.items()
+                if columns is not None
+            }
+        return cls._accessors
+
+    def to_representation(self, rows) -> list:
+        """Represent a list of `values()` rows, adding related values"""
+        accessors = self.get_accessors()
+        related = {}
+        if self.related_fields:
+            recepie_ids = [row["id"] for row in rows]
+            related = {
+                name: get_related(name, recepie_ids, columns)
+                for name, columns in self.related_fields.items()
+            }
+        for name, values in related.items():
+            nested = self._related_accessors.get(name)
+            if nested is not None:
+                for key, value in values.items():
+                    values[key] = [represent(item, nested) for item in value]
+
+        data = []
+        for row in rows:
+            for name, values in related.items():
+                row[name] = values.get(row["id"], [])
+            data.append(represent(row, accessors))
+        return data
+
+    @property
+    def data(self):
+        with timed("serialize"):
+            if self.many:
+                return self.to_representation(list(self.instance))
+            return self.to_representation([self.instance])[0]
+
+
+class TagReadSerializer(ReadSerializer):
+    serializer_class = TagSerializer
+
+
+class IngredientReadSerializer(ReadSerializer):
+    serializer_class = IngredientSerializer
+
+
+class RecepieReadSerializer(ReadSerializer):
+    serializer_class = RecepieSerializer
+    related_fields = {"ingredients": None, "tags": None}
+
+
+class RecepieDetailReadSerializer(ReadSerializer):
+    serializer_class = RecepieDetailSerializer
+    related_fields = {"ingredients": ("id", "name"), "tags": ("id", "name")}
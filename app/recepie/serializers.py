@@ -1,27 +1,71 @@
+from django.db import transaction
+from django.db.models import CharField, Value
+from django.db.models.functions import Lower
+from django.utils.text import capfirst
+
 from rest_framework import serializers
 
-from core.models import Recepie, Tag, Ingredient
+from core.instrumentation import InstrumentedSerializerMixin
+from core.models import Recepie, Tag, Ingredient, normalize_name
+
+from . import images
+from .conditional import collection_changed
+from .uploads import StoredUpload
+
 
+class RecepieAttrSerializer(InstrumentedSerializerMixin,
+                            serializers.ModelSerializer):
+    """Base serializer for objects owned by a user and unique by name"""
+    recepie_count = serializers.IntegerField(read_only=True)
 
-class TagSerializer(serializers.ModelSerializer):
+    def validate_name(self, value):
+        """Normalize the name and reject one the user already has"""
+        name = normalize_name(value)
+        queryset = self.Meta.model.objects.filter(
+            user=self.context["request"].user,
+        ).annotate(
+            lower_name=Lower("name")
+        ).filter(lower_name=Lower(Value(name)))
+        if self.instance is not None:
+            queryset = queryset.exclude(pk=self.instance.pk)
+        if queryset.exists():
+            raise serializers.ValidationError(
+                f"{capfirst(self.Meta.model._meta.verbose_name)} with this "
+                "name already exists."
+            )
+        return name
+
+
+class RecepieAttrBulkSerializer(InstrumentedSerializerMixin,
+                                serializers.Serializer):
+    """Serializer for names to fetch or create in bulk"""
+    names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        allow_empty=False,
+        max_length=1000,
+    )
+
+
+class TagSerializer(RecepieAttrSerializer):
     """Serializer for tag objects"""
 
     class Meta:
         model = Tag
-        fields = ("id", "name")
+        fields = ("id", "name", "recepie_count")
         read_only_fields = ("id",)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(RecepieAttrSerializer):
     """Serializer for Ingredient Objects"""
 
     class Meta:
         model = Ingredient
-        fields = ("id", "name")
+        fields = ("id", "name", "recepie_count")
         read_only_fields = ("id",)
 
 
-class RecepieSerializer(serializers.ModelSerializer):
+class RecepieSerializer(InstrumentedSerializerMixin,
+                        serializers.ModelSerializer):
     """Serializer for Recepie Objects"""
     ingredients = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -53,9 +97,207 @@ class RecepieDetailSerializer(RecepieSerializer):
     tags = TagSerializer(many=True, read_only=True)
 
 
-class RecepieImageSerializer(serializers.ModelSerializer):
+class RecepieImageSerializer(InstrumentedSerializerMixin,
+                             serializers.ModelSerializer):
     """Serializer for uploading images to recepies"""
+    image_variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recepie
+        fields = ('id', 'image', 'image_status', 'image_variants')
+        read_only_fields = ('id', 'image_status')
+
+    def validate_image(self, value):
+        """Keep an image streamed into storage under the name it has"""
+        if isinstance(value, StoredUpload):
+            return value.storage_name
+        return value
+
+    def get_image_variants(self, obj):
+        """Return the URLs of the resized variants once they are ready"""
+        if not obj.image or obj.image_status != images.READY:
+            return {}
+        request = self.context.get("request")
+        variants = {}
+        for size, names in images.variant_names(obj.image.name).items():
+            variants[size] = {}
+            for fmt, name in names.items():
+                url = obj.image.storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                variants[size][fmt] = url
+        return variants
+
+
+class BulkRecepieListSerializer(InstrumentedSerializerMixin,
+                                serializers.ListSerializer):
+    """Validate and write many recepies with a fixed number of queries
+
+    Every referenced ingredient and tag id is checked with a single query,
+    and rows and M2M through rows are written with bulk operations inside
+    one transaction. Errors are reported per item, in request order, and
+    empty lists are rejected.
+    """
+    does_not_exist = serializers.PrimaryKeyRelatedField.default_error_messages[
+        "does_not_exist"
+    ]
+    duplicate_id = "Recepie {pk_value} is listed more than once."
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("allow_empty", False)
+        super().__init__(*args, **kwargs)
+
+    def get_owned_ids(self, ingredient_ids, tag_ids) -> dict:
+        """Return which of the given ids the requesting user owns"""
+        user = self.context["request"].user
+        ingredients = Ingredient.objects.filter(
+            user=user,
+            id__in=ingredient_ids,
+        ).annotate(
+            kind=Value("ingredients", output_field=CharField())
+        ).values_list("kind", "id")
+        tags = Tag.objects.filter(
+            user=user,
+            id__in=tag_ids,
+        ).annotate(
+            kind=Value("tags", output_field=CharField())
+        ).values_list("kind", "id")
+        owned = {"ingredients": set(), "tags": set()}
+        for kind, pk in ingredients.union(tags, all=True):
+            owned[kind].add(pk)
+        return owned
+
+    def to_internal_value(self, data):
+        attrs = super().to_internal_value(data)
+        instances = {}
+        if self.instance is not None:
+            instances = {recepie.pk: recepie for recepie in self.instance}
+        owned = self.get_owned_ids(
+            {pk for item in attrs for pk in item.get("ingredients", ())},
+            {pk for item in attrs for pk in item.get("tags", ())},
+        )
+
+        errors = []
+        seen_ids = set()
+        for item in attrs:
+            item_errors = {}
+            for field in ("ingredients", "tags"):
+                missing = [
+                    pk for pk in item.get(field, ()) if pk not in owned[field]
+                ]
+                if missing:
+                    item_errors[field] = [
+                        self.does_not_exist.format(pk_value=pk)
+                        for pk in missing
+                    ]
+            if self.instance is not None:
+                pk = item.get("id")
+                if pk not in instances:
+                    item_errors["id"] = [
+                        self.does_not_exist.format(pk_value=pk)
+                    ]
+                elif pk in seen_ids:
+                    item_errors["id"] = [
+                        self.duplicate_id.format(pk_value=pk)
+                    ]
+                seen_ids.add(pk)
+            errors.append(item_errors)
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return attrs
+
+    def set_related(self, recepies, validated_data):
+        """Replace the ingredients and tags given for each recepie"""
+        for field in ("ingredients", "tags"):
+            through = getattr(Recepie, field).through
+            column = through._meta.get_field(field[:-1]).attname
+            changed = [
+                (recepie, attrs[field])
+                for recepie, attrs in zip(recepies, validated_data)
+                if field in attrs
+            ]
+            if not changed:
+                continue
+            through.objects.filter(
+                recepie__in=[recepie.pk for recepie, _ in changed]
+            ).delete()
+            through.objects.bulk_create([
+                through(recepie_id=recepie.pk, **{column: pk})
+                for recepie, pks in changed
+                for pk in dict.fromkeys(pks)
+            ])
+
+    def create(self, validated_data):
+        recepies = [
+            Recepie(**{
+                key: value for key, value in attrs.items()
+                if key not in ("id", "ingredients", "tags")
+            })
+            for attrs in validated_data
+        ]
+        with transaction.atomic():
+            Recepie.objects.bulk_create(recepies)
+            self.set_related(recepies, validated_data)
+            Recepie.objects.filter(
+                pk__in=[recepie.pk for recepie in recepies]
+            ).update_search_vector()
+        collection_changed(self.context["request"].user.pk)
+        return recepies
+
+    def update(self, instance, validated_data):
+        instances = {recepie.pk: recepie for recepie in instance}
+        recepies = []
+        fields = set()
+        for attrs in validated_data:
+            recepie = instances[attrs["id"]]
+            for key, value in attrs.items():
+                if key not in ("id", "user", "ingredients", "tags"):
+                    setattr(recepie, key, value)
+                    fields.add(key)
+            recepies.append(recepie)
+        with transaction.atomic():
+            if fields:
+                Recepie.objects.bulk_update(recepies, sorted(fields))
+            self.set_related(recepies, validated_data)
+            Recepie.objects.filter(
+                pk__in=[recepie.pk for recepie in recepies]
+            ).update_search_vector()
+        collection_changed(self.context["request"].user.pk)
+        return recepies
+
+
+class RecepieBulkSerializer(InstrumentedSerializerMixin,
+                            serializers.ModelSerializer):
+    """Serializer for one item of a bulk recepie write"""
+    id = serializers.IntegerField(required=False)
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+    )
+
     class Meta:
         model = Recepie
-        fields = ('id', 'image')
-        read_only_fields = ('id',)
+        fields = (
+            "id",
+            "title",
+            "ingredients",
+            "tags",
+            "prep_time",
+            "price",
+            "link"
+        )
+        list_serializer_class = BulkRecepieListSerializer
+
+
+class RecepieBulkDeleteSerializer(InstrumentedSerializerMixin,
+                                  serializers.Serializer):
+    """Serializer for the ids of recepies to delete in bulk"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+    )
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import CollectionVersion, Ingredient, Recepie, Tag
+
+from .conditional import collection_changed
+
+
+@receiver(post_save, sender=Recepie)
+@receiver(post_delete, sender=Recepie)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def recepie_changed(sender, instance, **kwargs):
+    """Record a change to a recepie or an object it uses"""
+    collection_changed(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recepie.tags.through)
+@receiver(m2m_changed, sender=Recepie.ingredients.through)
+def recepie_links_changed(sender, instance, action, **kwargs):
+    """Record recepies gaining or losing tags or ingredients"""
+    if action.startswith("post_"):
+        collection_changed(instance.user_id)
+
+
+@receiver(post_delete, sender=get_user_model())
+def user_deleted(sender, instance, **kwargs):
+    """Drop the version the cascade of the user's objects bumped again
+
+    The foreign key is checked at commit, so the row can go after the user.
+    """
+    CollectionVersion.objects.filter(user_id=instance.pk).delete()
@@ -0,0 +1,128 @@
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth import get_user_model
+from django.test import AsyncClient, TransactionTestCase, override_settings
+from django.urls import include, path, reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from core import signals
+from core.models import Recepie
+from recepie.urls import async_urlpatterns
+from user.authentication import token_cache
+
+RECEPIES_URL = reverse("recepie:recepie-list")
+
+urlpatterns = [
+    path("api/recepie/", include((async_urlpatterns, "async-recepie"))),
+    path("", include("app.urls")),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncRecepieApiTests(TransactionTestCase):
+    """Test the async recepie views
+
+    They query in worker threads, which see committed data only.
+    """
+
+    def setUp(self) -> None:
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.user = get_user_model().objects.create_user(
+            "async@test.com",
+            "testpass@123",
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.recepie = Recepie.objects.create(
+            user=self.user,
+            title="Upma",
+            prep_time=15,
+            price=3,
+        )
+        self.client = AsyncClient()
+        # Headers are passed per request, as in the ASGI scope
+        self.auth = {"authorization": f"Token {self.token.key}"}
+
+    async def test_list_and_retrieve(self):
+        """Test the user's recepies are listed and retrieved"""
+        res = await self.client.get(RECEPIES_URL, **self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        titles = [recepie["title"] for recepie in res.json()["results"]]
+        self.assertEqual(titles, ["Upma"])
+        self.assertIn("ETag", res)
+
+        res = await self.client.get(
+            reverse("recepie:recepie-detail", args=[self.recepie.id]),
+            **self.auth,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()["title"], "Upma")
+
+    async def test_create(self):
+        """Test creating a recepie"""
+        res = await self.client.post(
+            RECEPIES_URL,
+            {
+                "title": "Kheer",
+                "prep_time": 30,
+                "price": "5.00",
+                "tags": [],
+                "ingredients": [],
+            },
+            content_type="application/json",
+            **self.auth,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        exists = await sync_to_async(
+            Recepie.objects.filter(user=self.user, title="Kheer").exists
+        )()
+        self.assertTrue(exists)
+
+    async def test_connections_checked(self):
+        """Test the worker thread health checks its kept connections"""
+        with mock.patch.object(signals, "check_connections") as check:
+            await self.client.get(RECEPIES_URL, **self.auth)
+
+        check.assert_called()
+
+    async def test_token_cached(self):
+        """Test a cached token is reused by the view's authentication"""
+        await self.client.get(RECEPIES_URL, **self.auth)
+        await self.client.get(RECEPIES_URL, **self.auth)
+
+        self.assertEqual(token_cache.stats()["misses"], 1)
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            },
+            "tokens": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "async-token-tests",
+            },
+        },
+        TOKEN_AUTH_CACHE={"CACHE_ALIAS": "tokens"},
+    )
+    async def test_token_cached_shared(self):
+        """Test cached tokens checked against the shared cache are reused"""
+        await self.client.get(RECEPIES_URL, **self.auth)
+        res = await self.client.get(RECEPIES_URL, **self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.stats()["hits"], 1)
+
+    async def test_authentication_required(self):
+        """Test requests without a valid token are refused"""
+        for headers in ({}, {"authorization": "Token bad"}):
+            res = await self.client.get(RECEPIES_URL, **headers)
+
+            self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(res["WWW-Authenticate"], "Token")
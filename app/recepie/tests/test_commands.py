@@ -0,0 +1,137 @@
+import os
+import tempfile
+import time
+from io import BytesIO, StringIO
+from pathlib import Path
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core.models import ImageBlob, Recepie
+
+from .. import images
+
+
+class CommandTests(TestCase):
+    def test_bench_filters(self):
+        """Test the filter benchmark reports every scenario"""
+        out = StringIO()
+        call_command(
+            "bench_filters",
+            recepies=50,
+            tags=5,
+            ingredients=5,
+            repeat=1,
+            stdout=out,
+        )
+        output = out.getvalue()
+        self.assertIn("All of 2 tags", output)
+        self.assertIn("All of 2 tags (join)", output)
+        self.assertFalse(Recepie.objects.exists())
+
+    def test_bench_uploads(self):
+        """Test the upload benchmark reports both upload paths"""
+        out = StringIO()
+        call_command("bench_uploads", uploads=2, size=1, stdout=out)
+        output = out.getvalue()
+        self.assertIn("buffered", output)
+        self.assertIn("streaming", output)
+
+    def test_bench_serializers(self):
+        """Test the serializer benchmark reports every size and scenario"""
+        out = StringIO()
+        call_command(
+            "bench_serializers",
+            rows="10,20",
+            tags=5,
+            repeat=1,
+            stdout=out,
+        )
+        output = out.getvalue()
+        for label, rows in (("list", 20), ("detail", 10), ("tags", 5)):
+            self.assertIn(f"{label:<8} rows={rows} ", output)
+        self.assertFalse(Recepie.objects.exists())
+
+    def test_gc_images(self):
+        """Test unreferenced images are deleted and shared ones kept"""
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            storage = Recepie._meta.get_field("image").storage
+            user = get_user_model().objects.create_user(
+                "gcimages@test.com",
+                "testpass@123",
+            )
+            kept = storage.save("uploads/recepie/a.jpg", ContentFile(b"a"))
+            dropped = storage.save("uploads/recepie/b.jpg", ContentFile(b"b"))
+            variant = images.variant_name(kept, "small", "webp")
+            Path(storage.path(variant)).write_bytes(b"small")
+            for name in (kept, dropped):
+                Recepie.objects.create(
+                    user=user,
+                    title="Dal",
+                    prep_time=5,
+                    price=5,
+                    image=name,
+                )
+            Recepie.objects.filter(image=dropped).delete()
+
+            out = StringIO()
+            call_command("gc_images", grace=0, stdout=out)
+
+            self.assertTrue(storage.exists(kept))
+            self.assertTrue(storage.exists(variant))
+            self.assertFalse(storage.exists(dropped))
+            self.assertFalse(ImageBlob.objects.filter(name=dropped).exists())
+            self.assertIn("Deleted 1 files", out.getvalue())
+
+    def test_process_images(self):
+        """Test images left pending are processed once old enough"""
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root,
+                                  RECEPIE_IMAGE_SIZES={"small": 10}):
+            storage = Recepie._meta.get_field("image").storage
+            user = get_user_model().objects.create_user(
+                "processimages@test.com",
+                "testpass@123",
+            )
+            names = []
+            for color in ("red", "blue"):
+                buffer = BytesIO()
+                Image.new("RGB", (20, 20), color).save(buffer, format="JPEG")
+                names.append(storage.save(
+                    "uploads/recepie/upload.jpg",
+                    ContentFile(buffer.getvalue()),
+                ))
+            stale, fresh = names
+            an_hour_ago = time.time() - 3600
+            os.utime(storage.path(stale), (an_hour_ago, an_hour_ago))
+            for name in (stale, fresh, "uploads/recepie/gone.jpg"):
+                Recepie.objects.create(
+                    user=user,
+                    title="Dal",
+                    prep_time=5,
+                    price=5,
+                    image=name,
+                    image_status=images.PENDING,
+                )
+
+            out = StringIO()
+            call_command("process_images", older_than=10, stdout=out)
+
+            statuses = dict(Recepie.objects.values_list(
+                "image_status", "image"
+            ))
+            self.assertEqual(set(statuses), {
+                images.READY, images.PENDING, images.FAILED
+            })
+            self.assertTrue(images.is_processed(
+                storage.path(statuses[images.READY])
+            ))
+            self.assertEqual(statuses[images.PENDING], fresh)
+            self.assertEqual(statuses[images.FAILED],
+                             "uploads/recepie/gone.jpg")
+            self.assertIn("Processed 2 pending images", out.getvalue())
@@ -0,0 +1,250 @@
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models.signals import post_delete
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import CollectionVersion, Ingredient, Recepie, Tag
+
+from .test_recepie_api import (
+    RECEPIES_URL,
+    detail_url,
+    sample_ingredient,
+    sample_recepie,
+    sample_tag,
+)
+
+TAGS_URL = reverse("recepie:tag-list")
+INGREDIENTS_URL = reverse("recepie:ingredient-list")
+TAGS_BULK_URL = reverse("recepie:tag-bulk")
+RECEPIES_BULK_URL = reverse("recepie:recepie-bulk")
+FACETS_URL = reverse("recepie:recepie-facets")
+
+
+class ConditionalApiTests(TestCase):
+    """Test conditional GETs of the recepie API"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "conditional@test.com",
+            "testpass@123",
+        )
+        self.client.force_authenticate(self.user)
+        self.recepie = sample_recepie(user=self.user)
+
+    def assertNotModified(self, url, etag, **params):
+        """Assert a poll with an ETag is answered by one query and a 304"""
+        with self.assertNumQueries(1):
+            res = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b"")
+        self.assertEqual(res["ETag"], etag)
+
+    def get_etag(self, url, **params):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Cache-Control"], "private, no-cache")
+        self.assertIn("Last-Modified", res)
+        return res["ETag"]
+
+    def test_unchanged_list_not_modified(self):
+        """Test polling unchanged collections returns 304"""
+        for url in (RECEPIES_URL, TAGS_URL, FACETS_URL,
+                    detail_url(self.recepie.id)):
+            self.assertNotModified(url, self.get_etag(url))
+
+    def test_etag_depends_on_query(self):
+        """Test the ETag differs between pages and filters"""
+        etag = self.get_etag(RECEPIES_URL)
+
+        self.assertNotEqual(self.get_etag(RECEPIES_URL, page_size=1), etag)
+
+    def test_write_changes_etag(self):
+        """Test writes to the user's collections change the ETag"""
+        etag = self.get_etag(RECEPIES_URL)
+        tag = sample_tag(user=self.user, name="Vegan")
+        self.assertNotEqual(self.get_etag(RECEPIES_URL), etag)
+
+        etag = self.get_etag(RECEPIES_URL)
+        self.recepie.tags.add(tag)
+        self.assertNotEqual(self.get_etag(RECEPIES_URL), etag)
+
+        etag = self.get_etag(TAGS_URL)
+        Tag.objects.filter(pk=tag.pk).get().delete()
+        self.assertNotEqual(self.get_etag(TAGS_URL), etag)
+
+        etag = self.get_etag(TAGS_URL)
+        self.client.post(TAGS_BULK_URL, {"names": ["Dessert"]})
+        self.assertNotEqual(self.get_etag(TAGS_URL), etag)
+
+        etag = self.get_etag(RECEPIES_URL)
+        self.client.delete(RECEPIES_BULK_URL, {"ids": [self.recepie.id]},
+                           format="json")
+        self.assertNotEqual(self.get_etag(RECEPIES_URL), etag)
+
+    def test_other_users_writes_ignored(self):
+        """Test other users' writes keep the ETag"""
+        etag = self.get_etag(RECEPIES_URL)
+        other = get_user_model().objects.create_user(
+            "conditionalother@test.com",
+            "testpass@123",
+        )
+        sample_recepie(user=other)
+
+        self.assertNotModified(RECEPIES_URL, etag)
+
+    def test_if_modified_since(self):
+        """Test If-Modified-Since is answered from the last change"""
+        res = self.client.get(RECEPIES_URL)
+
+        res = self.client.get(
+            RECEPIES_URL,
+            HTTP_IF_MODIFIED_SINCE=res["Last-Modified"],
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_user_deleted(self):
+        """Test deleting a user leaves no collection version behind"""
+        self.recepie.tags.add(sample_tag(user=self.user))
+
+        self.user.delete()
+
+        self.assertFalse(CollectionVersion.objects.exists())
+        connection.check_constraints()
+
+    def test_user_delete_failed(self):
+        """Test changes are still recorded after a user fails to delete"""
+        def fail(sender, **kwargs):
+            raise RuntimeError("Delete failed")
+
+        post_delete.connect(fail, sender=Tag)
+        self.addCleanup(post_delete.disconnect, fail, sender=Tag)
+        self.recepie.tags.add(sample_tag(user=self.user))
+        version = CollectionVersion.objects.get_stamp(self.user.pk)[0]
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.user.delete()
+        sample_recepie(user=self.user)
+
+        self.assertEqual(
+            CollectionVersion.objects.get_stamp(self.user.pk)[0],
+            version + 1,
+        )
+
+
+class ResponseCacheTests(TestCase):
+    """Test caching rendered recepie API responses"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "responsecache@test.com",
+            "testpass@123",
+        )
+        self.client.force_authenticate(self.user)
+        self.recepie = sample_recepie(user=self.user)
+        self.tag = sample_tag(user=self.user, name="Vegan")
+        self.addCleanup(caches["default"].clear)
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.backends = {
+            "locmem": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "recepie-response-tests",
+            },
+            "file": {
+                "BACKEND":
+                    "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": cache_dir.name,
+            },
+        }
+
+    def get(self, url):
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.json()
+
+    def assertCached(self, url):
+        """Assert a repeated read is served from the cache"""
+        body = self.get(url)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get(url), body)
+
+    def assertNotCached(self, url):
+        """Assert a read runs its queries again"""
+        with CaptureQueriesContext(connection) as ctx:
+            self.get(url)
+        self.assertGreater(len(ctx.captured_queries), 1)
+
+    def test_reads_cached_until_written(self):
+        """Test cached reads are dropped after every kind of write"""
+        other = get_user_model().objects.create_user(
+            "responsecacheother@test.com",
+            "testpass@123",
+        )
+        urls = (RECEPIES_URL, TAGS_URL, INGREDIENTS_URL, FACETS_URL)
+        for backend, config in self.backends.items():
+            with self.subTest(backend=backend), override_settings(
+                CACHES={"default": config},
+                RECEPIE_RESPONSE_CACHE_TIMEOUT=60,
+            ):
+                ingredient = sample_ingredient(user=self.user, name="Salt")
+                writes = (
+                    lambda: sample_recepie(user=self.user, title="Rice"),
+                    lambda: self.recepie.tags.add(self.tag),
+                    lambda: ingredient.recepie_set.add(self.recepie),
+                    lambda: self.tag.recepie_set.clear(),
+                    lambda: Tag.objects.get(pk=self.tag.pk).save(),
+                    lambda: Ingredient.objects.get(pk=ingredient.pk).delete(),
+                    lambda: Recepie.objects.filter(
+                        pk=self.recepie.pk
+                    ).delete(),
+                )
+                self.assertCached(detail_url(self.recepie.id))
+                for url in urls:
+                    self.assertCached(url)
+                sample_recepie(user=other)
+                for url in urls:
+                    self.assertCached(url)
+
+                for write in writes:
+                    write()
+                    for url in urls:
+                        self.assertNotCached(url)
+                        self.assertCached(url)
+                self.recepie = sample_recepie(user=self.user)
+
+    @override_settings(RECEPIE_RESPONSE_CACHE_TIMEOUT=60,
+                       JSON_STREAM_MIN_ITEMS=1)
+    def test_streamed_response_cached(self):
+        """Test streamed pages are cached once fully sent"""
+        res = self.client.get(RECEPIES_URL)
+        self.assertTrue(res.streaming)
+        body = b"".join(res.streaming_content)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RECEPIES_URL)
+
+        self.assertEqual(res.content, body)
+        self.assertEqual(res["Content-Type"], "application/json")
+
+    @override_settings(RECEPIE_RESPONSE_CACHE_TIMEOUT=60)
+    def test_cache_per_user(self):
+        """Test users never see each other's cached responses"""
+        self.get(RECEPIES_URL)
+        other = get_user_model().objects.create_user(
+            "responsecacheother@test.com",
+            "testpass@123",
+        )
+        self.client.force_authenticate(other)
+
+        self.assertEqual(self.get(RECEPIES_URL)["results"], [])
@@ -0,0 +1,143 @@
+import csv
+import io
+import json
+import os
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import synthetic
+from core.benchmarks import MB, current_rss
+from core.models import Recepie
+
+from .test_recepie_api import (
+    detail_url,
+    sample_ingredient,
+    sample_recepie,
+    sample_tag,
+)
+
+EXPORT_URL = reverse("recepie:recepie-export")
+
+
+class RecepieExportTests(TestCase):
+    """Test streaming exports of a user's recepies"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "export@test.com",
+            "testpass@123",
+        )
+        self.client.force_authenticate(self.user)
+
+    def export(self, **params):
+        res = self.client.get(EXPORT_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        return res, b"".join(res.streaming_content)
+
+    def test_export_ndjson(self):
+        """Test every recepie is exported as its detail representation"""
+        recepie = sample_recepie(user=self.user, title="Kheer")
+        recepie.tags.add(sample_tag(user=self.user, name="Dessert"))
+        recepie.ingredients.add(sample_ingredient(user=self.user, name="Rice"))
+        other = sample_recepie(user=self.user, title="Dal")
+        sample_recepie(
+            user=get_user_model().objects.create_user(
+                "exportother@test.com",
+                "testpass@123",
+            ),
+            title="Not mine",
+        )
+
+        res, body = self.export()
+
+        self.assertEqual(res["Content-Type"], "application/x-ndjson")
+        self.assertEqual(res["Content-Disposition"],
+                         'attachment; filename="recepies.ndjson"')
+        lines = body.decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [self.client.get(detail_url(pk)).json()
+             for pk in (recepie.id, other.id)],
+        )
+
+    def test_export_csv(self):
+        """Test recepies are exported as CSV with related names joined"""
+        recepie = sample_recepie(user=self.user, title="Kheer, sweet")
+        recepie.tags.add(sample_tag(user=self.user, name="Dessert"),
+                         sample_tag(user=self.user, name="Vegan"))
+
+        res, body = self.export(format="csv")
+
+        self.assertEqual(res["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(rows, [
+            ["id", "title", "ingredients", "tags", "prep_time", "price",
+             "link"],
+            [str(recepie.id), "Kheer, sweet", "", "Dessert|Vegan", "10",
+             "5.00", ""],
+        ])
+
+    def test_export_filtered(self):
+        """Test exports honour the list filters"""
+        sample_recepie(user=self.user, title="Quick", prep_time=5)
+        sample_recepie(user=self.user, title="Slow", prep_time=90)
+
+        res, body = self.export(max_prep_time=10)
+
+        titles = [json.loads(line)["title"] for line in body.splitlines()]
+        self.assertEqual(titles, ["Quick"])
+
+    @skipUnless(os.path.exists("/proc/self/statm"), "Needs /proc")
+    def test_export_memory_bounded(self):
+        """Test exporting 100k recepies holds one chunk at a time"""
+        count = 100000
+        self.seed(count)
+        synthetic.analyze()
+
+        baseline = peak = current_rss()
+        res = self.client.get(EXPORT_URL)
+        lines = size = 0
+        for chunk in res.streaming_content:
+            lines += chunk.count(b"\n")
+            size += len(chunk)
+            peak = max(peak, current_rss())
+
+        self.assertEqual(lines, count)
+        self.assertGreater(size, 16 * MB)
+        self.assertLess(peak - baseline, 16 * MB)
+
+    def seed(self, count):
+        """Insert recepies with a tag and two ingredients each in SQL"""
+        tag = sample_tag(user=self.user)
+        ingredients = [sample_ingredient(user=self.user, name=name)
+                       for name in ("Rice", "Jaggery")]
+        table = Recepie._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO "{table}" '
+                "(user_id, title, prep_time, price, link, image_status) "
+                "SELECT %s, 'Recepie ' || n, n %% 180, n %% 100000 / 100.0, "
+                "'https://example.com/recepies/' || n, '' "
+                "FROM generate_series(1, %s) AS n",
+                [self.user.pk, count],
+            )
+            for field, related in (("tags", [tag]),
+                                   ("ingredients", ingredients)):
+                through = getattr(Recepie, field).through
+                column = through._meta.get_field(field[:-1]).column
+                for obj in related:
+                    cursor.execute(
+                        f'INSERT INTO "{through._meta.db_table}" '
+                        f'(recepie_id, "{column}") '
+                        f'SELECT id, %s FROM "{table}" WHERE user_id = %s',
+                        [obj.pk, self.user.pk],
+                    )
@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Count
 from core.models import User
 from django.urls import reverse
 from django.test import TestCase
@@ -6,12 +7,13 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Ingredient
+from core.models import Ingredient, Recepie
 
 from ..serializers import IngredientSerializer
 
 
 INGREDIENTS_URL = reverse("recepie:ingredient-list")
+INGREDIENTS_BULK_URL = reverse("recepie:ingredient-bulk")
 
 
 class PublicIngredientsApiTests(TestCase):
@@ -44,10 +46,12 @@ class PrivateIngredientsApiTests(TestCase):
 
         res = self.client.get(INGREDIENTS_URL)
 
-        ingredients = Ingredient.objects.all().order_by("-name")
+        ingredients = Ingredient.objects.annotate(
+            recepie_count=Count("recepie")
+        ).order_by("-name")
         serializer = IngredientSerializer(ingredients, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         """
@@ -62,8 +66,8 @@ class PrivateIngredientsApiTests(TestCase):
         ingredient = Ingredient.objects.create(user=self.user, name="Okra")
         res = self.client.get(INGREDIENTS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]["name"], ingredient.name)
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertEqual(res.data["results"][0]["name"], ingredient.name)
 
     def test_create_ingredient_successful(self):
         """Test create new ingredient"""
@@ -82,3 +86,77 @@ class PrivateIngredientsApiTests(TestCase):
         res = self.client.post(INGREDIENTS_URL, payload)
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_duplicate_ingredient(self):
+        """Test creating an ingredient the user already has fails"""
+        Ingredient.objects.create(user=self.user, name="Cabbage")
+        res = self.client.post(INGREDIENTS_URL, {"name": " cabbage "})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Ingredient.objects.count(), 1)
+
+    def test_bulk_create_ingredients(self):
+        """Test fetching or creating many ingredients at once"""
+        salt = Ingredient.objects.create(user=self.user, name="Salt")
+        payload = {"names": ["salt", "Black  Pepper", " black pepper", "Oil"]}
+
+        with self.assertNumQueries(5):
+            res = self.client.post(
+                INGREDIENTS_BULK_URL,
+                payload,
+                format="json",
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [item["name"] for item in res.data],
+            ["Salt", "Black Pepper", "Oil"],
+        )
+        self.assertEqual(res.data[0]["id"], salt.id)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 3)
+
+    def test_bulk_existing_ingredients(self):
+        """Test fetching only existing ingredients creates nothing"""
+        Ingredient.objects.create(user=self.user, name="Salt")
+        res = self.client.post(
+            INGREDIENTS_BULK_URL,
+            {"names": ["SALT"]},
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(Ingredient.objects.count(), 1)
+
+    def test_bulk_ingredients_limited_to_user(self):
+        """Test ingredients of other users are never returned"""
+        user2 = get_user_model().objects.create_user(
+            "otheringd@test.com",
+            "testpass@1234",
+        )
+        other = Ingredient.objects.create(user=user2, name="Salt")
+        res = self.client.post(
+            INGREDIENTS_BULK_URL,
+            {"names": ["Salt"]},
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(res.data[0]["id"], other.id)
+
+    def test_ingredients_assigned_only(self):
+        """Test filtering ingredients to those assigned to recepies"""
+        salt = Ingredient.objects.create(user=self.user, name="Salt")
+        Ingredient.objects.create(user=self.user, name="Saffron")
+        recepie = Recepie.objects.create(
+            user=self.user,
+            title="Dal",
+            prep_time=10,
+            price=5,
+        )
+        recepie.ingredients.add(salt)
+
+        res = self.client.get(INGREDIENTS_URL, {"assigned_only": "true"})
+
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertEqual(res.data["results"][0]["name"], "Salt")
+        self.assertEqual(res.data["results"][0]["recepie_count"], 1)
@@ -0,0 +1,150 @@
+import hashlib
+import tempfile
+from pathlib import Path
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from rest_framework import status
+
+from core.models import Recepie
+
+from .. import images
+
+CONTENT = bytes(range(256)) * 4
+
+
+class MediaServingTests(TestCase):
+    """Test serving recepie images"""
+
+    def setUp(self) -> None:
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.storage = Recepie._meta.get_field("image").storage
+        self.name = self.storage.save(
+            "uploads/recepie/dal.jpg",
+            ContentFile(CONTENT),
+        )
+        self.url = self.storage.url(self.name)
+
+    def test_serve_image(self):
+        """Test an image is served with validators and range support"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(res.streaming_content), CONTENT)
+        self.assertEqual(res["Content-Type"], "image/jpeg")
+        self.assertEqual(res["Accept-Ranges"], "bytes")
+        self.assertEqual(res["Cache-Control"],
+                         "public, max-age=31536000, immutable")
+        self.assertEqual(res["ETag"],
+                         f'"{hashlib.sha256(CONTENT).hexdigest()}"')
+        self.assertIn("Last-Modified", res)
+
+    def test_serve_unhashed_image(self):
+        """Test images stored before content addressing are revalidated"""
+        name = "uploads/recepie/dal.jpg"
+        Path(self.storage.path(name)).write_bytes(CONTENT)
+
+        res = self.client.get(self.storage.url(name))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Cache-Control"], "public, no-cache")
+        self.assertTrue(res["ETag"].startswith('"'))
+
+    def test_not_modified(self):
+        """Test a matching If-None-Match gets an empty 304"""
+        etag = self.client.get(self.url)["ETag"]
+
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b"")
+        self.assertEqual(res["ETag"], etag)
+
+    def test_variant_immutable(self):
+        """Test variants are cached for good under their own ETag"""
+        variant = images.variant_name(self.name, "small", "webp")
+        Path(self.storage.path(variant)).write_bytes(b"variant")
+
+        res = self.client.get(self.storage.url(variant))
+
+        self.assertEqual(res["Cache-Control"],
+                         "public, max-age=31536000, immutable")
+        self.assertEqual(res["ETag"], f'"{Path(variant).stem}"')
+
+    def test_range(self):
+        """Test single byte ranges are served partially"""
+        for header, start, end in (
+            ("bytes=10-19", 10, 19),
+            ("bytes=1000-", 1000, 1023),
+            ("bytes=-4", 1020, 1023),
+            ("bytes=1020-5000", 1020, 1023),
+        ):
+            res = self.client.get(self.url, HTTP_RANGE=header)
+
+            self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+            self.assertEqual(
+                b"".join(res.streaming_content),
+                CONTENT[start:end + 1],
+            )
+            self.assertEqual(res["Content-Range"],
+                             f"bytes {start}-{end}/{len(CONTENT)}")
+            self.assertEqual(res["Content-Length"], str(end - start + 1))
+
+    def test_range_not_satisfiable(self):
+        """Test a range past the end of the file is rejected"""
+        res = self.client.get(self.url, HTTP_RANGE="bytes=2000-")
+
+        self.assertEqual(
+            res.status_code,
+            status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+        )
+        self.assertEqual(res["Content-Range"], f"bytes */{len(CONTENT)}")
+
+    def test_if_range_mismatch(self):
+        """Test a stale If-Range gets the whole image"""
+        res = self.client.get(
+            self.url,
+            HTTP_RANGE="bytes=0-9",
+            HTTP_IF_RANGE='"stale"',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(res.streaming_content), CONTENT)
+
+    @override_settings(RECEPIE_MEDIA_SENDFILE="x-accel-redirect")
+    def test_x_accel_redirect(self):
+        """Test transfers can be handed to nginx"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.content, b"")
+        self.assertEqual(res["X-Accel-Redirect"],
+                         f"/protected-media/{self.name}")
+        self.assertIn("ETag", res)
+
+    @override_settings(RECEPIE_MEDIA_SENDFILE="x-sendfile")
+    def test_x_sendfile(self):
+        """Test transfers can be handed to a server supporting X-Sendfile"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res["X-Sendfile"], self.storage.path(self.name))
+        self.assertEqual(res.content, b"")
+
+    def test_outside_upload_dir_not_found(self):
+        """Test only stored images can be requested"""
+        Path(self.storage.path("secret.txt")).write_bytes(b"secret")
+        for path in ("secret.txt", "uploads/recepie/../../secret.txt",
+                     "uploads/recepie/missing.jpg"):
+            res = self.client.get(f"/media/{path}")
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_post_not_allowed(self):
+        """Test images can only be read"""
+        res = self.client.post(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
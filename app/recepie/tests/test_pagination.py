@@ -0,0 +1,103 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recepie, Tag
+
+from ..pagination import RecepieCursorPagination
+from .test_recepie_api import RECEPIES_URL, sample_recepie
+
+TAGS_URL = reverse("recepie:tag-list")
+
+
+class CursorPaginationTests(TestCase):
+    """Test cursor pagination of the recepie API lists"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "pages@test.com",
+            "testpass@123",
+        )
+        self.client.force_authenticate(self.user)
+
+    def collect(self, url, **params):
+        """Follow next links and return every page of results"""
+        pages = []
+        res = self.client.get(url, params)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append(res.data["results"])
+            if not res.data["next"]:
+                return pages
+            res = self.client.get(res.data["next"])
+
+    def test_recepies_paginated_in_id_order(self):
+        """Test recepie pages follow each other in id order"""
+        for i in range(5):
+            sample_recepie(user=self.user, title=f"Recepie {i}")
+
+        pages = self.collect(RECEPIES_URL, page_size=2)
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        ids = [item["id"] for page in pages for item in page]
+        expected = list(
+            Recepie.objects.order_by("id").values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_tags_paginated_in_name_order(self):
+        """Test tag pages follow each other in name order"""
+        for name in ("Vegan", "Sweet", "Spicy", "Dessert", "Curry"):
+            Tag.objects.create(user=self.user, name=name)
+
+        pages = self.collect(TAGS_URL, page_size=2)
+
+        ids = [item["id"] for page in pages for item in page]
+        expected = list(
+            Tag.objects.order_by("-name", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_count_only_when_requested(self):
+        """Test the total count is opt-in"""
+        sample_recepie(user=self.user)
+        sample_recepie(user=self.user)
+
+        res = self.client.get(RECEPIES_URL)
+        self.assertNotIn("count", res.data)
+
+        res = self.client.get(RECEPIES_URL, {"count": "true", "page_size": 1})
+        self.assertEqual(res.data["count"], 2)
+        self.assertEqual(len(res.data["results"]), 1)
+
+    def test_page_size_capped(self):
+        """Test clients cannot request pages above the maximum size"""
+        for i in range(3):
+            sample_recepie(user=self.user, title=f"Recepie {i}")
+
+        with patch.object(RecepieCursorPagination, "max_page_size", 2):
+            res = self.client.get(RECEPIES_URL, {"page_size": 100})
+
+        self.assertEqual(len(res.data["results"]), 2)
+
+    def test_large_pages_streamed(self):
+        """Test pages with many results are streamed with the same body"""
+        for i in range(3):
+            sample_recepie(user=self.user, title=f"Recepie {i}")
+        with override_settings(JSON_STREAM_MIN_ITEMS=0):
+            expected = self.client.get(RECEPIES_URL, {"count": "true"})
+
+        with override_settings(JSON_STREAM_MIN_ITEMS=3):
+            res = self.client.get(RECEPIES_URL, {"count": "true"})
+            short = self.client.get(RECEPIES_URL, {"page_size": 2})
+
+        self.assertTrue(res.streaming)
+        self.assertEqual(res["Content-Type"], expected["Content-Type"])
+        self.assertEqual(b"".join(res.streaming_content), expected.content)
+        self.assertFalse(short.streaming)
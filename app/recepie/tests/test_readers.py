@@ -0,0 +1,125 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Prefetch
+from django.test import TestCase
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recepie, Tag
+
+from .. import readers
+from ..serializers import (
+    IngredientSerializer,
+    RecepieDetailSerializer,
+    RecepieSerializer,
+    TagSerializer,
+)
+from .test_recepie_api import (
+    RECEPIES_URL,
+    detail_url,
+    sample_ingredient,
+    sample_recepie,
+    sample_tag,
+)
+from .test_tags_api import TAGS_URL
+
+FIELDS = ("id", "title", "prep_time", "price", "link")
+
+
+class ReadSerializerTests(TestCase):
+    """Test the read serializers render like the model serializers"""
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            "readers@test.com",
+            "testpass@123",
+        )
+        tags = [sample_tag(self.user, name) for name in ("Vegan", "Dessert")]
+        ingredients = [
+            sample_ingredient(self.user, name)
+            for name in ("Salt", "Jaggery", "Rice")
+        ]
+        recepie = sample_recepie(self.user, title="Kheer", price=Decimal("5"),
+                                 link="https://example.com/kheer")
+        # Linked out of id order, which both paths must order by id
+        recepie.tags.add(tags[1])
+        recepie.tags.add(tags[0])
+        recepie.ingredients.add(*reversed(ingredients))
+        sample_recepie(self.user, title="Plain", price=Decimal("999.99"))
+        sample_recepie(self.user, title="Cheap", price=Decimal("0.5"),
+                       prep_time=0)
+
+    def render(self, data) -> bytes:
+        return JSONRenderer().render(data)
+
+    def prefetched(self, related_fields):
+        return Recepie.objects.order_by("id").prefetch_related(*(
+            Prefetch(field, queryset=model.objects.only(*related_fields)
+                     .order_by("id"))
+            for field, model in (("ingredients", Ingredient), ("tags", Tag))
+        ))
+
+    def test_recepie_list_identical(self):
+        """Test recepie lists render byte for byte the same"""
+        expected = RecepieSerializer(self.prefetched(("id",)), many=True)
+        rows = Recepie.objects.order_by("id").values(*FIELDS)
+
+        data = readers.RecepieReadSerializer(rows, many=True).data
+
+        self.assertEqual(self.render(data), self.render(expected.data))
+
+    def test_recepie_detail_identical(self):
+        """Test recepie details with nested rows render the same"""
+        for recepie in self.prefetched(("id", "name")):
+            expected = RecepieDetailSerializer(recepie)
+            row = Recepie.objects.values(*FIELDS).get(pk=recepie.pk)
+
+            data = readers.RecepieDetailReadSerializer(row).data
+
+            self.assertEqual(self.render(data), self.render(expected.data))
+
+    def test_attr_lists_identical(self):
+        """Test tag and ingredient lists render the same, counts or not"""
+        for model, serializer_class, reader_class in (
+            (Tag, TagSerializer, readers.TagReadSerializer),
+            (Ingredient, IngredientSerializer,
+             readers.IngredientReadSerializer),
+        ):
+            queryset = model.objects.order_by("-name")
+            counted = queryset.annotate(recepie_count=Count("recepie"))
+            for objects, rows in (
+                (queryset, queryset.values("id", "name")),
+                (counted, counted.values("id", "name", "recepie_count")),
+            ):
+                expected = serializer_class(objects, many=True)
+
+                data = reader_class(rows, many=True).data
+
+                self.assertEqual(self.render(data),
+                                 self.render(expected.data))
+
+    def test_api_uses_read_serializers(self):
+        """Test list and retrieve responses match the model serializers"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        recepie = Recepie.objects.get(title="Kheer")
+
+        res = client.get(RECEPIES_URL)
+        expected = RecepieSerializer(self.prefetched(("id",)), many=True)
+        self.assertEqual(res.json()["results"], expected.data)
+
+        res = client.get(detail_url(recepie.id))
+        expected = RecepieDetailSerializer(
+            self.prefetched(("id", "name")).get(pk=recepie.pk)
+        )
+        self.assertEqual(res.content, self.render(expected.data))
+
+        res = client.get(TAGS_URL)
+        expected = TagSerializer(
+            Tag.objects.order_by("-name", "-id")
+            .annotate(recepie_count=Count("recepie")),
+            many=True,
+        )
+        self.assertEqual(res.json()["results"], expected.data)
@@ -1,18 +1,36 @@
+import hashlib
+import io
 import tempfile
 from pathlib import Path
+from unittest import mock
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recepie, Tag, Ingredient
-
-from ..serializers import RecepieSerializer, RecepieDetailSerializer
+from core.models import (
+    CollectionVersion,
+    ImageBlob,
+    Ingredient,
+    Recepie,
+    Tag,
+)
+
+from .. import images
+from ..serializers import (
+    RecepieDetailSerializer,
+    RecepieImageSerializer,
+    RecepieSerializer,
+)
 
 RECEPIES_URL = reverse("recepie:recepie-list")
 
@@ -29,6 +47,13 @@ def sample_ingredient(user, name="Cinnamon") -> Ingredient:
     return Ingredient.objects.create(user=user, name=name)
 
 
+def jpeg_bytes(size=(10, 10)):
+    """Return the bytes of a small JPEG image"""
+    buffer = io.BytesIO()
+    Image.new("RGB", size).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
 def image_upload_url(recepie_id):
     """Return URL for recepie image upload"""
     return reverse("recepie:recepie-upload-image", args=[recepie_id])
@@ -79,9 +104,9 @@ class PrivateRecepieApiTests(TestCase):
         recepies = Recepie.objects.all().order_by("id")
         serializer = RecepieSerializer(recepies, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 2)
+        self.assertEqual(len(res.data["results"]), 2)
         self.assertEqual(len(serializer.data), 2)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_recepies_limited_to_user(self):
         """Test retrieving recepies for user"""
@@ -97,8 +122,8 @@ class PrivateRecepieApiTests(TestCase):
 
         recepies = Recepie.objects.filter(user=self.user)
         serializer = RecepieSerializer(recepies, many=True)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_view_recepie_detail(self):
         """Test viewing a recepie detail"""
@@ -163,6 +188,31 @@ class PrivateRecepieApiTests(TestCase):
         self.assertIn(ingredient1, ingredients)
         self.assertIn(ingredient2, ingredients)
 
+    def test_create_recepie_records_change_once(self):
+        """Test creating a recepie with links bumps the version once"""
+        tag = sample_tag(user=self.user, name="Vegan")
+        ingredient = sample_ingredient(user=self.user, name="Basil")
+        version, _ = CollectionVersion.objects.get_stamp(self.user.pk)
+        payload = {
+            "title": "Basil Pesto",
+            "tags": [tag.id],
+            "ingredients": [ingredient.id],
+            "prep_time": 10,
+            "price": 5.0
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(RECEPIES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            CollectionVersion.objects.get_stamp(self.user.pk)[0],
+            version + 1,
+        )
+        self.assertTrue(Recepie.objects.filter(
+            pk=res.data["id"],
+            search_vector="basil",
+        ).exists())
+
     def test_update_recepie_update_partial(self):
         """Test updating a recepie with patch"""
         recepie = sample_recepie(user=self.user)
@@ -242,3 +292,338 @@ class RecepieImageUploadTests(TestCase):
             format="multipart",
         )
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def upload_dir_files(self):
+        """Return the names of the files in the recepie upload directory"""
+        upload_dir = Path(self.recepie.image.storage.path("uploads/recepie"))
+        if not upload_dir.exists():
+            return set()
+        return {path.name for path in upload_dir.iterdir()}
+
+    def test_upload_image_streamed_into_storage(self):
+        """Test an upload is written in place and named after its format"""
+        with mock.patch.object(
+            FileSystemStorage, "_save", side_effect=AssertionError
+        ):
+            res = self.client.post(
+                image_upload_url(self.recepie.id),
+                {"image": SimpleUploadedFile("dal.png", jpeg_bytes())},
+                format="multipart",
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recepie.refresh_from_db()
+        self.assertTrue(self.recepie.image.name.endswith(".jpg"))
+        self.assertEqual(
+            Path(self.recepie.image.path).read_bytes(),
+            jpeg_bytes(),
+        )
+
+    def test_upload_non_image_rejected(self):
+        """Test a file that does not start like an image is rejected"""
+        before = self.upload_dir_files()
+        res = self.client.post(
+            image_upload_url(self.recepie.id),
+            {"image": SimpleUploadedFile("dal.jpg", b"not an image" * 10)},
+            format="multipart",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("image", res.data)
+        self.assertEqual(self.upload_dir_files(), before)
+
+    @override_settings(RECEPIE_IMAGE_MAX_SIZE=1024)
+    def test_upload_image_too_large(self):
+        """Test uploads over the size limit are rejected while streaming"""
+        before = self.upload_dir_files()
+        for size in (2 * 1024, 256 * 1024):
+            content = jpeg_bytes() + b"\0" * size
+            res = self.client.post(
+                image_upload_url(self.recepie.id),
+                {"image": SimpleUploadedFile("dal.jpg", content)},
+                format="multipart",
+            )
+
+            self.assertEqual(
+                res.status_code,
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+            self.assertEqual(self.upload_dir_files(), before)
+
+    def upload_image(self, img, recepie=None, **save_kwargs):
+        """Upload an image and run the processing scheduled on commit"""
+        recepie = recepie or self.recepie
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as ntf:
+            img.save(ntf, format="JPEG", **save_kwargs)
+            ntf.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.post(
+                    image_upload_url(recepie.id),
+                    {"image": ntf},
+                    format="multipart",
+                )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recepie.refresh_from_db()
+        self.addCleanup(self.delete_variants, recepie.image.path)
+        return res
+
+    def delete_variants(self, path):
+        for names in images.variant_names(path).values():
+            for name in names.values():
+                Path(name).unlink(missing_ok=True)
+
+    def test_upload_image_pending(self):
+        """Test an uploaded image is pending until it is processed"""
+        res = self.client.post(
+            image_upload_url(self.recepie.id),
+            {"image": SimpleUploadedFile("dal.jpg", jpeg_bytes())},
+            format="multipart",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["image_status"], images.PENDING)
+        self.assertEqual(res.data["image_variants"], {})
+
+    @override_settings(RECEPIE_IMAGE_PROCESSING="sync")
+    def test_upload_image_processed(self):
+        """Test processing writes every variant and exposes their URLs"""
+        self.upload_image(Image.new("RGB", (600, 300)))
+
+        self.assertEqual(self.recepie.image_status, images.READY)
+        variants = images.variant_names(self.recepie.image.path)
+        for size, edge in images.get_sizes().items():
+            with Image.open(variants[size]["jpeg"]) as thumbnail:
+                self.assertEqual(max(thumbnail.size), min(edge, 600))
+            with Image.open(variants[size]["webp"]) as thumbnail:
+                self.assertEqual(thumbnail.format, "WEBP")
+        self.assertTrue(Path(variants["original"]["webp"]).exists())
+
+        serializer = RecepieImageSerializer(self.recepie)
+        self.assertTrue(
+            serializer.data["image_variants"]["small"]["webp"]
+            .endswith("_small.webp")
+        )
+
+    @override_settings(RECEPIE_IMAGE_PROCESSING="sync")
+    def test_upload_same_image_shared(self):
+        """Test identical uploads share one stored and processed file"""
+        other = sample_recepie(user=self.user, title="Rice")
+        self.upload_image(Image.new("RGB", (30, 30)))
+        self.upload_image(Image.new("RGB", (30, 30)), recepie=other)
+
+        self.assertEqual(other.image.name, self.recepie.image.name)
+        self.assertEqual(other.image_status, images.READY)
+        blob = ImageBlob.objects.get(name=other.image.name)
+        self.assertEqual(blob.ref_count, 2)
+
+    @override_settings(RECEPIE_IMAGE_PROCESSING="sync")
+    def test_upload_image_not_rewritten(self):
+        """Test the re-encoded image is stored under its own digest"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(
+                image_upload_url(self.recepie.id),
+                {"image": SimpleUploadedFile("dal.jpg", jpeg_bytes())},
+                format="multipart",
+            )
+        self.recepie.refresh_from_db()
+        upload = self.recepie.image.name
+        for callback in callbacks:
+            callback()
+
+        self.recepie.refresh_from_db()
+        self.addCleanup(self.delete_variants, self.recepie.image.path)
+        content = Path(self.recepie.image.path).read_bytes()
+        self.assertNotEqual(self.recepie.image.name, upload)
+        self.assertEqual(Path(self.recepie.image.name).stem,
+                         hashlib.sha256(content).hexdigest())
+        self.assertEqual(
+            Path(self.recepie.image.storage.path(upload)).read_bytes(),
+            jpeg_bytes(),
+        )
+        self.assertEqual(ImageBlob.objects.get(name=upload).ref_count, 0)
+        self.assertEqual(
+            ImageBlob.objects.get(name=self.recepie.image.name).ref_count, 1
+        )
+
+    @override_settings(RECEPIE_IMAGE_PROCESSING="sync")
+    def test_upload_image_strips_metadata(self):
+        """Test processing rotates the image upright and drops its EXIF"""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = "Camera"
+        self.upload_image(Image.new("RGB", (40, 20)), exif=exif)
+
+        with Image.open(self.recepie.image.path) as img:
+            self.assertEqual(img.size, (20, 40))
+            self.assertEqual(dict(img.getexif()), {})
+
+    @override_settings(RECEPIE_IMAGE_PROCESSING="sync")
+    def test_upload_image_failed(self):
+        """Test an image that cannot be processed is marked as failed"""
+        with mock.patch.object(images, "process_image",
+                               side_effect=OSError("broken")), \
+                self.assertLogs(images.logger, "ERROR"):
+            self.upload_image(Image.new("RGB", (10, 10)))
+
+        self.assertEqual(self.recepie.image_status, images.FAILED)
+
+
+class RecepieFilterApiTests(TestCase):
+    """Test filtering the recepie list"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "filters@test.com",
+            "testpass@123",
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name="Vegan")
+        self.quick = sample_tag(user=self.user, name="Quick")
+        self.salt = sample_ingredient(user=self.user, name="Salt")
+        self.both = sample_recepie(user=self.user, title="Both", price=20)
+        self.both.tags.add(self.vegan, self.quick)
+        self.vegan_only = sample_recepie(
+            user=self.user,
+            title="Vegan only",
+            prep_time=60,
+        )
+        self.vegan_only.tags.add(self.vegan)
+        self.vegan_only.ingredients.add(self.salt)
+        self.plain = sample_recepie(user=self.user, title="Plain")
+
+    def titles(self, **params):
+        res = self.client.get(RECEPIES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item["title"] for item in res.data["results"]]
+
+    def test_filter_any_tag(self):
+        """Test returning recepies with any of the given tags"""
+        titles = self.titles(tags=f"{self.vegan.id},{self.quick.id}")
+        self.assertEqual(titles, ["Both", "Vegan only"])
+
+    def test_filter_all_tags(self):
+        """Test returning recepies with all of the given tags"""
+        titles = self.titles(
+            tags=f"{self.vegan.id},{self.quick.id}",
+            match="all",
+        )
+        self.assertEqual(titles, ["Both"])
+
+    def test_filter_ingredients(self):
+        """Test returning recepies with specific ingredients"""
+        self.assertEqual(self.titles(ingredients=self.salt.id), ["Vegan only"])
+
+    def test_filter_max_price_and_prep_time(self):
+        """Test returning recepies under a price and preparation time"""
+        self.assertEqual(self.titles(max_price="10"), ["Vegan only", "Plain"])
+        self.assertEqual(self.titles(max_prep_time=30), ["Both", "Plain"])
+
+    def test_filter_invalid(self):
+        """Test invalid filter values are rejected"""
+        for params in (
+            {"tags": "1,x"},
+            {"max_price": "cheap"},
+            {"max_price": "-1"},
+            {"max_prep_time": "1.5"},
+            {"match": "some"},
+        ):
+            res = self.client.get(RECEPIES_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_without_distinct(self):
+        """Test tag filters use EXISTS instead of a DISTINCT join"""
+        with CaptureQueriesContext(connection) as ctx:
+            self.titles(tags=f"{self.vegan.id},{self.quick.id}", match="all")
+        sql = next(
+            query["sql"] for query in ctx.captured_queries
+            if 'FROM "core_recepie"' in query["sql"]
+        )
+        self.assertIn("EXISTS", sql)
+        self.assertNotIn("DISTINCT", sql)
+
+
+class RecepieSearchApiTests(TestCase):
+    """Test searching the recepie list"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "search@test.com",
+            "testpass@123",
+        )
+        self.client.force_authenticate(self.user)
+
+    def titles(self, **params):
+        res = self.client.get(RECEPIES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item["title"] for item in res.data["results"]]
+
+    def test_search_title(self):
+        """Test searching recepies by words in their title"""
+        with self.captureOnCommitCallbacks(execute=True):
+            sample_recepie(user=self.user, title="Tomato soup")
+            sample_recepie(user=self.user, title="Chocolate cake")
+
+        self.assertEqual(self.titles(search="soups"), ["Tomato soup"])
+
+    def test_search_partial_word(self):
+        """Test searching recepies by the start of a word"""
+        with self.captureOnCommitCallbacks(execute=True):
+            sample_recepie(user=self.user, title="Chocolate cake")
+
+        self.assertEqual(self.titles(search="choc"), ["Chocolate cake"])
+
+    def test_search_ingredients_and_tags(self):
+        """Test searching recepies by ingredient and tag names"""
+        with self.captureOnCommitCallbacks(execute=True):
+            soup = sample_recepie(user=self.user, title="Soup")
+            soup.ingredients.add(
+                sample_ingredient(user=self.user, name="Garlic")
+            )
+            cake = sample_recepie(user=self.user, title="Cake")
+            cake.tags.add(sample_tag(user=self.user, name="Dessert"))
+
+        self.assertEqual(self.titles(search="garlic"), ["Soup"])
+        self.assertEqual(self.titles(search="dessert"), ["Cake"])
+
+    def test_search_ranks_title_matches_first(self):
+        """Test title matches rank above ingredient matches"""
+        with self.captureOnCommitCallbacks(execute=True):
+            salad = sample_recepie(user=self.user, title="Green salad")
+            salad.ingredients.add(
+                sample_ingredient(user=self.user, name="Tofu")
+            )
+            sample_recepie(user=self.user, title="Tofu stir fry")
+
+        self.assertEqual(
+            self.titles(search="tofu"),
+            ["Tofu stir fry", "Green salad"],
+        )
+
+    def test_search_paginated(self):
+        """Test ranked search results can be paged through"""
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                sample_recepie(user=self.user, title=f"Curry {i}")
+
+        res = self.client.get(
+            RECEPIES_URL,
+            {"search": "curry", "page_size": 2},
+        )
+        titles = [item["title"] for item in res.data["results"]]
+        while res.data["next"]:
+            res = self.client.get(res.data["next"])
+            titles.extend(item["title"] for item in res.data["results"])
+
+        self.assertEqual(sorted(titles), [f"Curry {i}" for i in range(5)])
+
+    def test_search_limited_to_user(self):
+        """Test search only returns the user's own recepies"""
+        user2 = get_user_model().objects.create_user(
+            "searchother@test.com",
+            "testpass@123",
+        )
+        sample_recepie(user=user2, title="Tomato soup")
+
+        self.assertEqual(self.titles(search="tomato"), [])
@@ -0,0 +1,207 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recepie
+
+from .test_recepie_api import sample_ingredient, sample_recepie, sample_tag
+
+BULK_URL = reverse("recepie:recepie-bulk")
+
+
+class PublicRecepieBulkApiTests(TestCase):
+    """Test unauthenticated bulk recepie API access"""
+
+    def test_auth_required(self):
+        """Test auth is required"""
+        res = APIClient().post(BULK_URL, [], format="json")
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateRecepieBulkApiTests(TestCase):
+    """Test the authenticated bulk recepie API"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "bulk@test.com",
+            "testpass@123",
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = sample_tag(user=self.user)
+        self.ingredient = sample_ingredient(user=self.user)
+
+    def payload(self, count):
+        return [
+            {
+                "title": f"Recepie {i}",
+                "prep_time": 10 + i,
+                "price": "4.50",
+                "tags": [self.tag.id],
+                "ingredients": [self.ingredient.id],
+            }
+            for i in range(count)
+        ]
+
+    def test_bulk_create(self):
+        """Test creating many recepies at once"""
+        res = self.client.post(BULK_URL, self.payload(3), format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 3)
+        recepies = Recepie.objects.filter(user=self.user).order_by("id")
+        self.assertEqual(
+            [recepie.title for recepie in recepies],
+            ["Recepie 0", "Recepie 1", "Recepie 2"],
+        )
+        for recepie, data in zip(recepies, res.data):
+            self.assertEqual(data["id"], recepie.id)
+            self.assertEqual(list(recepie.tags.all()), [self.tag])
+            self.assertEqual(
+                list(recepie.ingredients.all()),
+                [self.ingredient],
+            )
+
+    def test_bulk_create_constant_queries(self):
+        """Test bulk creating costs the same however many items are sent"""
+        counts = []
+        for size in (2, 50):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post(BULK_URL, self.payload(size), format="json")
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_bulk_create_reports_item_errors(self):
+        """Test invalid items are reported per item and nothing is saved"""
+        other = get_user_model().objects.create_user(
+            "bulkother@test.com",
+            "testpass@123",
+        )
+        other_tag = sample_tag(user=other)
+        payload = self.payload(3)
+        payload[0]["tags"] = [other_tag.id]
+        payload[2]["ingredients"] = [self.ingredient.id + 100]
+
+        res = self.client.post(BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("tags", res.data[0])
+        self.assertEqual(res.data[1], {})
+        self.assertIn("ingredients", res.data[2])
+        self.assertFalse(Recepie.objects.exists())
+
+    def test_bulk_create_reports_field_errors(self):
+        """Test items failing field validation are reported per item"""
+        payload = self.payload(2)
+        del payload[1]["title"]
+
+        res = self.client.post(BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn("title", res.data[1])
+        self.assertFalse(Recepie.objects.exists())
+
+    def test_bulk_create_empty(self):
+        """Test an empty list of recepies is rejected"""
+        res = self.client.post(BULK_URL, [], format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update(self):
+        """Test updating many recepies at once"""
+        recepie1 = sample_recepie(user=self.user)
+        recepie2 = sample_recepie(user=self.user)
+        recepie2.tags.add(self.tag)
+        new_tag = sample_tag(user=self.user, name="Curry")
+        payload = [
+            {"id": recepie1.id, "title": "Renamed"},
+            {"id": recepie2.id, "price": "9.99", "tags": [new_tag.id]},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recepie1.refresh_from_db()
+        recepie2.refresh_from_db()
+        self.assertEqual(recepie1.title, "Renamed")
+        self.assertEqual(recepie2.price, Decimal("9.99"))
+        self.assertEqual(list(recepie2.tags.all()), [new_tag])
+
+    def test_bulk_update_repeated_id(self):
+        """Test a recepie listed twice is reported on its second item"""
+        recepie = sample_recepie(user=self.user)
+        payload = [
+            {"id": recepie.id, "tags": [self.tag.id]},
+            {"id": recepie.id, "tags": [self.tag.id]},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn("id", res.data[1])
+        self.assertFalse(recepie.tags.exists())
+
+    def test_bulk_update_other_users_recepie(self):
+        """Test recepies of other users cannot be updated"""
+        other = get_user_model().objects.create_user(
+            "bulkother@test.com",
+            "testpass@123",
+        )
+        recepie = sample_recepie(user=other)
+        payload = [{"id": recepie.id, "title": "Stolen"}]
+
+        res = self.client.patch(BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("id", res.data[0])
+        recepie.refresh_from_db()
+        self.assertEqual(recepie.title, "Sample recepie")
+
+    def test_bulk_delete(self):
+        """Test deleting many recepies at once"""
+        recepie1 = sample_recepie(user=self.user)
+        recepie2 = sample_recepie(user=self.user)
+        keep = sample_recepie(user=self.user)
+
+        res = self.client.delete(
+            BULK_URL,
+            {"ids": [recepie1.id, recepie2.id]},
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Recepie.objects.all()), [keep])
+
+    def test_bulk_delete_constant_queries(self):
+        """Test bulk deleting costs the same however many items are sent"""
+        counts = []
+        for size in (2, 50):
+            ids = [sample_recepie(user=self.user).id for _ in range(size)]
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.delete(BULK_URL, {"ids": ids},
+                                         format="json")
+            self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_bulk_delete_missing(self):
+        """Test nothing is deleted when an id is not found"""
+        recepie = sample_recepie(user=self.user)
+
+        res = self.client.delete(
+            BULK_URL,
+            {"ids": [recepie.id, recepie.id + 100]},
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Recepie.objects.filter(id=recepie.id).exists())
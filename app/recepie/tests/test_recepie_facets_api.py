@@ -0,0 +1,149 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from .test_recepie_api import sample_ingredient, sample_recepie, sample_tag
+
+FACETS_URL = reverse("recepie:recepie-facets")
+
+
+class PublicRecepieFacetsApiTests(TestCase):
+    """Test unauthenticated recepie facets API access"""
+
+    def test_auth_required(self):
+        """Test auth is required"""
+        res = APIClient().get(FACETS_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateRecepieFacetsApiTests(TestCase):
+    """Test the authenticated recepie facets API"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "facets@test.com",
+            "testpass@123",
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name="Vegan")
+        self.dessert = sample_tag(user=self.user, name="Dessert")
+        self.salt = sample_ingredient(user=self.user, name="Salt")
+
+        dal = sample_recepie(user=self.user, price=4, prep_time=20)
+        dal.tags.add(self.vegan)
+        dal.ingredients.add(self.salt)
+        cake = sample_recepie(user=self.user, price=12, prep_time=90)
+        cake.tags.add(self.vegan, self.dessert)
+        sample_recepie(user=self.user, price=60, prep_time=5)
+
+    def get_facets(self, **params):
+        res = self.client.get(FACETS_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_facets(self):
+        """Test facets count recepies per tag, ingredient and bucket"""
+        with self.assertNumQueries(3):
+            facets = self.get_facets()
+
+        self.assertEqual(facets["total"], 3)
+        self.assertEqual(facets["tags"], [
+            {"id": self.vegan.id, "name": "Vegan", "count": 2},
+            {"id": self.dessert.id, "name": "Dessert", "count": 1},
+        ])
+        self.assertEqual(facets["ingredients"], [
+            {"id": self.salt.id, "name": "Salt", "count": 1},
+        ])
+        self.assertEqual(
+            [bucket["count"] for bucket in facets["price"]],
+            [1, 0, 1, 0, 1],
+        )
+        self.assertEqual(facets["price"][-1], {
+            "min": "50.00",
+            "max": None,
+            "count": 1,
+        })
+        self.assertEqual(
+            [bucket["count"] for bucket in facets["prep_time"]],
+            [1, 1, 0, 1, 0],
+        )
+
+    def test_facets_filtered(self):
+        """Test facets only count recepies matching the filters"""
+        facets = self.get_facets(tags=self.dessert.id)
+
+        self.assertEqual(facets["total"], 1)
+        self.assertEqual(facets["tags"], [
+            {"id": self.dessert.id, "name": "Dessert", "count": 1},
+            {"id": self.vegan.id, "name": "Vegan", "count": 1},
+        ])
+        self.assertEqual(facets["ingredients"], [])
+
+    def test_facets_limited_to_user(self):
+        """Test facets ignore other users' recepies"""
+        user2 = get_user_model().objects.create_user(
+            "facetsother@test.com",
+            "testpass@123",
+        )
+        other = sample_recepie(user=user2)
+        other.tags.add(sample_tag(user=user2, name="Vegan"))
+
+        self.assertEqual(self.get_facets()["total"], 3)
+
+    @override_settings(RECEPIE_FACETS_CACHE_TIMEOUT=60)
+    def test_facets_cached_until_recepies_change(self):
+        """Test cached facets are served until a recepie is written"""
+        cache.clear()
+        self.get_facets()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_facets()["total"], 3)
+
+        sample_recepie(user=self.user)
+        self.assertEqual(self.get_facets()["total"], 4)
+        cache.clear()
+
+
+@override_settings(RECEPIE_FACETS_CACHE_TIMEOUT=60)
+class ConcurrentRecepieFacetsTests(TransactionTestCase):
+    """Test cached facets against reads racing a write"""
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "facetsrace@test.com",
+            "testpass@123",
+        )
+        self.client.force_authenticate(self.user)
+        sample_recepie(user=self.user)
+
+    def get_total(self):
+        return self.client.get(FACETS_URL).data["total"]
+
+    def test_read_during_write_not_cached_after_commit(self):
+        """Test facets read before a write commits are not served after"""
+        totals = []
+
+        def read():
+            try:
+                totals.append(self.get_total())
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            sample_recepie(user=self.user)
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join()
+
+        self.assertEqual(totals, [1])
+        self.assertEqual(self.get_total(), 2)
@@ -0,0 +1,131 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recepie, Tag, Ingredient
+
+from .test_recepie_api import RECEPIES_URL, detail_url, sample_recepie
+
+
+class RecepieQueryCountTests(TestCase):
+    """Test the recepie API runs a constant number of queries per action"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "queries@test.com",
+            "testpass@123",
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name="Vegan")
+        self.ingredient = Ingredient.objects.create(
+            user=self.user,
+            name="Salt",
+        )
+        self.seeded = 0
+
+    def seed(self, count):
+        """Create recepies each linked to their own tags and ingredients"""
+        recepies = []
+        start = self.seeded
+        self.seeded += count
+        for i in range(start, self.seeded):
+            recepie = sample_recepie(user=self.user, title=f"Recepie {i}")
+            recepie.tags.add(
+                *Tag.objects.bulk_create([
+                    Tag(user=self.user, name=f"Tag {i}-{j}")
+                    for j in range(3)
+                ])
+            )
+            recepie.ingredients.add(
+                *Ingredient.objects.bulk_create([
+                    Ingredient(user=self.user, name=f"Ingredient {i}-{j}")
+                    for j in range(3)
+                ])
+            )
+            recepies.append(recepie)
+        return recepies
+
+    def count_queries(self, method, url, data=None):
+        """Return the number of queries a request runs"""
+        with CaptureQueriesContext(connection) as ctx:
+            res = getattr(self.client, method)(url, data)
+        self.assertLess(res.status_code, status.HTTP_400_BAD_REQUEST)
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, method, make_url, make_data=None):
+        """Assert a request costs the same on a small and a large dataset"""
+        counts = []
+        for size in (1, 20):
+            recepie = self.seed(size)[-1]
+            data = make_data() if make_data else None
+            counts.append(self.count_queries(method, make_url(recepie), data))
+        self.assertEqual(counts[0], counts[1])
+
+    def payload(self):
+        return {
+            "title": "Dal",
+            "prep_time": 20,
+            "price": 3.5,
+            "tags": [self.tag.id],
+            "ingredients": [self.ingredient.id],
+        }
+
+    def test_list_constant_queries(self):
+        """Test listing recepies runs a constant number of queries"""
+        self.assertConstantQueries("get", lambda recepie: RECEPIES_URL)
+
+    def test_retrieve_constant_queries(self):
+        """Test retrieving a recepie runs a constant number of queries"""
+        self.assertConstantQueries(
+            "get",
+            lambda recepie: detail_url(recepie.id),
+        )
+
+    def test_create_constant_queries(self):
+        """Test creating a recepie runs a constant number of queries"""
+        self.assertConstantQueries(
+            "post",
+            lambda recepie: RECEPIES_URL,
+            self.payload,
+        )
+
+    def test_update_constant_queries(self):
+        """Test updating a recepie runs a constant number of queries"""
+        self.assertConstantQueries(
+            "put",
+            lambda recepie: detail_url(recepie.id),
+            self.payload,
+        )
+
+    def test_partial_update_constant_queries(self):
+        """Test patching a recepie runs a constant number of queries"""
+        self.assertConstantQueries(
+            "patch",
+            lambda recepie: detail_url(recepie.id),
+            lambda: {"title": "Patched"},
+        )
+
+    def test_destroy_constant_queries(self):
+        """Test deleting a recepie runs a constant number of queries"""
+        self.assertConstantQueries(
+            "delete",
+            lambda recepie: detail_url(recepie.id),
+        )
+
+    def test_list_loads_only_serialized_columns(self):
+        """Test listing recepies does not load unused columns"""
+        self.seed(2)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(RECEPIES_URL)
+        recepie_sql = next(
+            query["sql"] for query in ctx.captured_queries
+            if query["sql"].startswith(
+                f'SELECT "{Recepie._meta.db_table}"."id"'
+            )
+        )
+        self.assertNotIn('"image"', recepie_sql)
@@ -1,15 +1,18 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Count
 from django.urls import reverse
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Tag
+from core.models import Recepie, Tag
 
 from ..serializers import TagSerializer
 
 TAGS_URL = reverse("recepie:tag-list")
+TAGS_BULK_URL = reverse("recepie:tag-bulk")
 
 
 class PublicTagsApiTests(TestCase):
@@ -43,9 +46,11 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
-        tags = Tag.objects.all().order_by("-name")
+        tags = Tag.objects.annotate(
+            recepie_count=Count("recepie")
+        ).order_by("-name")
         serializer = TagSerializer(tags, many=True)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_tags_limited_to_user(self):
         """Test that tags returned are for the authenticated user"""
@@ -66,8 +71,8 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]["name"], tag.name)
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertEqual(res.data["results"][0]["name"], tag.name)
 
     def test_create_tags_successful(self):
         """Test creating a new tag"""
@@ -86,3 +91,122 @@ class PrivateTagsApiTests(TestCase):
         payload = {"name": ""}
         res = self.client.post(TAGS_URL, payload)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_duplicate_tag(self):
+        """Test creating a tag the user already has fails"""
+        Tag.objects.create(user=self.user, name="Comfort Food")
+        res = self.client.post(TAGS_URL, {"name": "comfort   food"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_duplicate_tag_folded_by_database(self):
+        """Test duplicates are found the way the unique index folds case"""
+        Tag.objects.create(user=self.user, name="İstanbul")
+        res = self.client.post(TAGS_URL, {"name": "istanbul"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_tags_non_ascii(self):
+        """Test names Python folds differently from the database"""
+        res = self.client.post(
+            TAGS_BULK_URL,
+            {"names": ["ΣΑΣ", "İstanbul", "istanbul"]},
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([tag["name"] for tag in res.data],
+                         ["ΣΑΣ", "İstanbul"])
+
+    def test_bulk_create_tags(self):
+        """Test fetching or creating many tags at once"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        res = self.client.post(
+            TAGS_BULK_URL,
+            {"names": ["Dessert", "vegan", "Dessert"]},
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [(item["id"], item["name"]) for item in res.data],
+            [
+                (Tag.objects.get(name="Dessert").id, "Dessert"),
+                (vegan.id, "Vegan"),
+            ],
+        )
+
+    def test_bulk_create_tags_invalid(self):
+        """Test bulk creating tags with an invalid payload"""
+        res = self.client.post(TAGS_BULK_URL, {"names": []}, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tags_recepie_counts(self):
+        """Test tags are listed with how many recepies use them"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        Tag.objects.create(user=self.user, name="Unused")
+        for title in ("Dal", "Salad"):
+            recepie = Recepie.objects.create(
+                user=self.user,
+                title=title,
+                prep_time=10,
+                price=5,
+            )
+            recepie.tags.add(vegan)
+
+        res = self.client.get(TAGS_URL)
+
+        counts = {
+            item["name"]: item["recepie_count"]
+            for item in res.data["results"]
+        }
+        self.assertEqual(counts, {"Vegan": 2, "Unused": 0})
+
+    def test_tags_assigned_only(self):
+        """Test filtering tags to those assigned to recepies"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        Tag.objects.create(user=self.user, name="Unused")
+        recepie = Recepie.objects.create(
+            user=self.user,
+            title="Dal",
+            prep_time=10,
+            price=5,
+        )
+        recepie.tags.add(vegan)
+
+        res = self.client.get(TAGS_URL, {"assigned_only": 1})
+
+        self.assertEqual(
+            [item["name"] for item in res.data["results"]],
+            ["Vegan"],
+        )
+
+    @override_settings(RECEPIE_ATTR_COUNTS_CACHE_TIMEOUT=60)
+    def test_tags_cached_recepie_counts(self):
+        """Test cached counts are refreshed when recepies change"""
+        cache.clear()
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        Tag.objects.create(user=self.user, name="Unused")
+        recepie = Recepie.objects.create(
+            user=self.user,
+            title="Dal",
+            prep_time=10,
+            price=5,
+        )
+        recepie.tags.add(vegan)
+
+        def counts(**params):
+            res = self.client.get(TAGS_URL, params)
+            return {
+                item["name"]: item["recepie_count"]
+                for item in res.data["results"]
+            }
+
+        self.assertEqual(counts(), {"Vegan": 1, "Unused": 0})
+        with self.assertNumQueries(2):
+            self.assertEqual(counts(assigned_only=1), {"Vegan": 1})
+
+        recepie.tags.clear()
+        self.assertEqual(counts(), {"Vegan": 0, "Unused": 0})
+        cache.clear()
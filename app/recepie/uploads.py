@@ -0,0 +1,203 @@
+"""Stream recepie image uploads straight into storage
+
+Django's default upload handlers buffer each file in memory or in a
+temporary file, which `ImageField` then moves or copies into MEDIA_ROOT.
+The handler here writes chunks next to their final location as they
+arrive, hashing them on the way so content-addressed storage can name or
+deduplicate the file without reading it again. It rejects anything whose
+first bytes are not an image and stops as soon as an upload grows past
+RECEPIE_IMAGE_MAX_SIZE.
+"""
+import hashlib
+import os
+from pathlib import Path
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.http.multipartparser import (
+    MultiPartParser as DjangoMultiPartParser,
+    MultiPartParserError,
+)
+
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError, ValidationError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+from core.models import Recepie, recepie_image_file_path
+
+SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+)
+EXTENSIONS = {
+    "JPEG": ".jpg",
+    "PNG": ".png",
+    "GIF": ".gif",
+    "WEBP": ".webp",
+}
+HEADER_SIZE = 12
+# Room for the multipart boundaries and part headers around the file
+MULTIPART_OVERHEAD = 64 * 1024
+INVALID_IMAGE = (
+    "Upload a valid image. The file you uploaded was either not an image "
+    "or a corrupted image."
+)
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "Uploaded file is too large."
+    default_code = "upload_too_large"
+
+
+def get_max_size() -> int:
+    """Return the largest image upload accepted, in bytes"""
+    return getattr(settings, "RECEPIE_IMAGE_MAX_SIZE", 20 * 1024 * 1024)
+
+
+def sniff_format(header):
+    """Return the image format a file's first bytes belong to, or None"""
+    for signature, fmt in SIGNATURES:
+        if header.startswith(signature):
+            return fmt
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def supports_streaming(storage) -> bool:
+    """Return whether a storage keeps its files on the local filesystem"""
+    try:
+        storage.path("")
+    except NotImplementedError:
+        return False
+    return True
+
+
+class StoredUpload(UploadedFile):
+    """An upload already written under its final name in storage"""
+
+    def __init__(self, storage_name, path, size, content_type, sha256):
+        super().__init__(
+            open(path, "rb"),
+            name=storage_name,
+            content_type=content_type,
+            size=size,
+        )
+        self.storage_name = storage_name
+        self.path = path
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.path
+
+
+class StreamingImageUploadHandler(FileUploadHandler):
+    """Write the `image` file of a request straight into recepie storage"""
+    field_name = "image"
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.storage = Recepie._meta.get_field("image").storage
+        self.max_size = get_max_size()
+        self.file = None
+        self.path = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length > self.max_size + MULTIPART_OVERHEAD:
+            raise UploadTooLarge()
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        if field_name != self.field_name or self.file is not None:
+            raise SkipFile()
+        self.storage_name = recepie_image_file_path(None, "upload.part")
+        self.path = self.storage.path(self.storage_name)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path, "wb")
+        self.hash = hashlib.sha256()
+        self.header = b""
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            self.discard()
+            raise UploadTooLarge()
+        if len(self.header) < HEADER_SIZE:
+            self.header += raw_data[:HEADER_SIZE - len(self.header)]
+            if len(self.header) == HEADER_SIZE:
+                self.check_header()
+        self.hash.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.close()
+        fmt = self.check_header()
+        try:
+            with Image.open(self.path) as image:
+                if image.format != fmt:
+                    raise ValueError(image.format)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            self.discard()
+            raise ValidationError({self.field_name: [INVALID_IMAGE]})
+
+        name = str(Path(self.storage_name).with_suffix(EXTENSIONS[fmt]))
+        digest = self.hash.hexdigest()
+        if hasattr(self.storage, "store"):
+            name = self.storage.store(self.path, name, digest)
+        else:
+            os.replace(self.path, self.storage.path(name))
+        self.path = None
+        return StoredUpload(
+            name,
+            self.storage.path(name),
+            file_size,
+            Image.MIME[fmt],
+            digest,
+        )
+
+    def upload_interrupted(self):
+        self.discard()
+
+    def check_header(self):
+        """Return the sniffed image format, rejecting anything else"""
+        fmt = sniff_format(self.header)
+        if fmt is None:
+            self.discard()
+            raise ValidationError({self.field_name: [INVALID_IMAGE]})
+        return fmt
+
+    def discard(self):
+        """Close and delete a partially written upload"""
+        if self.file is not None:
+            self.file.close()
+        if self.path is not None:
+            Path(self.path).unlink(missing_ok=True)
+            self.path = None
+
+
+class StreamingImageParser(MultiPartParser):
+    """Multipart parser streaming the `image` file into storage"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context["request"]
+        storage = Recepie._meta.get_field("image").storage
+        if not supports_streaming(storage):
+            return super().parse(stream, media_type, parser_context)
+
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta["CONTENT_TYPE"] = media_type
+        handlers = [StreamingImageUploadHandler(request)]
+        try:
+            parser = DjangoMultiPartParser(meta, stream, handlers, encoding)
+            data, files = parser.parse()
+        except MultiPartParserError as exc:
+            raise ParseError("Multipart form parse error - %s" % str(exc))
+        return DataAndFiles(data, files)
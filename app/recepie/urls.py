@@ -1,6 +1,7 @@
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 router.register('tags', views.TagViewSet)
@@ -9,6 +10,15 @@ router.register('recepies', views.RecepieViewSet)
 
 app_name = "recepie"
 
+# The recepie list and detail URLs, served by async views under ASGI
+async_urlpatterns = [
+    path("recepies/", async_views.recepie_list),
+    re_path(r"^recepies/(?P<pk>[^/.]+)/$", async_views.recepie_detail),
+]
+
 urlpatterns = [
     path("", include(router.urls))
 ]
+
+if settings.ASYNC_VIEWS:
+    urlpatterns = async_urlpatterns + urlpatterns
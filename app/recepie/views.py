@@ -1,65 +1,197 @@
+from django.db import transaction
+from django.db.models import Count, Prefetch
+from django.http import StreamingHttpResponse
+
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status, viewsets, mixins
-from rest_framework.authentication import TokenAuthentication
 
 from rest_framework.permissions import IsAuthenticated
-from .serializers import IngredientSerializer, RecepieSerializer, TagSerializer
+from . import images, readers
+from .aggregates import get_recepie_counts, get_recepie_facets
+from .conditional import (
+    ConditionalResponseMixin,
+    collection_changed,
+    collection_changes_suppressed,
+)
+from .export import CSVRenderer, NDJSONRenderer, iter_recepies
+from .filters import RecepieFilterBackend, RecepieSearchFilter
+from .pagination import NameCursorPagination, RecepieCursorPagination
+from .serializers import (
+    BulkRecepieListSerializer,
+    IngredientSerializer,
+    RecepieSerializer,
+    TagSerializer,
+)
+from .uploads import StreamingImageParser
 from core.models import Ingredient, Recepie, Tag
+from core.replicas import ReplicaReadMixin
+from user.authentication import CachedTokenAuthentication
 
 from recepie import serializers
 
 
-class BaseRecepieAttrViewSet(viewsets.GenericViewSet,
+class BaseRecepieAttrViewSet(ReplicaReadMixin,
+                             ConditionalResponseMixin,
+                             viewsets.GenericViewSet,
                              mixins.ListModelMixin,
                              mixins.CreateModelMixin):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = NameCursorPagination
 
     def get_queryset(self):
         """Return objects for the current authenticated user only"""
-        return self.queryset.filter(user=self.request.user).order_by("-name")
+        queryset = self.queryset.filter(
+            user=self.request.user
+        ).order_by("-name", "-id")
+        if self.action != "list":
+            return queryset
+
+        assigned_only = self.request.query_params.get("assigned_only", "")
+        assigned_only = assigned_only.lower() in ("1", "true", "yes")
+        self.recepie_counts = get_recepie_counts(
+            self.queryset.model,
+            self.request.user,
+            self.collection_version,
+        )
+        if self.recepie_counts is None:
+            queryset = queryset.annotate(recepie_count=Count("recepie"))
+            if assigned_only:
+                queryset = queryset.filter(recepie_count__gt=0)
+            return queryset.values("id", "name", "recepie_count")
+        if assigned_only:
+            queryset = queryset.filter(pk__in=list(self.recepie_counts))
+        return queryset.values("id", "name")
+
+    def paginate_queryset(self, queryset):
+        """Attach cached recepie counts to the rows on the page"""
+        page = super().paginate_queryset(queryset)
+        counts = getattr(self, "recepie_counts", None)
+        if counts is not None and page is not None:
+            for row in page:
+                row["recepie_count"] = counts.get(row["id"], 0)
+        return page
+
+    def get_serializer_class(self):
+        """Return the read serializer when listing"""
+        if self.action == "list":
+            return self.read_serializer_class
+        return self.serializer_class
 
     def perform_create(self, serializer):
         """Create a new object"""
         serializer.save(user=self.request.user)
 
+    @action(methods=["POST"], detail=False)
+    def bulk(self, request):
+        """Fetch or create objects for many names at once"""
+        serializer = serializers.RecepieAttrBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        objects, created = self.queryset.model.objects.get_or_create_by_names(
+            request.user,
+            serializer.validated_data["names"],
+        )
+        if created:
+            collection_changed(request.user.pk)
+        return Response(
+            self.get_serializer(objects, many=True).data,
+            status=status.HTTP_201_CREATED if created
+            else status.HTTP_200_OK
+        )
+
 
 class TagViewSet(BaseRecepieAttrViewSet):
     """Manage tags in the database"""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    read_serializer_class = readers.TagReadSerializer
 
 
 class IngredientViewSet(BaseRecepieAttrViewSet):
     """Manage Ingredients in the database"""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
+    read_serializer_class = readers.IngredientReadSerializer
 
 
-class RecepieViewSet(viewsets.ModelViewSet):
+class RecepieViewSet(ReplicaReadMixin,
+                     ConditionalResponseMixin,
+                     viewsets.ModelViewSet):
     serializer_class = RecepieSerializer
     queryset = Recepie.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecepieCursorPagination
+    filter_backends = (RecepieFilterBackend, RecepieSearchFilter)
+
+    # Columns the read actions serialize. list and retrieve fetch them with
+    # values() for the read serializers, which load related rows with one
+    # query per M2M field, so they run a fixed number of queries however
+    # many recepies, ingredients and tags the user has.
+    RECEPIE_FIELDS = ("id", "title", "prep_time", "price", "link")
+    READ_ACTIONS = ("list", "retrieve")
 
     def get_queryset(self):
         """Retrieve the recepies for the authenticated user only"""
-        return self.queryset.filter(user=self.request.user)
+        queryset = self.queryset.filter(user=self.request.user)
+        if self.action in self.READ_ACTIONS:
+            return queryset.values(*self.RECEPIE_FIELDS)
+        return queryset
+
+    def shape_queryset(self, queryset):
+        """Load only the serialized columns and prefetch related ids
+
+        Related rows are ordered by id, as the read serializers order them.
+        """
+        return queryset.only(*self.RECEPIE_FIELDS).prefetch_related(
+            Prefetch(
+                "ingredients",
+                queryset=Ingredient.objects.only("id").order_by("id")
+            ),
+            Prefetch(
+                "tags",
+                queryset=Tag.objects.only("id").order_by("id")
+            ),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_read(
+            request, super().retrieve, *args, **kwargs
+        )
 
     def get_serializer_class(self):
         """Return appropriate serializer class"""
-        if self.action == "retrieve":
-            return serializers.RecepieDetailSerializer
+        if self.action == "list":
+            return readers.RecepieReadSerializer
+        elif self.action == "retrieve":
+            return readers.RecepieDetailReadSerializer
         elif self.action == "upload_image":
             return serializers.RecepieImageSerializer
+        elif self.action == "bulk":
+            return serializers.RecepieBulkSerializer
         return self.serializer_class
 
     def perform_create(self, serializer):
         """Create a new Recepie"""
-        serializer.save(user=self.request.user)
+        self.save_recepie(serializer, user=self.request.user)
+
+    def perform_update(self, serializer):
+        self.save_recepie(serializer)
+
+    def save_recepie(self, serializer, **kwargs):
+        """Save a recepie and its links, recording the change once"""
+        with transaction.atomic():
+            with collection_changes_suppressed(self.request.user.pk):
+                serializer.save(**kwargs)
+            collection_changed(self.request.user.pk)
 
-    @action(methods=["POST"], detail=True, url_path="upload-image")
+    @action(
+        methods=["POST"],
+        detail=True,
+        url_path="upload-image",
+        parser_classes=[StreamingImageParser],
+    )
     def upload_image(self, request, pk=None):
         """Upload an image to a recepie"""
         recepie = self.get_object()
@@ -68,7 +200,8 @@ class RecepieViewSet(viewsets.ModelViewSet):
             data=request.data
         )
         if serializer.is_valid():
-            serializer.save()
+            recepie = serializer.save(image_status=images.PENDING)
+            images.schedule(recepie)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -77,3 +210,109 @@ class RecepieViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    @action(methods=["GET"], detail=False)
+    def facets(self, request):
+        """Count the filtered recepies per tag, ingredient and bucket"""
+        return self.conditional_read(request, self.get_facets_response)
+
+    def get_facets_response(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(get_recepie_facets(
+            request.user,
+            self.collection_version,
+            queryset,
+            request.query_params,
+        ))
+
+    @action(
+        methods=["GET"],
+        detail=False,
+        renderer_classes=[NDJSONRenderer, CSVRenderer],
+    )
+    def export(self, request):
+        """Stream every filtered recepie as NDJSON or CSV"""
+        renderer = request.accepted_renderer
+        queryset = self.filter_queryset(self.get_queryset())
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f"; charset={renderer.charset}"
+        response = StreamingHttpResponse(
+            renderer.render_chunks(
+                iter_recepies(queryset, self.RECEPIE_FIELDS)
+            ),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="recepies.{renderer.format}"'
+        )
+        return response
+
+    @action(methods=["POST", "PATCH", "DELETE"], detail=False)
+    def bulk(self, request):
+        """Create, update or delete many recepies in one transaction"""
+        if request.method == "DELETE":
+            return self.bulk_destroy(request)
+
+        instances = None
+        if request.method == "PATCH":
+            instances = list(self.get_queryset().filter(
+                id__in=self.get_bulk_ids(request.data)
+            ))
+        serializer = self.get_serializer(
+            instances,
+            data=request.data,
+            many=True,
+            partial=instances is not None,
+        )
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        recepies = serializer.save(user=request.user)
+        queryset = self.shape_queryset(
+            self.get_queryset().filter(
+                id__in=[recepie.pk for recepie in recepies]
+            ).order_by("id")
+        )
+        return Response(
+            RecepieSerializer(queryset, many=True).data,
+            status=status.HTTP_200_OK if instances is not None
+            else status.HTTP_201_CREATED
+        )
+
+    @staticmethod
+    def get_bulk_ids(data):
+        """Return the integer ids named by the items of a bulk request"""
+        if not isinstance(data, list):
+            return []
+        return [
+            item["id"] for item in data
+            if isinstance(item, dict) and isinstance(item.get("id"), int)
+        ]
+
+    def bulk_destroy(self, request):
+        """Delete the recepies listed in the request"""
+        serializer = serializers.RecepieBulkDeleteSerializer(
+            data=request.data
+        )
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data["ids"])
+        queryset = self.get_queryset().filter(id__in=ids)
+        missing = ids - set(queryset.values_list("id", flat=True))
+        if missing:
+            return Response(
+                {"ids": [
+                    BulkRecepieListSerializer.does_not_exist.format(
+                        pk_value=pk
+                    )
+                    for pk in sorted(missing)
+                ]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        with transaction.atomic():
+            with collection_changes_suppressed(request.user.pk):
+                queryset.delete()
+            collection_changed(request.user.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
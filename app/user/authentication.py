@@ -0,0 +1,273 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from core.asynchronous import database_sync_to_async
+
+
+def get_cache_settings() -> dict:
+    """Return the token cache settings merged over their defaults
+
+    Without a shared cache, invalidation cannot reach other processes, so
+    unless DEBUG is on entries live at most LOCAL_TTL seconds.
+    """
+    options = {
+        "MAXSIZE": 10000,
+        "TTL": 60,
+        "LOCAL_TTL": 5,
+        "CACHE_ALIAS": None,
+    }
+    options.update(getattr(settings, "TOKEN_AUTH_CACHE", {}))
+    if options["CACHE_ALIAS"] is None and not settings.DEBUG:
+        options["TTL"] = min(options["TTL"], options["LOCAL_TTL"])
+    return options
+
+
+class TokenCache:
+    """Cache token keys to the user and token they authenticate
+
+    Entries live in a process-local LRU with a TTL and, when a Django cache
+    alias is configured, in that shared cache so every worker benefits from
+    a lookup done by any of them. Only the user's pk and `is_active` flag
+    and the token's creation time are cached, and the user's other fields
+    are loaded when first read.
+
+    With a shared cache, entries also record the user's version there, and
+    `invalidate_user()` moves the user on to a new one, so every worker
+    drops the user's entries on their next request. Without one,
+    invalidation only reaches the current process, and other workers keep
+    authenticating with their entries until the TTL runs out, which is
+    why it is then capped at LOCAL_TTL.
+    """
+    key_prefix = "auth-token:"
+    version_prefix = "auth-user-version:"
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def options(self) -> dict:
+        return get_cache_settings()
+
+    @property
+    def shared(self):
+        alias = self.options["CACHE_ALIAS"]
+        return caches[alias] if alias else None
+
+    def get(self, key):
+        """Return the cached (user, token) for a key or None"""
+        cached = self.get_local(key)
+        if cached is not None:
+            return cached
+
+        entry = None
+        if self.shared is not None:
+            entry = self.shared.get(self.key_prefix + key)
+            if entry is not None and not self.is_current(entry):
+                entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._store_local(key, entry)
+        return build_credentials(key, entry)
+
+    def get_local(self, key):
+        """Return the (user, token) cached in this process for a key or None
+
+        Misses are not counted, as `get()` goes on to the shared cache.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                entry = entry[1]
+            else:
+                self._entries.pop(key, None)
+                return None
+        if not self.is_current(entry):
+            self.delete_local(key)
+            return None
+        with self._lock:
+            self.hits += 1
+        return build_credentials(key, entry)
+
+    def set(self, key, user, token):
+        """Cache the user and token a key authenticates"""
+        entry = (user.pk, user.is_active, token.created,
+                 self.get_version(user.pk))
+        self._store_local(key, entry)
+        if self.shared is not None:
+            self.shared.set(
+                self.key_prefix + key,
+                entry,
+                timeout=self.options["TTL"],
+            )
+
+    def _store_local(self, key, entry):
+        options = self.options
+        with self._lock:
+            self._entries[key] = (time.monotonic() + options["TTL"], entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > options["MAXSIZE"]:
+                self._entries.popitem(last=False)
+
+    def get_version(self, user_pk):
+        """Return the user's version in the shared cache, if any"""
+        if self.shared is None:
+            return None
+        return self.shared.get(f"{self.version_prefix}{user_pk}")
+
+    def is_current(self, entry) -> bool:
+        """Return whether an entry was cached at its user's version"""
+        if self.shared is None:
+            return True
+        return entry[3] == self.get_version(entry[0])
+
+    def invalidate_user(self, user_pk):
+        """Drop every cached entry of a user
+
+        Entries older than the TTL are gone anyway, so the new version
+        only has to outlive them.
+        """
+        with self._lock:
+            stale = [key for key, (expires, entry) in self._entries.items()
+                     if entry[0] == user_pk]
+            for key in stale:
+                del self._entries[key]
+        if self.shared is not None:
+            self.shared.set(
+                f"{self.version_prefix}{user_pk}",
+                uuid.uuid4().hex,
+                timeout=self.options["TTL"],
+            )
+
+    def delete_local(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete(self, key):
+        """Drop a token key from the local and shared caches"""
+        self.delete_local(key)
+        if self.shared is not None:
+            self.shared.delete(self.key_prefix + key)
+
+    def clear(self):
+        """Drop every local entry and reset the metrics"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Return hit and miss counts for the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+            }
+
+
+def build_credentials(key, entry):
+    """Return a new (user, token) pair for a cached entry
+
+    Fields that are not cached are deferred, so each request gets its own
+    instances and loads them only when it reads them.
+    """
+    user_pk, is_active, created = entry[:3]
+    user_model = get_user_model()
+    user = user_model.from_db(
+        None,
+        [user_model._meta.pk.attname, "is_active"],
+        [user_pk, is_active],
+    )
+    token = Token.from_db(
+        None,
+        ["key", "user_id", "created"],
+        [key, user_pk, created],
+    )
+    token.user = user
+    return user, token
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that caches the token to user lookup
+
+    Cached entries are dropped when their token is deleted or its user is
+    saved. Other workers only see that through a shared cache, see
+    TokenCache.
+    Credentials `authenticate_async()` found for the request are reused.
+    """
+
+    def authenticate(self, request):
+        credentials = getattr(request, "token_credentials", None)
+        if credentials is not None:
+            return credentials
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            if not cached[0].is_active:
+                raise exceptions.AuthenticationFailed(
+                    _("User inactive or deleted.")
+                )
+            return cached
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token)
+        return user, token
+
+
+class TokenKeyAuthentication(TokenAuthentication):
+    """Only read the token key from the Authorization header"""
+
+    def authenticate_credentials(self, key):
+        return key
+
+
+async def authenticate_async(request):
+    """Return the (user, token) a request's token header is for, or None
+
+    The async counterpart of CachedTokenAuthentication, for async views.
+    Tokens cached in this process are checked without leaving the event
+    loop unless that needs the shared cache, and others are looked up in
+    a worker thread. Raises AuthenticationFailed for bad tokens like it.
+    The credentials are kept on the request for the views it then calls.
+    """
+    key = TokenKeyAuthentication().authenticate(request)
+    if key is None:
+        return None
+    if token_cache.shared is None:
+        credentials = token_cache.get_local(key)
+    else:
+        credentials = await sync_to_async(
+            token_cache.get_local, thread_sensitive=False
+        )(key)
+    if credentials is None:
+        credentials = await database_sync_to_async(
+            CachedTokenAuthentication().authenticate_credentials
+        )(key)
+    request.token_credentials = credentials
+    return credentials
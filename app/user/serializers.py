@@ -3,8 +3,11 @@ from django.contrib.auth import authenticate, get_user_model
 from rest_framework import serializers
 from django.utils.translation import ugettext_lazy as _
 
+from core.instrumentation import InstrumentedSerializerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(InstrumentedSerializerMixin,
+                     serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ["email", "password", "name"]
@@ -29,7 +32,8 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class AuthTokenSerializer(serializers.Serializer):
+class AuthTokenSerializer(InstrumentedSerializerMixin,
+                          serializers.Serializer):
     email = serializers.CharField()
     password = serializers.CharField(
         style={"input_type": "password"},
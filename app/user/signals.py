@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Stop authenticating with a token once it is deleted"""
+    token_cache.delete(instance.key)
+    token_cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """Drop cached credentials of a user whenever the user changes"""
+    if created:
+        return
+    token_cache.invalidate_user(instance.pk)
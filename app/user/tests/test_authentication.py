@@ -0,0 +1,170 @@
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from ..authentication import token_cache
+
+ME_URL = reverse("user:me")
+
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "tokens": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "token-auth-tests",
+    },
+}
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test the cached token authentication backend"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            "cached@test.com",
+            "testpass@123",
+            name="Cached",
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def tearDown(self):
+        token_cache.clear()
+
+    def test_token_lookup_cached(self):
+        """Test only the first request looks the token up"""
+        self.client.get(ME_URL)
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["email"], self.user.email)
+        self.assertEqual(token_cache.stats()["hits"], 1)
+        self.assertEqual(token_cache.stats()["misses"], 1)
+
+    def test_invalid_token_rejected(self):
+        """Test an unknown token is not authenticated"""
+        self.client.credentials(HTTP_AUTHORIZATION="Token invalid")
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_invalidated(self):
+        """Test deleting a token stops it authenticating"""
+        self.client.get(ME_URL)
+        self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_invalidated(self):
+        """Test deactivating a user stops their token authenticating"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_updated_user_not_stale(self):
+        """Test changes to the user are seen on the next request"""
+        self.client.patch(ME_URL, {"name": "Renamed"})
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data["name"], "Renamed")
+
+    def test_entries_expire(self):
+        """Test cached entries are looked up again after the TTL"""
+        self.client.get(ME_URL)
+        with patch("time.monotonic", return_value=10 ** 9):
+            with self.assertNumQueries(1):
+                self.client.get(ME_URL)
+
+    def test_local_ttl_capped(self):
+        """Test entries only this process can invalidate expire quickly"""
+        self.client.get(ME_URL)
+        with patch("time.monotonic", return_value=time.monotonic() + 10):
+            with self.assertNumQueries(1):
+                self.client.get(ME_URL)
+
+        self.assertEqual(token_cache.stats()["misses"], 2)
+
+    @override_settings(TOKEN_AUTH_CACHE={"MAXSIZE": 1})
+    def test_least_recently_used_evicted(self):
+        """Test the local cache never grows past its maximum size"""
+        other = get_user_model().objects.create_user(
+            "other@test.com",
+            "testpass@123",
+        )
+        other_token = Token.objects.create(user=other)
+        self.client.get(ME_URL)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {other_token.key}")
+        self.client.get(ME_URL)
+
+        self.assertEqual(token_cache.stats()["size"], 1)
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    @override_settings(
+        CACHES=LOCMEM_CACHES,
+        TOKEN_AUTH_CACHE={"CACHE_ALIAS": "tokens"},
+    )
+    def test_shared_cache_used(self):
+        """Test lookups cached by another process are reused"""
+        self.client.get(ME_URL)
+        token_cache.clear()
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.stats()["hits"], 1)
+
+    @override_settings(
+        CACHES=LOCMEM_CACHES,
+        TOKEN_AUTH_CACHE={"CACHE_ALIAS": "tokens"},
+    )
+    def test_shared_cache_invalidated(self):
+        """Test deleting a token drops it from the shared cache"""
+        self.client.get(ME_URL)
+        self.token.delete()
+        token_cache.clear()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(
+        CACHES=LOCMEM_CACHES,
+        TOKEN_AUTH_CACHE={"CACHE_ALIAS": "tokens"},
+    )
+    def test_other_process_invalidated(self):
+        """Test deactivating a user reaches other processes' entries"""
+        self.client.get(ME_URL)
+        entries = token_cache._entries.copy()
+        self.user.is_active = False
+        self.user.save()
+        token_cache._entries.update(entries)
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(
+        CACHES=LOCMEM_CACHES,
+        TOKEN_AUTH_CACHE={"CACHE_ALIAS": "tokens"},
+    )
+    def test_shared_cache_only_keeps_ids(self):
+        """Test the shared cache never holds the user's other fields"""
+        self.client.get(ME_URL)
+        entry = caches["tokens"].get(f"auth-token:{self.token.key}")
+
+        self.assertEqual(entry[:2], (self.user.pk, True))
+        self.assertNotIn(self.user.password, repr(entry))
@@ -1,6 +1,7 @@
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
+from .authentication import CachedTokenAuthentication
 from .serializers import AuthTokenSerializer, UserSerializer
 
 
@@ -15,8 +16,13 @@ class CreateTokenView(ObtainAuthToken):
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):
-        return self.request.user
+        user = self.request.user
+        # Cached credentials only carry the user's pk and is_active flag
+        deferred = user.get_deferred_fields()
+        if deferred:
+            user.refresh_from_db(fields=deferred)
+        return user